@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+
+''' A compressed cold archive for completed subtrees of a Project tree.
+
+Usage: python3 archive.py list [name] [path]
+       python3 archive.py archive 'dd/Mmm/yyyy - hh:mm'|all [name] [path]
+       python3 archive.py restore parent sub_project [name] [path]
+
+'''
+
+import json, os, sys, zipfile
+from datetime import datetime
+from uuid import uuid4
+import codec
+
+
+class Archive(object):
+    ''' A zip archive of the completed subtrees moved out of a Project tree.
+
+    Archived subtrees are stored compressed in a hidden file in the root's
+        directory, each under a unique key (rather than its path, so renaming
+        or moving its ancestors doesn't lose it), with a small summary entry
+        each. The zip's central directory indexes the subtrees, so a single
+        one can be read back without touching the others.
+
+    Archiving leaves only the subtree's name and key in its parent's
+        'archived' entries, so it is no longer loaded, displayed, or walked by
+        saves. Archived
+        subtrees are only loaded again when restored. The siblings which had
+        the subtree as a precursor lose it while it's archived, and are
+        listed in its summary so restoring it makes it their precursor again.
+
+    e.g.
+        archive = Archive(main_project)
+        archive.archive_completed(before=datetime(2030, 1, 1))
+        ...
+        archive.restore(parent, 'old project')
+
+    '''
+    FILENAME = '.archive.zip'
+    SUMMARY  = '.summary' # suffix of a subtree's summary entry
+
+    def __init__(self, root):
+        ''' Create an archive for the tree with root Project 'root'. '''
+        self.root = root
+        self.filename = os.path.join(root.path, self.FILENAME)
+
+    def _path(self, parent, name):
+        ''' Return the path of 'parent's sub-project 'name', relative to the
+            root's.
+        '''
+        path = os.path.relpath(parent._sub_project_path + '/' + name,
+                               self.root.path)
+        return path.replace(os.sep, '/')
+
+    @staticmethod
+    def _summaries(project):
+        ''' Return a dictionary of id(Project) -> (fully complete, latest
+            completion date, number of Projects) for 'project's subtree.
+        '''
+        summaries = {}
+        stack = [(project, False)]
+        while stack:
+            current, children_done = stack.pop()
+            if not children_done:
+                stack.append((current, True))
+                stack.extend((sub_project, False) for sub_project
+                             in current.sub_projects.values())
+                continue
+            complete = current.complete
+            latest = current.completion_date
+            count = 1
+            for sub_project in current.sub_projects.values():
+                sub_complete, sub_latest, sub_count = \
+                        summaries[id(sub_project)]
+                complete = complete and sub_complete
+                if sub_latest and (latest is None or sub_latest > latest):
+                    latest = sub_latest
+                count += sub_count
+            summaries[id(current)] = (complete, latest, count)
+        return summaries
+
+    def archive(self, project, summary=None):
+        ''' Move 'project's completed subtree into the archive.
+
+        Raises a ValueError if 'project' is the root, if it or any of its
+            sub-projects are incomplete, or if its subtree is (part of) the
+            template of any instances outside it.
+
+        '''
+        parent = project._parent
+        if parent is None:
+            raise ValueError('Cannot archive a root Project')
+        complete, latest, count = summary or \
+                self._summaries(project)[id(project)]
+        if not complete:
+            raise ValueError('{} has incomplete work'.format(project.name))
+        project._check_not_template(removed=True)
+
+        # (the summary loaded the subtree) an instance's records inherited
+        #   from its template are archived as its own
+        project.save(force=project._template is not None)
+        successors = [sibling.name for sibling in parent.sub_projects.values()
+                      if project.name in sibling.precursors]
+        key = uuid4().hex
+        with zipfile.ZipFile(self.filename, 'a', zipfile.ZIP_DEFLATED) as \
+                archive:
+            for path in self._subtree_files(project):
+                # e.g. 'name.txt' -> 'key.txt', 'name/sub.txt' -> 'key/sub.txt'
+                member = os.path.relpath(path, parent._sub_project_path)
+                archive.write(path, key + member[len(project.name):]
+                                          .replace(os.sep, '/'))
+            archive.writestr(key + self.SUMMARY, json.dumps(dict(
+                name            = project.name,
+                projects        = count,
+                completion_date = latest and codec.format_datetime(latest),
+                archived        = codec.format_datetime(datetime.today()),
+                successors      = successors,
+            )))
+
+        # only remove the live files once the archive is written
+        with parent.batch():
+            parent._archive_sub_project(project, key)
+            parent.save()
+
+    @staticmethod
+    def _subtree_files(project):
+        ''' Yield the paths of the record files of 'project's subtree. '''
+        yield project._save_file
+        for directory, directories, files in os.walk(
+                project._sub_project_path):
+            directories[:] = [name for name in directories
+                              if not name.startswith('.')]
+            for name in files:
+                if name.endswith(codec.EXTENSION) and \
+                   not name.startswith('.'):
+                    yield os.path.join(directory, name)
+
+    def archive_completed(self, before=None):
+        ''' Archive every fully completed subtree finished before 'before'.
+
+        Subtrees are archived whole, from the highest fully completed Project
+            down. Subtrees without completion dates are only archived if
+            'before' is None, which archives all completed subtrees. Subtrees
+            which are (part of) the templates of instances are kept.
+
+        Returns the list of archived Projects.
+
+        '''
+        summaries = self._summaries(self.root)
+        instances = self.root._instances()
+        archived = []
+        remaining = list(self.root.sub_projects.values())
+        while remaining:
+            project = remaining.pop()
+            complete, latest, count = summaries[id(project)]
+            if complete and (before is None or
+                             (latest is not None and latest < before)):
+                if not project._template_instances(True, instances):
+                    archived.append(project)
+            else:
+                remaining.extend(project.sub_projects.values())
+        for project in archived:
+            self.archive(project, summaries[id(project)])
+        return archived
+
+    def _member_names(self, key):
+        ''' Return the names of the archive members of 'key's subtree. '''
+        if not os.path.isfile(self.filename):
+            return []
+        with zipfile.ZipFile(self.filename) as archive:
+            return [name for name in archive.namelist()
+                    if name in (key + codec.EXTENSION, key + self.SUMMARY)
+                    or name.startswith(key + '/')]
+
+    def _remove_members(self, key):
+        ''' Rewrite the archive without 'key's subtree, if present. '''
+        members = set(self._member_names(key))
+        if not members:
+            return
+        temporary = self.filename + '.tmp'
+        with zipfile.ZipFile(self.filename) as archive, \
+             zipfile.ZipFile(temporary, 'w', zipfile.ZIP_DEFLATED) as output:
+            for info in archive.infolist():
+                if info.filename not in members:
+                    output.writestr(info, archive.read(info))
+        os.replace(temporary, self.filename)
+
+    def restore(self, parent, name):
+        ''' Restore the archived sub-project 'name' of 'parent' to the tree.
+
+        Returns the restored Project, made a precursor again of the
+            siblings which had it as one when it was archived (if still live).
+
+        Raises a KeyError if 'parent' has no archived sub-project 'name', and
+            a ValueError if it already has a live sub-project called 'name'.
+
+        '''
+        if name not in parent.archived:
+            raise KeyError(name)
+        if name in parent.sub_projects:
+            raise ValueError('{} already has a sub-project called {}'
+                             .format(parent.name, name))
+        key = parent.archived[name]
+        members = [member for member in self._member_names(key)
+                   if not member.endswith(self.SUMMARY)]
+        with zipfile.ZipFile(self.filename) as archive:
+            for member in members:
+                # wherever the parent is now
+                path = os.path.join(parent._sub_project_path,
+                                    name + member[len(key):])
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as output:
+                    output.write(archive.read(member))
+            summary = json.loads(archive.read(key + self.SUMMARY).decode())
+
+        with parent.batch():
+            project = parent._unarchive_sub_project(name)
+            for successor in summary['successors']:
+                if successor in parent.sub_projects:
+                    parent.sub_projects[successor].add_precursor(project)
+            parent.save()
+        self._remove_members(key)
+        return project
+
+    def entries(self, parent=None):
+        ''' Return a list of the summary dictionaries of archived subtrees,
+            optionally only those of 'parent'.
+
+        Each summary has the subtree's 'name', its archive 'key', its current
+            'path' relative to the root's (None if its parent is itself
+            archived), and the number of 'projects', latest 'completion_date'
+            and date 'archived'.
+
+        '''
+        if not os.path.isfile(self.filename):
+            return []
+        paths = {} # key -> path, of the subtrees archived from live parents
+        remaining = [parent or self.root]
+        while remaining:
+            project = remaining.pop()
+            for name, key in project.archived.items():
+                paths[key] = self._path(project, name)
+            if parent is None:
+                remaining.extend(project.sub_projects.values())
+        entries = []
+        with zipfile.ZipFile(self.filename) as archive:
+            for member in archive.namelist():
+                if not member.endswith(self.SUMMARY):
+                    continue
+                key = member[:-len(self.SUMMARY)]
+                if parent is not None and key not in paths:
+                    continue
+                entry = json.loads(archive.read(member).decode())
+                entry['key'] = key
+                entry['path'] = paths.get(key)
+                entries.append(entry)
+        return entries
+
+
+def _find(root, name):
+    ''' Return the Project called 'name' in 'root's tree. '''
+    remaining = [root]
+    while remaining:
+        project = remaining.pop()
+        if project.name == name:
+            return project
+        remaining.extend(project.sub_projects.values())
+    raise KeyError(name)
+
+
+def main(args):
+    ''' Run the archive command specified by command line 'args'. '''
+    if not args or args[0] not in ('list', 'archive', 'restore'):
+        print(__doc__)
+        return
+
+    from project import Project
+    command = args.pop(0)
+    if command == 'list':
+        operands = []
+    elif command == 'archive':
+        operands = args[:1]
+    else:
+        operands = args[:2]
+    args = args[len(operands):]
+    name = args[0] if args else '_main'
+    path = args[1] if len(args) > 1 else 'projects'
+    archive = Archive(Project(name, path=path))
+
+    if command == 'list':
+        for entry in archive.entries():
+            print('{}: {projects} project(s), completed {completion_date}'
+                  ', archived {archived}'.format(entry['path'] or entry['key'],
+                                                 **entry))
+    elif command == 'archive':
+        before = None
+        if operands[0] != 'all':
+            before = codec.parse_datetime(operands[0])
+        for project in archive.archive_completed(before):
+            print('archived', project.name)
+    else:
+        parent_name, sub_project = operands
+        archive.restore(_find(archive.root, parent_name), sub_project)
+        print('restored', sub_project)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
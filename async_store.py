@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+import asyncio, os
+from functools import partial
+from batch import Batch
+from project import Project, ConflictError
+import codec
+
+
+class AsyncProjectStore(object):
+    ''' An asyncio facade over a Project tree.
+
+    Disk work (loading, creating, removing and saving Projects) is run in an
+        executor so it doesn't block the event loop, with at most
+        'max_concurrency' file operations in flight at once. Concurrent saves
+        of the same Project are merged, so a burst of save requests results
+        in at most one save running and one more queued behind it.
+
+    The Projects are the same objects used by the synchronous API, so they
+        can be read and modified directly from the event loop thread. The tree
+        is only ever read or modified on that thread: the records creating
+        or getting Projects loads are read ahead in the executor, then the
+        tree is modified on the event loop thread in a Batch whose disk
+        changes are committed in the executor, and saves serialise records
+        and sidecars there, only passing filenames and data to the executor
+        to write. As with Project.save, saving raises a ConflictError for any
+        Projects changed on disk by another process.
+
+    e.g.
+        store = await AsyncProjectStore.open('projects')
+        project = await store.get('my project')
+        project.update_details('Some new details')
+        await project.asave()
+
+    '''
+    MAX_CONCURRENCY = 8
+
+    def __init__(self, root, executor=None, max_concurrency=MAX_CONCURRENCY):
+        ''' Create a store for the tree with root Project 'root'.
+
+        'executor' is a concurrent.futures Executor to run disk work in, or
+            None to use the event loop's default executor.
+        'max_concurrency' is the maximum number of concurrent file operations.
+
+        '''
+        self.root     = root
+        self._executor = executor
+        self._max_concurrency = max_concurrency
+        self._limiter = None # created on first use, within the event loop
+        self._running = {}   # id(project) -> running save task
+        self._queued  = {}   # id(project) -> [queued save task, force]
+        root._store   = self
+
+    @classmethod
+    async def open(cls, path='projects', name='_main', **kwargs):
+        ''' Load the Project tree 'name' at 'path', and return its store.
+
+        **kwargs are passed to the AsyncProjectStore constructor.
+
+        '''
+        executor = kwargs.get('executor', None)
+        loop = asyncio.get_running_loop()
+        root = await loop.run_in_executor(executor,
+                                          partial(Project, name, path=path))
+        return cls(root, **kwargs)
+
+    @classmethod
+    def for_project(cls, project):
+        ''' Return the store of 'project's tree, creating one if necessary. '''
+        root = project._get_root()
+        return root._store or cls(root)
+
+    async def _run(self, func, *args, **kwargs):
+        ''' Run func(*args, **kwargs) in the executor, limiting concurrency. '''
+        if self._limiter is None:
+            self._limiter = asyncio.Semaphore(self._max_concurrency)
+        async with self._limiter:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor,
+                                              partial(func, *args, **kwargs))
+
+    async def get(self, name):
+        ''' Return the Project called 'name' in the tree.
+
+        Raises a KeyError if there is no such Project.
+
+        '''
+        if name == self.root.name:
+            return self.root
+        level = [self.root]
+        while level:
+            next_level = []
+            for project in level:
+                if '_pending' in project.__dict__:
+                    # an instance's sub-projects are loaded when first used
+                    await self._modify(project._read_ahead_files(
+                            project._pending), getattr, project,
+                            'sub_projects')
+                if name in project.sub_projects:
+                    return project.sub_projects[name]
+                next_level.extend(project.sub_projects.values())
+            level = next_level
+            await asyncio.sleep(0) # allow other tasks to run between levels
+        raise KeyError('{} is not a known Project.'.format(name))
+
+    async def _modify(self, reads, func, *args, **kwargs):
+        ''' Call func(*args, **kwargs) to modify the tree on the event loop
+            thread, deferring its disk changes to a Batch committed in the
+            executor, and return its result.
+
+        'reads' are the (records, templates, directories) func starts by
+            reading, as from Project._read_ahead_files, which are read in the
+            executor first. If the commit fails before applying anything, the
+            modification is rolled back. Joins a Batch already open on the
+            tree instead.
+
+        '''
+        if self.root._batch is not None:
+            return func(*args, **kwargs)
+        records, directories = await self._run(_read_ahead, *reads)
+        batch = Batch(self.root, deferred=True)
+        with batch:
+            batch.preload(records, directories)
+            result = func(*args, **kwargs)
+        try:
+            await self._run(batch.commit)
+        except:
+            batch.rollback() # a no-op if the commit was journaled
+            raise
+        return result
+
+    async def create(self, parent, name, **kwargs):
+        ''' Create, save and return a new sub-project 'name' of 'parent'. '''
+        project = await self._modify(parent._read_ahead_files([name]),
+                                     parent.create_sub_project, name,
+                                     **kwargs)
+        await self.save(parent)
+        return project
+
+    async def remove(self, parent, sub_project):
+        ''' Remove 'sub_project' from 'parent', deleting its files. '''
+        await self._modify(([], [], []), parent.remove_sub_project,
+                           sub_project)
+        await self.save(parent)
+
+    async def save(self, project=None, force=False):
+        ''' Save 'project' (or the root) and its sub-projects.
+
+        If a save of 'project' is already queued, this joins it instead of
+            queueing another.
+
+        '''
+        project = project or self.root
+        if self.root._batch is not None:
+            # deferred to the open batch, so nothing is written
+            return project.save(force)
+        key = id(project)
+        if key in self._queued:
+            queued = self._queued[key]
+            queued[1] = queued[1] or force
+            return await asyncio.shield(queued[0])
+
+        task = asyncio.ensure_future(self._save_after(project,
+                                                      self._running.get(key)))
+        self._queued[key] = [task, force]
+        return await asyncio.shield(task)
+
+    async def _save_after(self, project, previous):
+        ''' Save 'project' once the 'previous' save task has finished. '''
+        key = id(project)
+        if previous:
+            await asyncio.wait([previous])
+        force = self._queued.pop(key)[1]
+        self._running[key] = asyncio.current_task()
+        try:
+            # serialise on the event loop thread, then write in the executor
+            saves = project._collect_saves(force)
+            results = await asyncio.gather(*[
+                    self._run(Project._store_record, filename, data,
+                              saved._disk_stat, saved._version - 1)
+                    for saved, filename, data in saves],
+                    return_exceptions=True)
+            failed = []
+            for (saved, filename, data), result in zip(saves, results):
+                if isinstance(result, Exception):
+                    failed.append((saved, result))
+                elif result is None:
+                    failed.append((saved, ConflictError([saved])))
+                else:
+                    saved._disk_stat = result
+                    saved._saved_hash = saved._hash_record(data)
+            for saved, error in failed:
+                saved._mark_unsaved()
+            if saves:
+                # computed from the tree here, then written once the records
+                #   are, so they're stamped for the records as saved
+                sidecars = project._sidecars(
+                        [saved for saved, filename, data in saves])
+                await self._run(Project._store_sidecars, sidecars)
+            errors = [error for saved, error in failed
+                      if not isinstance(error, ConflictError)]
+            if errors:
+                raise errors[0]
+            if failed:
+                raise ConflictError([saved for saved, error in failed])
+        finally:
+            if self._running.get(key) is asyncio.current_task():
+                del self._running[key]
+
+
+def _read_ahead(records, templates, directories):
+    ''' Read the 'records' and 'templates' files and check the 'directories'
+        exist, following the sub-projects of 'records' which aren't instances
+        (as loading them would), for Batch.preload.
+
+    Returns dictionaries of filename -> (stat, contents), or None if absent,
+        and of directory -> True if it exists. Only the disk is used, so this
+        can run in the executor.
+
+    '''
+    read = {}
+    read_dirs = {directory: os.path.isdir(directory)
+                 for directory in directories}
+    pending = [(filename, True) for filename in records] + \
+              [(filename, False) for filename in templates]
+    while pending:
+        filename, follow = pending.pop()
+        try:
+            with open(filename) as record_file:
+                stat = os.fstat(record_file.fileno())
+                contents = record_file.read()
+        except FileNotFoundError:
+            read[filename] = None
+            continue
+        read[filename] = ((stat.st_mtime_ns, stat.st_size, stat.st_ino),
+                          contents)
+        record = codec.parse_record(contents) if follow else {}
+        if record.get('sub_projects') and not record.get('template'):
+            directory = filename[:-len(codec.EXTENSION)]
+            read_dirs[directory] = os.path.isdir(directory)
+            pending.extend((directory + '/' + name + codec.EXTENSION, True)
+                           for name in record['sub_projects'])
+    return read, read_dirs
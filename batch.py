@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+
+import os, json, shutil
+from locking import FileLock
+
+
+class Batch(object):
+    ''' A transaction deferring the disk changes of a Project tree.
+
+    While a Batch is open, file writes, renames, directory creations and
+        deletions requested by Projects in the tree are recorded instead of
+        applied. On a clean exit they are flushed to disk in order, with all
+        written contents staged beforehand so a failure while writing leaves
+        the existing files untouched. If an exception escapes the block, the
+        recorded operations are discarded and every Project modified during
+        the batch is restored to its state from before the batch.
+
+    Once everything is staged, a journal of the operations is written before
+        any is applied, so a commit interrupted part way (e.g. by a crash) is
+        completed by Batch.recover when the tree is next opened, rather than
+        left partly applied. A commit interrupted before its journal was
+        written has applied nothing, and its staging is discarded.
+
+    Batches are created with Project.batch(), and nest by joining the
+        outermost open batch of the tree.
+
+    '''
+    STAGING_DIR = '.batch'
+    JOURNAL     = 'journal'  # in the staging directory, once all is staged
+    PROGRESS    = 'progress' # number of journaled operations applied
+
+    def __init__(self, root, deferred=False):
+        ''' Create a batch for the tree with root Project 'root'.
+
+        If 'deferred', a clean exit leaves the pending changes to be applied
+            by calling commit later (e.g. from another thread), or discarded
+            by rollback, instead of committing them.
+
+        '''
+        self._root     = root
+        self._deferred = deferred
+        self._nested   = False
+
+    def __enter__(self):
+        if self._root._batch is not None:
+            # join the already open batch
+            self._nested = True
+            return self._root._batch
+
+        self._ops         = []  # ordered (operation, *args) tuples
+        self._files       = {}  # file path -> pending contents
+        self._dirs        = set() # directories containing pending files
+        self._write_index = {}  # file path -> index of coalescable write op
+        # pending record path -> (project, disk path, disk stat, version) as
+        #   checked when first written, re-checked when committed
+        self._records     = {}
+        self._sidecars    = {}  # file path -> [update, updates, names, stamp]
+        self._moves       = []  # (old, new) path pairs, new is None if removed
+        self._read        = {}  # disk path -> (stat, contents) read ahead,
+                                #   or None if absent
+        self._read_dirs   = {}  # disk path -> True if a directory, read ahead
+        self._states      = {}  # id(project) -> (project, original state)
+        self._root._batch = self
+        type(self._root)._open_batches += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._nested:
+            return False
+        try:
+            if exc_type is None:
+                if not self._deferred:
+                    try:
+                        self.commit()
+                    except:
+                        self.rollback() # a no-op if the commit was journaled
+                        raise
+            else:
+                self.rollback()
+        finally:
+            self._root._batch = None
+            type(self._root)._open_batches -= 1
+        return False
+
+    def record(self, project):
+        ''' Record the in-memory state of 'project' before it is modified. '''
+        key = id(project)
+        if key not in self._states:
+            state = project.__dict__.copy()
+            for name in ('sub_projects', 'precursors', 'archived'):
+                if name in state:
+                    state[name] = state[name].copy()
+            self._states[key] = (project, state)
+
+    def rollback(self):
+        ''' Discard pending disk changes and restore the recorded states. '''
+        for project, state in self._states.values():
+            project.__dict__.clear()
+            project.__dict__.update(state)
+        for project, state in self._states.values():
+            # ancestors may have summarised the rolled back state
+            project._invalidate_subtree_state(all_ancestors=True)
+            if project._search_indexes:
+                project._report_change()
+        self._root._structure_changed()
+        self._reset()
+
+    def commit(self):
+        ''' Apply all pending disk changes in one ordered flush, journaled so
+            an interrupted commit is completed by recover.
+
+        Raises a ConflictError, applying nothing, if any record written in the
+            batch has been changed by another process since it was checked.
+
+        '''
+        sidecars = self._sidecars
+        if self._ops:
+            self._flush()
+        self._reset()
+        # last, stamped for the records as applied (if interrupted first,
+        #   they're just out of date)
+        for filename, (update, updates, names, stamp) in sidecars.items():
+            update(filename, updates, names, stamp)
+
+    def _flush(self):
+        ''' Stage, journal and apply the pending operations, holding the
+            tree's lock and those of the written records' directories.
+        '''
+        staging = os.path.join(self._root.path, self.STAGING_DIR)
+        journaled = False
+        # (the tree's own directory is already locked)
+        locks = [FileLock(directory) for directory in sorted(
+                {os.path.dirname(record[1]) or '.'
+                 for record in self._records.values()} - {self._root.path})
+                 if os.path.isdir(directory)]
+        try:
+            with FileLock(self._root.path):
+                for lock in locks:
+                    lock.acquire()
+                self._check_records()
+                # write out all contents first, so nothing is applied on
+                #   failure
+                os.makedirs(staging, exist_ok=True)
+                journal = []
+                for index, op in enumerate(self._ops):
+                    if op[0] == 'write':
+                        self._write_durably(os.path.join(staging, str(index)),
+                                            op[2])
+                        journal.append(['write', op[1], str(index)])
+                    else:
+                        journal.append(list(op))
+                # from here on, the commit is completed even if interrupted
+                self._write_durably(os.path.join(staging, self.JOURNAL),
+                                    json.dumps(journal))
+                journaled = True
+                self._apply(staging, journal)
+                shutil.rmtree(staging, ignore_errors=True)
+        except:
+            if journaled:
+                self._reset() # left for recover to complete
+            else:
+                # nothing was applied, so it can still be rolled back
+                shutil.rmtree(staging, ignore_errors=True)
+            raise
+        finally:
+            for lock in locks:
+                lock.release()
+
+    def _check_records(self):
+        ''' Raise a ConflictError if any record written in the batch has been
+            changed on disk since it was checked, as Project._write_record
+            does.
+        '''
+        from project import ConflictError
+        conflicts = [project for project, disk_path, disk_stat, version
+                     in self._records.values()
+                     if not project._is_current_on_disk(disk_path, disk_stat,
+                                                        version)]
+        if conflicts:
+            raise ConflictError(conflicts)
+
+    @classmethod
+    def recover(cls, path):
+        ''' Complete the commit of a Batch interrupted in the tree saved in
+            'path', or discard its staging if it wasn't journaled yet.
+
+        Returns True if an interrupted commit was completed.
+
+        '''
+        staging = os.path.join(path, cls.STAGING_DIR)
+        if not os.path.isdir(staging):
+            return False
+        # waits for any commit still in progress
+        with FileLock(path):
+            try:
+                with open(os.path.join(staging, cls.JOURNAL)) as journal_file:
+                    journal = json.load(journal_file)
+            except (FileNotFoundError, ValueError):
+                journal = None # interrupted while staging, or finished
+            if journal is not None:
+                cls._apply(staging, journal)
+            shutil.rmtree(staging, ignore_errors=True)
+        return journal is not None
+
+    @classmethod
+    def _apply(cls, staging, journal):
+        ''' Apply the 'journal' of operations staged in 'staging', from the
+            first not yet applied.
+
+        Writes are applied once (their staged files are moved into place),
+            and progress is recorded after each move or removal, so replaying
+            a partly applied journal doesn't repeat them.
+
+        '''
+        progress = os.path.join(staging, cls.PROGRESS)
+        try:
+            with open(progress) as progress_file:
+                start = int(progress_file.read())
+        except (FileNotFoundError, ValueError):
+            start = 0
+        for index in range(start, len(journal)):
+            op = journal[index]
+            operation, path = op[:2]
+            if operation == 'write':
+                staged = os.path.join(staging, op[2])
+                if os.path.exists(staged): # otherwise already applied
+                    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                    os.replace(staged, path)
+            elif operation == 'mkdir':
+                os.makedirs(path, exist_ok=True)
+            elif operation == 'move':
+                if os.path.exists(path):
+                    os.rename(path, op[2])
+            elif os.path.isdir(path): # operation == 'remove'
+                shutil.rmtree(path)
+            elif os.path.isfile(path):
+                os.remove(path)
+            if operation in ('move', 'remove'):
+                cls._write_durably(progress, str(index + 1))
+
+    @staticmethod
+    def _write_durably(filename, data):
+        ''' Atomically write 'data' to 'filename', flushed to disk. '''
+        temp_file = filename + '.tmp'
+        with open(temp_file, 'w') as output:
+            output.write(data)
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(temp_file, filename)
+
+    def _reset(self):
+        ''' Forget all pending operations and recorded states. '''
+        self._ops = []
+        self._files = {}
+        self._dirs = set()
+        self._write_index = {}
+        self._records = {}
+        self._sidecars = {}
+        self._moves = []
+        self._read = {}
+        self._read_dirs = {}
+        self._states = {}
+
+    @staticmethod
+    def _under(path, directory):
+        ''' Returns True if 'path' is 'directory' or inside it. '''
+        return path == directory or path.startswith(directory + '/')
+
+    def _disk_path(self, path):
+        ''' Return where 'path' currently is on disk, or None if removed. '''
+        for old, new in reversed(self._moves):
+            if new is not None and self._under(path, new):
+                path = old + path[len(new):]
+            elif self._under(path, old):
+                return None # moved away or removed in this batch
+        return path
+
+    def preload(self, records, directories):
+        ''' Use 'records' (disk path -> (stat, contents), or None if absent)
+            and 'directories' (disk path -> True if a directory), read ahead
+            e.g. in another thread, instead of reading the disk for them.
+        '''
+        self._read.update(records)
+        self._read_dirs.update(directories)
+
+    def read(self, filename):
+        ''' Return the pending or on-disk contents of 'filename'. '''
+        if filename in self._files:
+            return self._files[filename]
+        disk_path = self._disk_path(filename) or filename
+        if self._read.get(disk_path):
+            return self._read[disk_path][1]
+        with open(disk_path) as file:
+            return file.read()
+
+    def stat(self, filename):
+        ''' Return the stat of 'filename' if it was read ahead and isn't
+            pending, otherwise None.
+        '''
+        if filename not in self._files:
+            record = self._read.get(self._disk_path(filename))
+            if record:
+                return record[0]
+
+    def isfile(self, filename):
+        ''' Returns True if 'filename' will be a file after the batch. '''
+        if filename in self._files:
+            return True
+        disk_path = self._disk_path(filename)
+        if disk_path in self._read:
+            return self._read[disk_path] is not None
+        return disk_path is not None and os.path.isfile(disk_path)
+
+    def isdir(self, dirname):
+        ''' Returns True if 'dirname' will be a directory after the batch. '''
+        if dirname in self._dirs:
+            return True
+        disk_path = self._disk_path(dirname)
+        if disk_path in self._read_dirs:
+            return self._read_dirs[disk_path]
+        return disk_path is not None and os.path.isdir(disk_path)
+
+    def write(self, filename, data):
+        ''' Defer writing 'data' to 'filename'. '''
+        self._files[filename] = data
+        self._add_dirs(filename)
+        if filename in self._write_index:
+            # no structural changes since, so overwrite the pending write
+            self._ops[self._write_index[filename]] = ('write', filename, data)
+        else:
+            self._write_index[filename] = len(self._ops)
+            self._ops.append(('write', filename, data))
+
+    def write_record(self, project, filename, data):
+        ''' Defer writing 'project's record 'data' to 'filename', once
+            Project._is_current has checked it, recording what was checked so
+            it can be re-checked when the batch is committed.
+        '''
+        if filename not in self._records:
+            disk_path = self._disk_path(filename)
+            if disk_path is not None: # else replaces a file of this batch
+                self._records[filename] = (project, disk_path,
+                                           project._disk_stat,
+                                           project._version - 1)
+        self.write(filename, data)
+
+    def update_stamped(self, update, filename, updates, names=None,
+                       stamp=()):
+        ''' Defer update(filename, updates, names, stamp) of a stamped sidecar
+            (e.g. merkle.update_sidecar) until the batch is committed, as its
+            stamps are of the records as applied. Updates of the same sidecar
+            are combined.
+        '''
+        if filename in self._sidecars:
+            pending = self._sidecars[filename]
+            pending[1].update(updates)
+            if names is not None:
+                pending[2] = names
+            pending[3] = pending[3] | set(stamp)
+        else:
+            self._sidecars[filename] = [update, dict(updates), names,
+                                        set(stamp)]
+
+    def makedirs(self, dirname):
+        ''' Defer creating 'dirname' and any intermediate directories. '''
+        self._ops.append(('mkdir', dirname))
+
+    def move(self, old, new):
+        ''' Defer renaming the file or directory at 'old' to 'new'. '''
+        self._ops.append(('move', old, new))
+        self._moves.append((old, new))
+        self._relocate_files(old, new)
+
+    def remove(self, path):
+        ''' Defer removing the file or directory tree at 'path'. '''
+        self._ops.append(('remove', path))
+        self._moves.append((path, None))
+        self._relocate_files(path, None)
+
+    def _relocate_files(self, old, new):
+        ''' Move the pending file contents under 'old' to under 'new'. '''
+        self._write_index = {}
+        for path in [path for path in self._files if self._under(path, old)]:
+            contents = self._files.pop(path)
+            record = self._records.pop(path, None)
+            if new is not None:
+                self._files[new + path[len(old):]] = contents
+                if record is not None:
+                    self._records[new + path[len(old):]] = record
+        self._dirs = set()
+        for path in self._files:
+            self._add_dirs(path)
+
+    def _add_dirs(self, path):
+        ''' Record the directories containing 'path' as pending. '''
+        dirname = os.path.dirname(path)
+        while dirname and dirname not in self._dirs:
+            self._dirs.add(dirname)
+            dirname = os.path.dirname(dirname)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+''' Benchmark the memory footprint of loaded and displayed Project trees.
+
+Builds synthetic trees of each size, then uses tracemalloc to measure the
+    bytes allocated (and still alive) per Project when a tree is loaded, and
+    per ProjectView when it is displayed (if Tk can open a display, e.g.
+    under xvfb-run). The largest allocating source lines are listed for each,
+    and the exit status is 1 if the bytes per node of any tree exceed the
+    thresholds, so memory regressions fail. ProjectViews are only checked
+    once a baseline of them is recorded (or given with --max-view), with a
+    warning until then.
+
+Only Python allocations are traced, so the Tcl/Tk side of each widget isn't
+    included in the bytes per ProjectView.
+
+Usage: python3 bench_memory.py [size ...] [--max-project BYTES]
+           [--max-view BYTES] [--top N]
+
+'''
+
+import gc, sys, tempfile, tracemalloc
+from bench_writes import build_tree
+from project import Project
+
+SIZES       = (100, 1000, 5000)
+# the largest bytes per loaded Project over SIZES in a baseline run (CPython
+#   3.11, headless), and the growth over it treated as a regression
+BASELINE_PROJECT = 1167
+TOLERANCE   = 0.25
+MAX_PROJECT = round(BASELINE_PROJECT * (1 + TOLERANCE))
+# no baseline of displayed ProjectViews has been recorded yet (it needs a
+#   display, e.g. xvfb-run), so they're only checked against --max-view
+#   until one is; re-record both with --top 0 and update them when memory
+#   use changes intentionally
+BASELINE_VIEW = None
+MAX_VIEW    = BASELINE_VIEW and round(BASELINE_VIEW * (1 + TOLERANCE))
+TOP         = 10 # source lines listed per measurement
+
+# allocations made by tracemalloc itself
+FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+
+def measure(func, *args):
+    ''' Call 'func' with 'args', and return its result with the tracemalloc
+        statistics (by source line) of the memory allocated and still alive.
+    '''
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(FILTERS)
+        result = func(*args)
+        gc.collect()
+        after = tracemalloc.take_snapshot().filter_traces(FILTERS)
+    finally:
+        tracemalloc.stop()
+    return result, after.compare_to(before, 'lineno')
+
+
+def measure_projects(path):
+    ''' Load the tree saved at 'path', returning (root Project, number of
+        Projects, bytes per Project, statistics).
+    '''
+    root, statistics = measure(Project, '_main', path)
+    num_projects = sum(1 for project in _walk(root))
+    return root, num_projects, _total(statistics) / num_projects, statistics
+
+
+def measure_views(root):
+    ''' Display the tree of 'root' in nested ProjectsDisplays, returning
+        (number of ProjectViews, bytes per ProjectView, statistics), or None if
+        Tk can't open a display.
+    '''
+    import tkinter as tk
+    from gui_elements import (ProjectsDisplay, FOCUS_BIND, RESTORE_BIND,
+                              SCROLL_BIND)
+    try:
+        window = tk.Tk()
+    except tk.TclError:
+        return None # headless without a virtual display
+    window.withdraw()
+    bindings = {
+        FOCUS_BIND: lambda view: None,
+        RESTORE_BIND: lambda event: None,
+        SCROLL_BIND: lambda event: None,
+    }
+    try:
+        display, statistics = measure(ProjectsDisplay, window,
+                root.sub_projects.values(), bindings)
+        num_views = sum(1 for project in _walk(root)) - 1
+        return num_views, _total(statistics) / num_views, statistics
+    finally:
+        window.destroy()
+
+
+def _walk(root):
+    ''' Yield every Project of the tree of 'root'. '''
+    remaining = [root]
+    while remaining:
+        project = remaining.pop()
+        yield project
+        remaining.extend(project.sub_projects.values())
+
+
+def _total(statistics):
+    ''' Return the total bytes still allocated in 'statistics'. '''
+    return sum(statistic.size_diff for statistic in statistics)
+
+
+def print_statistics(statistics, count, top=TOP):
+    ''' Print the 'top' source lines of 'statistics' by bytes allocated,
+        and their bytes per node for 'count' nodes.
+    '''
+    statistics = sorted((statistic for statistic in statistics
+                         if statistic.size_diff > 0),
+                        key=lambda statistic: statistic.size_diff,
+                        reverse=True)
+    for statistic in statistics[:top]:
+        frame = statistic.traceback[0]
+        print('  {:>10,} B {:>8.1f} B/node {:>8,} blocks  {}:{}'.format(
+              statistic.size_diff, statistic.size_diff / count,
+              statistic.count_diff, frame.filename, frame.lineno))
+
+
+def main(args):
+    if '--help' in args:
+        print(__doc__)
+        return 0
+    options = {'--max-project': MAX_PROJECT, '--max-view': MAX_VIEW,
+               '--top': TOP}
+    for flag in options:
+        if flag in args:
+            index = args.index(flag)
+            options[flag] = int(args[index + 1])
+            del args[index:index + 2]
+    sizes = [int(arg) for arg in args] or SIZES
+
+    regressions = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as path:
+            build_tree(path, size)
+            root, num_projects, per_project, statistics = \
+                    measure_projects(path)
+            print('{:,} Projects: {:,.0f} B/Project'.format(num_projects,
+                                                             per_project))
+            print_statistics(statistics, num_projects, options['--top'])
+            if per_project > options['--max-project']:
+                regressions.append('{:,} Projects: {:,.0f} B/Project > {:,}'
+                        .format(num_projects, per_project,
+                                options['--max-project']))
+
+            views = measure_views(root)
+            if views is None:
+                print('  no display, skipping ProjectViews')
+                continue
+            num_views, per_view, statistics = views
+            print('{:,} ProjectViews: {:,.0f} B/ProjectView'.format(
+                  num_views, per_view))
+            print_statistics(statistics, num_views, options['--top'])
+            if options['--max-view'] is None:
+                print('  WARNING no ProjectView baseline recorded, not '
+                      'checked (see BASELINE_VIEW)')
+            elif per_view > options['--max-view']:
+                regressions.append('{:,} ProjectViews: {:,.0f} B/ProjectView'
+                        ' > {:,}'.format(num_views, per_view,
+                                         options['--max-view']))
+
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
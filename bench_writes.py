@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+''' Benchmark the record writes of a simulated GUI editing session.
+
+Every focus change in the GUI's ProjectEditor submits the displayed fields
+    through update_params and saves, whether or not anything was edited. This
+    replays such a session on a synthetic tree, with and without skipping
+    unchanged records, and reports the number of files written.
+
+Usage: python3 bench_writes.py [num_projects] [num_interactions] [edit_every]
+
+'''
+
+import random, sys, tempfile
+from project import Project
+from instrumentation import Instrumentation
+
+
+def build_tree(path, num_projects, branching=5):
+    ''' Create and save a tree of 'num_projects' Projects at 'path'. '''
+    root = Project('_main', path=path)
+    projects = [root]
+    for index in range(1, num_projects):
+        parent = projects[(index - 1) // branching]
+        projects.append(parent.create_sub_project('p{}'.format(index),
+                details='Project number {}'.format(index),
+                due_date='{:02}/Mar/2030 - 12:00'.format(index % 28 + 1),
+                duration='{}h'.format(index % 12 + 1)))
+    root.save()
+    return root, projects
+
+
+def run_session(projects, num_interactions, edit_every, seed=0):
+    ''' Replay GUI focus changes, editing every 'edit_every'th one.
+
+    Returns the number of files written during the session.
+
+    '''
+    rng = random.Random(seed)
+    with Instrumentation() as stats:
+        for interaction in range(num_interactions):
+            project = rng.choice(projects[1:])
+            submission = {key: value for key, value
+                          in project.get_properties().items() if value}
+            if edit_every and interaction % edit_every == 0:
+                submission['details'] = 'Edited in interaction {}'.format(
+                        interaction)
+            project.update_params(**submission)
+            project.save()
+    return stats.snapshot()['operations'].get('write', {}).get('calls', 0)
+
+
+def main(num_projects=500, num_interactions=2000, edit_every=10):
+    results = {}
+    for skip_unchanged in (False, True):
+        Project.SKIP_UNCHANGED = skip_unchanged
+        with tempfile.TemporaryDirectory() as path:
+            root, projects = build_tree(path, num_projects)
+            results[skip_unchanged] = run_session(projects, num_interactions,
+                                                  edit_every)
+    Project.SKIP_UNCHANGED = True
+
+    print('{} projects, {} interactions, 1 in {} edited'.format(
+          num_projects, num_interactions, edit_every))
+    print('writes without skipping unchanged records: {}'.format(
+          results[False]))
+    print('writes when skipping unchanged records:    {}'.format(
+          results[True]))
+    if results[False]:
+        print('writes removed: {:.1%}'.format(
+              1 - results[True] / results[False]))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
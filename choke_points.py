@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+''' Detection of structural bottlenecks ("choke points") in a Project tree. '''
+
+from collections import namedtuple
+
+ChokePoint = namedtuple('ChokePoint', 'gates local_gates dominates fan_in '
+                                      'fan_out articulation')
+ChokePoint.__doc__ = ''' The bottleneck metrics of an incomplete Project.
+
+'gates' is the number of Projects anywhere in the tree which can't start until
+    the Project is finished, via precursors of it or of its ancestors.
+'local_gates' is the number of its siblings transitively succeeding it.
+'dominates' is the number of Projects which every dependency path to passes
+    through the Project's finish, in the tree-wide dependency graph.
+'fan_in' and 'fan_out' are its numbers of incomplete precursors and sibling
+    successors.
+'articulation' is True if removing it disconnects its sibling precursor graph.
+
+'''
+
+
+class ChokePointAnalysis(object):
+    ''' An analysis of the incomplete Projects in a tree for choke points.
+
+    The tree-wide dependency graph has a start and a finish node per Project:
+        a Project starts after its parent starts and its precursors finish, and
+        finishes after it starts and its sub-projects finish. Transitive
+        successor counts are accumulated as bitsets in reverse topological
+        order, and dominators are found in one topological pass. Each sibling
+        precursor graph is also analysed on its own, including for
+        articulation points.
+
+    The bitsets make the analysis superlinear: O(n * (n + e) / w) time for n
+        incomplete Projects, e precursor links and machine word size w, e.g.
+        several seconds for 30,000 Projects. Bitsets are dropped once used by
+        all their predecessors, which bounds the memory by the widest part of
+        the graph rather than its size in most trees.
+
+    Project.get_choke_point caches an analysis of the Project's tree until its
+        precursors or structure change, which is the normal way to access it,
+        so it's computed at most once per change to the tree.
+
+    '''
+    MIN_GATES     = 3    # gates/dominates needed to be a choke point
+    GATES_SHARE   = 0.25 # or this share of the incomplete Projects, if more
+    MIN_FAN_IN    = 3    # or precursors joining at it
+
+    def __init__(self, root):
+        ''' Analyse the tree with root Project 'root'.
+
+        Raises a ValueError if precursors form a cycle.
+
+        '''
+        self.root = root
+        self._projects = []
+        self._index = {} # id(project) -> index in self._projects
+        remaining = list(root.sub_projects.values())
+        while remaining:
+            project = remaining.pop()
+            if not project.complete:
+                self._index[id(project)] = len(self._projects)
+                self._projects.append(project)
+            remaining.extend(project.sub_projects.values())
+
+        gates, dominates = self._analyse_tree()
+        local = {}
+        for parent in [root] + self._projects:
+            local.update(self._analyse_group(
+                [self._index[id(sub_project)] for sub_project
+                 in parent.sub_projects.values()
+                 if id(sub_project) in self._index]))
+
+        self._results = {}
+        for index, project in enumerate(self._projects):
+            local_gates, fan_in, fan_out, articulation = local[index]
+            self._results[id(project)] = ChokePoint(gates[index],
+                    local_gates, dominates[index], fan_in, fan_out,
+                    articulation)
+        self._threshold = max(self.MIN_GATES,
+                              self.GATES_SHARE * len(self._projects))
+
+    def get(self, project):
+        ''' Return the ChokePoint of 'project', or None if not analysed. '''
+        return self._results.get(id(project))
+
+    def is_choke_point(self, project):
+        ''' Return True if 'project' is an incomplete choke point.
+
+        A choke point gates or dominates at least the threshold number of
+            Projects (MIN_GATES, or GATES_SHARE of the incomplete Projects if
+            more), e.g. the head of a chain or the sole sub-project of one,
+            or is an articulation point of its sibling precursor graph
+            joining at least MIN_FAN_IN precursors.
+
+        '''
+        result = self.get(project)
+        return bool(result) and \
+                (result.gates >= self._threshold or
+                 result.dominates >= self._threshold or
+                 result.articulation and result.fan_in >= self.MIN_FAN_IN)
+
+    def choke_points(self):
+        ''' Return a list of (Project, ChokePoint) tuples for choke points,
+            most gating first.
+        '''
+        return sorted(((project, self.get(project)) for project
+                       in self._projects if self.is_choke_point(project)),
+                      key=lambda item: -item[1].gates)
+
+    @staticmethod
+    def _topological_order(successors, num_predecessors):
+        ''' Return the nodes ordered so predecessors precede successors.
+
+        Raises a ValueError if the graph has a cycle.
+
+        '''
+        waiting = list(num_predecessors)
+        order = [node for node, count in enumerate(waiting) if not count]
+        for node in order: # extended while iterating
+            for successor in successors[node]:
+                waiting[successor] -= 1
+                if not waiting[successor]:
+                    order.append(successor)
+        if len(order) != len(waiting):
+            raise ValueError('Precursor cycle detected')
+        return order
+
+    def _analyse_tree(self):
+        ''' Return lists of the tree-wide (gates, dominates) of each Project.
+        '''
+        # node 2i is the start of Project i, node 2i+1 its finish
+        index = self._index
+        num_nodes = 2 * len(self._projects)
+        successors = [[] for node in range(num_nodes)]
+        predecessors = [[] for node in range(num_nodes)]
+        def add_edge(from_node, to_node):
+            successors[from_node].append(to_node)
+            predecessors[to_node].append(from_node)
+
+        for i, project in enumerate(self._projects):
+            add_edge(2*i, 2*i + 1)
+            parent = index.get(id(project._parent))
+            if parent is not None:
+                add_edge(2*parent, 2*i)
+                add_edge(2*i + 1, 2*parent + 1)
+            for precursor in project.precursors.values():
+                if id(precursor) in index:
+                    add_edge(2*index[id(precursor)] + 1, 2*i)
+
+        order = self._topological_order(successors,
+                                        [len(nodes) for nodes in predecessors])
+
+        # transitive successor starts, as bitsets over Projects, each counted
+        #   once computed and dropped once all its predecessors have used it
+        gates = [0] * len(self._projects)
+        reach = [0] * num_nodes
+        unused = [len(nodes) for nodes in predecessors]
+        for node in reversed(order):
+            bits = 0
+            for successor in successors[node]:
+                bits |= reach[successor]
+                if not successor % 2:
+                    bits |= 1 << (successor // 2)
+                unused[successor] -= 1
+                if not unused[successor]:
+                    reach[successor] = 0
+            if node % 2:
+                gates[node // 2] = bin(bits).count('1')
+            reach[node] = bits
+
+        # immediate dominators, from a virtual source (-1) before all nodes
+        idom = [-1] * num_nodes
+        depth = [0] * num_nodes
+        for node in order:
+            dominator = None
+            for predecessor in predecessors[node]:
+                if dominator is None:
+                    dominator = predecessor
+                    continue
+                # nearest common ancestor in the dominator tree
+                other = predecessor
+                while dominator != other:
+                    if dominator == -1 or other == -1:
+                        dominator = -1
+                        break
+                    if depth[dominator] >= depth[other]:
+                        dominator = idom[dominator]
+                    else:
+                        other = idom[other]
+            idom[node] = -1 if dominator is None else dominator
+            depth[node] = 0 if idom[node] == -1 else depth[idom[node]] + 1
+
+        # dominated Project starts, accumulated up the dominator tree
+        dominated = [0] * num_nodes
+        for node in reversed(order):
+            if not node % 2:
+                dominated[node] += 1
+            if idom[node] != -1:
+                dominated[idom[node]] += dominated[node]
+        dominates = [dominated[2*i + 1] for i in range(len(self._projects))]
+        return gates, dominates
+
+    def _analyse_group(self, group):
+        ''' Return a dictionary of Project index -> (local_gates, fan_in,
+            fan_out, articulation) for a sibling 'group' of Project indices.
+        '''
+        position = {index: node for node, index in enumerate(group)}
+        successors = [[] for index in group]
+        predecessors = [[] for index in group]
+        for node, index in enumerate(group):
+            for precursor in self._projects[index].precursors.values():
+                other = position.get(self._index.get(id(precursor)))
+                if other is not None:
+                    successors[other].append(node)
+                    predecessors[node].append(other)
+
+        order = self._topological_order(successors,
+                                        [len(nodes) for nodes in predecessors])
+        reach = [0] * len(group)
+        for node in reversed(order):
+            bits = 0
+            for successor in successors[node]:
+                bits |= reach[successor] | (1 << successor)
+            reach[node] = bits
+
+        articulation = self._articulation_points(
+                [successors[node] + predecessors[node]
+                 for node in range(len(group))])
+        return {index: (bin(reach[node]).count('1'), len(predecessors[node]),
+                        len(successors[node]), node in articulation)
+                for node, index in enumerate(group)}
+
+    @staticmethod
+    def _articulation_points(neighbours):
+        ''' Return the set of articulation points of an undirected graph,
+            given as a list of neighbour lists, by iterative Tarjan.
+        '''
+        num_nodes = len(neighbours)
+        discovered = [-1] * num_nodes
+        low = [0] * num_nodes
+        points = set()
+        time = 0
+        for root in range(num_nodes):
+            if discovered[root] != -1:
+                continue
+            discovered[root] = low[root] = time; time += 1
+            root_children = 0
+            # stack of (node, parent, neighbour iterator)
+            stack = [(root, -1, iter(neighbours[root]))]
+            while stack:
+                node, parent, remaining = stack[-1]
+                for neighbour in remaining:
+                    if discovered[neighbour] == -1:
+                        discovered[neighbour] = low[neighbour] = time
+                        time += 1
+                        stack.append((neighbour, node,
+                                      iter(neighbours[neighbour])))
+                        break
+                    if neighbour != parent:
+                        low[node] = min(low[node], discovered[neighbour])
+                else:
+                    stack.pop()
+                    if parent == -1:
+                        continue
+                    low[parent] = min(low[parent], low[node])
+                    if parent == root:
+                        root_children += 1
+                    elif low[node] >= discovered[parent]:
+                        points.add(parent)
+            if root_children > 1:
+                points.add(root)
+        return points
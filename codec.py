@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+''' Fast encoding and decoding of the date and duration strings in records.
+
+Dates are in TIME_FORMAT ('dd/Mmm/yyyy - hh:mm'), and durations in 'xh' or 'xd'
+    form for hours or days respectively. Parsing uses fixed-offset slicing and
+    lookup tables rather than datetime.strptime, falling back to strptime for
+    anything outside the fixed format (e.g. single digit days), so the results
+    match strptime/strftime for all records written by Project.
+
+'''
+
+import os, json
+from datetime import datetime, timedelta
+from keyword import iskeyword
+from functools import lru_cache
+
+TIME_FORMAT = '%d/%b/%Y - %H:%M' # 'dd/Mmm/yyyy - hh:mm'
+EXTENSION   = '.txt'
+DATE_KEYS     = ('due_date', 'completion_date')
+DURATION_KEYS = ('duration', 'scheduled_time')
+# keys of saved records, in the order Project saves them
+RECORD_KEYS = ('template', 'details', 'sub_projects', 'archived',
+               'archive_keys', 'due_date', 'completion_date', 'complete',
+               'duration', 'scheduled_time', 'precursors')
+
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+_MONTH_NUMBERS = {name: number for number, name in enumerate(MONTHS, 1)}
+_TWO_DIGITS = ['{:02}'.format(number) for number in range(100)]
+_HOUR = timedelta(hours=1)
+
+CACHE_SIZE = 4096 # distinct strings/values to remember
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_datetime(date_str):
+    ''' Return the datetime represented by 'date_str' in TIME_FORMAT. '''
+    # dd/Mmm/yyyy - hh:mm
+    # 0123456789012345678
+    if len(date_str) == 19 and date_str[2] == '/' and date_str[6] == '/' \
+       and date_str[11:14] == ' - ' and date_str[16] == ':':
+        digits = date_str[:2] + date_str[7:11] + date_str[14:16] + \
+                date_str[17:]
+        month = _MONTH_NUMBERS.get(date_str[3:6]) or \
+                _MONTH_NUMBERS.get(date_str[3:6].title())
+        if month and digits.isascii() and digits.isdigit():
+            try:
+                return datetime(int(date_str[7:11]), month,
+                                int(date_str[:2]), int(date_str[14:16]),
+                                int(date_str[17:]))
+            except ValueError:
+                pass # invalid date, so let strptime raise the error
+    return datetime.strptime(date_str, TIME_FORMAT)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def format_datetime(date):
+    ''' Return 'date' as a string in TIME_FORMAT. '''
+    if date.year < 1000:
+        return datetime.strftime(date, TIME_FORMAT) # platform dependent
+    return ''.join((_TWO_DIGITS[date.day], '/', MONTHS[date.month - 1], '/',
+                    str(date.year), ' - ', _TWO_DIGITS[date.hour], ':',
+                    _TWO_DIGITS[date.minute]))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_duration(duration_str):
+    ''' Return the timedelta represented by an 'xh' or 'xd' string. '''
+    if 'h' in duration_str:
+        # duration formatted as x hours 'xh'
+        return timedelta(hours=float(duration_str[:-1]))
+    # duration formatted as x days 'xd'
+    return timedelta(days=float(duration_str[:-1]))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def format_duration(duration):
+    ''' Return 'duration' as a string in 'xh' form, or 'xd' if over a day. '''
+    hours = duration / _HOUR
+    if hours > 24:
+        return '{}d'.format(hours / 24)
+    return '{}h'.format(hours)
+
+
+def decode_record(record):
+    ''' Convert the date and duration strings of a parsed record in place.
+
+    Returns 'record', for convenience.
+
+    '''
+    for key in DATE_KEYS:
+        if isinstance(record.get(key), str):
+            record[key] = parse_datetime(record[key])
+    for key in DURATION_KEYS:
+        if isinstance(record.get(key), str):
+            record[key] = parse_duration(record[key])
+    return record
+
+
+def parse_record(record_str):
+    ''' Parse a saved record string into a dictionary of parameters. '''
+    record = _parse_layout(record_str)
+    if record is not None:
+        return record
+    # insertion security risk - does it matter?
+    return eval('dict({})'.format(record_str))
+
+
+def _parse_layout(record_str):
+    ''' Parse a record in the exact layout Project saves, one 'key = value,'
+        per line, returning None for anything else (e.g. escapes) so it is
+        left to the full parser.
+    '''
+    if '\r' in record_str or '\0' in record_str:
+        return None # normalised or rejected by the full parser
+    record = {}
+    position = 0
+    while position < len(record_str):
+        equals = record_str.find(' = ', position)
+        key = record_str[position:equals]
+        if equals < 0 or not (key.isascii() and key.isidentifier()) or \
+           iskeyword(key) or key in record:
+            return None
+        start = equals + 3
+        if record_str.startswith('"""', start):
+            end = record_str.find('""",\n', start + 3)
+            value = record_str[start + 3:end]
+            if end < 0 or '"""' in value or '\\' in value or \
+               value.endswith('"'):
+                return None
+            position = end + 5
+        else:
+            end = record_str.find(',\n', start)
+            text = record_str[start:end]
+            if end < 0 or '\\' in text or '\n' in text:
+                return None
+            position = end + 2
+            if text[:2] == '["' and text[-2:] == '"]':
+                value = text[2:-2].split('","')
+                if any('"' in item for item in value):
+                    return None
+            elif text[:1] == '"' and text[-1:] == '"' and len(text) > 1 \
+                 and '"' not in text[1:-1]:
+                value = text[1:-1]
+            elif text in ('True', 'False'):
+                value = text == 'True'
+            elif text.isascii() and text.isdigit() and \
+                    (text == '0' or not text.startswith('0')):
+                value = int(text)
+            else:
+                return None
+        record[key] = value
+    return record
+
+
+def format_record(record, keys=RECORD_KEYS):
+    ''' Return the saved string of a parsed (not decoded) 'record', as
+        Project would save it, starting with its version stamp if it has one.
+
+    Only 'keys' are saved, in order.
+
+    '''
+    record_str = ''
+    if 'version' in record:
+        record_str += 'version = {},\n'.format(record['version'])
+    for key in keys:
+        value = record.get(key)
+        if not value:
+            continue
+        if key == 'details':
+            record_str += 'details = """{}""",\n'.format(value)
+        elif key == 'complete':
+            record_str += 'complete = True,\n'
+        elif isinstance(value, list):
+            record_str += '{} = ["{}"],\n'.format(key, '","'.join(value))
+        else:
+            record_str += '{} = "{}",\n'.format(key, value)
+    return record_str
+
+
+def read_record(base, template=None):
+    ''' Return the contents of the record with 'base' (filename without
+        extension), or if it has none, of its 'template' base's (e.g. an
+        unedited sub-project of a template instance), or None if neither
+        exists.
+    '''
+    for path in (base, template):
+        if path is not None:
+            try:
+                with open(path + EXTENSION) as record_file:
+                    return record_file.read()
+            except FileNotFoundError:
+                pass
+    return None
+
+
+def sub_template(root, record, template, name):
+    ''' Return the template base of sub-project 'name' of the parsed
+        'record' saved in the tree at 'root', given the record's own
+        'template' base (from its parent's, or None), as Project derives it.
+    '''
+    if record.get('template'):
+        template = os.path.join(root, record['template'])
+    return template and os.path.join(template, name)
+
+
+def record_stats(directory):
+    ''' Return a dictionary of name -> [mtime_ns, size] of the records in
+        'directory', from one scan.
+    '''
+    stats = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(EXTENSION) and \
+               not entry.name.startswith('.') and entry.is_file():
+                stat = entry.stat()
+                stats[entry.name[:-len(EXTENSION)]] = [stat.st_mtime_ns,
+                                                       stat.st_size]
+    return stats
+
+
+def record_stat(directory, name):
+    ''' Return the [mtime_ns, size] of record 'name' in 'directory', as
+        record_stats would, or None if it has no record of its own.
+    '''
+    try:
+        stat = os.stat(os.path.join(directory, name + EXTENSION))
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def read_stamped(filename):
+    ''' Return the stamped sidecar at 'filename' (see write_stamped) as a
+        dictionary of name -> entry, or None if it can't be read.
+    '''
+    try:
+        with open(filename) as sidecar:
+            return json.load(sidecar)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_stamped(filename, entries, width, merge=False, stats=None):
+    ''' Atomically write the sidecar 'filename' of name -> 'entries' (lists
+        of 'width' items) for the records in its directory, stamping each
+        with the [mtime_ns, size] of its record as it is now, or as in
+        'stats' (from record_stats) if given, e.g. taken before the records
+        were read.
+
+    Any later change to a record (even edited in place) then shows in
+        current_entries. Names without a record of their own (e.g. unedited
+        sub-projects of template instances) aren't stamped. If 'merge', the
+        entries update those already in the sidecar (e.g. for a directory of
+        several roots). Skipped if the directory no longer exists.
+
+    '''
+    directory = os.path.dirname(filename) or '.'
+    if stats is None:
+        try:
+            stats = record_stats(directory)
+        except FileNotFoundError:
+            return # moved or removed since
+    if merge:
+        entries = dict({name: entry[:width] for name, entry
+                        in (read_stamped(filename) or {}).items()}, **entries)
+    data = json.dumps({name: list(entry) + stats.get(name, [])
+                       for name, entry in entries.items()},
+                      sort_keys=True)
+    temp_file = filename + '.tmp'
+    try:
+        with open(temp_file, 'w') as sidecar:
+            sidecar.write(data)
+        os.replace(temp_file, filename)
+    except FileNotFoundError:
+        pass # moved or removed while written
+
+
+def update_stamped(filename, updates, width, names=None, stamp=()):
+    ''' Atomically update the sidecar 'filename' (see write_stamped) with
+        'updates' of name -> entry (lists of 'width' items), restamping only
+        the records of names in 'stamp' (e.g. just rewritten), each with one
+        stat.
+
+    Updated entries otherwise keep their stamps, so an entry out of date for
+        its record stays so, and only updated entries without one are
+        stamped. 'names' are all the names of records in the directory, if
+        known, and entries for any others are dropped. Skipped if nothing
+        changes, or the directory no longer exists.
+
+    '''
+    directory = os.path.dirname(filename) or '.'
+    if not os.path.isdir(directory):
+        return # moved or removed since
+    old = read_stamped(filename) or {}
+    entries = dict(old)
+    if names is not None:
+        names = set(names)
+        entries = {name: entry for name, entry in entries.items()
+                   if name in names}
+    for name, entry in updates.items():
+        stamp_now = name in stamp or len(entries.get(name, ())) <= width
+        stats = record_stat(directory, name) if stamp_now else \
+                entries[name][width:]
+        entries[name] = list(entry) + (stats or [])
+    if entries == old:
+        return
+    data = json.dumps(entries, sort_keys=True)
+    temp_file = filename + '.tmp'
+    try:
+        with open(temp_file, 'w') as sidecar:
+            sidecar.write(data)
+        os.replace(temp_file, filename)
+    except FileNotFoundError:
+        pass # moved or removed while written
+
+
+def current_entries(entries, stats, width):
+    ''' Return the entries (without stamps) of a stamped sidecar's 'entries'
+        of 'width' items which are current for the records with 'stats' (from
+        record_stats).
+    '''
+    return {name: entry[:width] for name, entry in entries.items()
+            if entry[width:] == stats.get(name, [])}
+
+
+def load_directory(path):
+    ''' Return a dictionary of name -> decoded record for 'path's records.
+
+    Reads every record directly in 'path' (not its sub-directories), with
+        dates and durations decoded to datetime and timedelta instances.
+
+    '''
+    records = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.endswith(EXTENSION) and \
+               not entry.name.startswith('.') and entry.is_file():
+                with open(entry.path) as record_file:
+                    record = parse_record(record_file.read())
+                records[entry.name[:-len(EXTENSION)]] = decode_record(record)
+    return records
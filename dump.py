@@ -1,8 +1,16 @@
 #!/usr/bin/env python3
 
 from project import Project
+from instrumentation import Instrumentation
 import os, sys
 
+# '--profile' prints a hot-path report of Project operations on exit
+profile = '--profile' in sys.argv
+if profile:
+    sys.argv.remove('--profile')
+    stats = Instrumentation()
+    stats.enable()
+
 argc = len(sys.argv)
 name = '_main'
 path = 'projects'
@@ -58,3 +66,7 @@ while True:
 proj.save()
 print('New items saved\n')
 proj.print()
+
+if profile:
+    stats.disable()
+    stats.print_report()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+''' A flat, ID based on-disk layout for Project trees.
+
+Each Project's record is saved under a stable generated ID, in a directory
+    sharded by the ID's first two characters, instead of at 'path/<name>.txt'
+    in nested 'path/<name>/' directories. A tree's root is found by name
+    through a small 'path/<name>.root' file holding its ID.
+
+Records link to their parent, sub-projects and precursors by ID. A parent's
+    record also lists its sub-projects' names, like directory entries, so
+    renaming a Project only rewrites its parent's record, and moving one only
+    rewrites its own record and those of its old and new parents, however
+    large its subtree. Names may contain any character, including '/'.
+
+Usage: python3 flat_layout.py convert source_path target_path [name]
+
+'''
+
+import os, sys
+from uuid import uuid4
+import codec
+from project import Project
+
+ROOT_EXTENSION = '.root'
+# keys of saved records, in the order FlatProject saves them
+RECORD_KEYS = ('parent_id', 'details', 'sub_projects', 'sub_project_ids',
+               'archived', 'archive_keys', 'due_date', 'completion_date',
+               'complete', 'duration', 'scheduled_time', 'precursor_ids')
+
+
+def new_id():
+    ''' Return a new unique Project ID. '''
+    return uuid4().hex
+
+
+def record_file(path, project_id):
+    ''' Return the record filename of the Project 'project_id' in 'path'. '''
+    return '{}/{}/{}{}'.format(path, project_id[:2], project_id,
+                               codec.EXTENSION)
+
+
+def root_file(path, name):
+    ''' Return the filename holding the ID of the root Project 'name'. '''
+    return '{}/{}{}'.format(path, name, ROOT_EXTENSION)
+
+
+class FlatProject(Project):
+    ''' A Project saved in the flat layout.
+
+    Used like a Project, e.g. FlatProject('_main', path='flat_projects') loads
+        or creates the tree of root '_main' saved in 'flat_projects'.
+
+    Only the Project interface is supported, without templates. Tools reading
+        the nested layout directly (archive, history, merkle, manifest, fsck
+        and watcher) don't read this one, and no sidecars are written.
+
+    '''
+    _links = None # (name -> ID, ID -> name) of sub-projects while loading
+
+    def __init__(self, name, path='projects', **kwargs):
+        ''' Initialise a Project, as for Project.
+
+        'id' is the ID of the Project, for sub-projects. A root's is read from
+            its root file, or generated (and saved) for a new tree.
+
+        '''
+        self._parent = kwargs.get('parent', None)
+        self._id = kwargs.pop('id', None)
+        if self._id is None:
+            self._id = self._root_id(path, name)
+        try:
+            super().__init__(name, path, **kwargs)
+        finally:
+            self._links = None
+
+    def _root_id(self, path, name):
+        ''' Return the ID of root 'name' in 'path', creating it if new. '''
+        filename = root_file(path, name)
+        if self._isfile(filename):
+            return self._read_file(filename).strip()
+        if not self._isdir(path):
+            self._makedirs(path)
+        project_id = new_id()
+        self._write_file(filename, project_id + '\n')
+        return project_id
+
+    def _locate(self, path):
+        ''' Set the locations of self's record, and of its sub-projects (the
+            same directory), for self saved in directory 'path'.
+        '''
+        self.path              = path
+        self._save_file        = record_file(path, self._id)
+        self._sub_project_path = path
+
+    def _move_files(self, old_base, new_base):
+        ''' Records don't move, as their locations depend only on IDs. '''
+        pass
+
+    def _remove_records(self, sub_project):
+        ''' Delete the records of 'sub_project' and its subtree. '''
+        remaining = [sub_project]
+        while remaining:
+            project = remaining.pop()
+            if self._isfile(project._save_file):
+                self._remove_path(project._save_file)
+            remaining.extend(project.sub_projects.values())
+
+    def _sub_project_id(self, name):
+        ''' Return the ID of sub-project 'name', or None if it has none. '''
+        sub_project = self.sub_projects.get(name)
+        if sub_project is not None:
+            return sub_project._id
+        if self._links:
+            return self._links[0].get(name)
+
+    def _sub_project_name(self, project_id):
+        ''' Return the name of the sub-project with ID 'project_id', or None
+            if there isn't one.
+        '''
+        if self._links and project_id in self._links[1]:
+            return self._links[1][project_id]
+        for name, sub_project in self.sub_projects.items():
+            if sub_project._id == project_id:
+                return name
+
+    def _has_record(self, name):
+        ''' Returns True if sub-project 'name' of self has a saved record. '''
+        project_id = self._sub_project_id(name)
+        return project_id is not None and \
+                self._isfile(record_file(self.path, project_id))
+
+    def create_sub_project(self, name, **kwargs):
+        ''' Create a new sub-project Project with given parameters. '''
+        project_id = self._sub_project_id(name) or new_id()
+        return self.add_sub_project(
+                modifier=not self._isfile(record_file(self.path, project_id)),
+                sub_project=FlatProject(name, path=self.path, parent=self,
+                                        id=project_id, **kwargs))
+
+    def create_precursor(self, name, **kwargs):
+        ''' Create a new sibling Project, as a precursor of self. '''
+        project_id = self._parent and self._parent._sub_project_id(name) or \
+                new_id()
+        precursor = FlatProject(name, path=self.path, parent=self._parent,
+                                id=project_id, **kwargs)
+        return self.add_precursor(precursor,
+                                  modifier=self._isfile(precursor._save_file))
+
+    def _apply_record(self, record):
+        try:
+            super()._apply_record(record)
+        finally:
+            self._links = None
+
+    def _parse_record(self, record_str):
+        ''' Parse a saved record string into a dictionary of parameters, with
+            precursors by name.
+
+        The sub-projects' IDs are kept until they're loaded.
+
+        '''
+        record = codec.parse_record(record_str)
+        record.pop('parent_id', None)
+        names = record.get('sub_projects', [])
+        ids = record.pop('sub_project_ids', [])
+        self._links = (dict(zip(names, ids)), dict(zip(ids, names)))
+        precursor_ids = record.pop('precursor_ids', [])
+        if precursor_ids and self._parent is not None:
+            names = [self._parent._sub_project_name(precursor_id)
+                     for precursor_id in precursor_ids]
+            record['precursors'] = [name for name in names if name is not None]
+        return record
+
+    def _read_version(self, filename):
+        ''' Return the version stamp of the record saved at 'filename'. '''
+        return codec.parse_record(self._read_file(filename)).get('version', 0)
+
+    def _gen_record(self):
+        ''' Generate the saved string version of self, without a version. '''
+        return codec.format_record(dict(
+            parent_id       = self._parent and self._parent._id,
+            details         = self.details,
+            sub_projects    = list(self.sub_projects),
+            sub_project_ids = [sub_project._id for sub_project
+                               in self.sub_projects.values()],
+            archived        = list(self.archived),
+            archive_keys    = list(self.archived.values()),
+            due_date        = self.get_due_date_str(),
+            completion_date = self.get_completion_date_str(),
+            complete        = self.complete,
+            duration        = self.get_duration_str(),
+            scheduled_time  = self.get_scheduled_time_str(),
+            precursor_ids   = [precursor._id for precursor
+                               in self.precursors.values()],
+        ), RECORD_KEYS)
+
+    def _sidecars(self, saved):
+        ''' The flat layout has no per-directory sidecars. '''
+        return []
+
+
+def convert(source, target, name='_main'):
+    ''' Copy the tree of root 'name' saved in the nested layout in 'source'
+        into the flat layout in 'target', returning the root's ID.
+
+    Records are copied as they are, except for precursors which aren't
+        siblings, which are dropped, and missing sub-project records, which
+        are saved empty (as Project would load them). Template instances are
+        copied as plain Projects, with the records of their unedited
+        sub-projects copied from their templates'. Raises a FileExistsError
+        if 'target' already has a root called 'name'.
+
+    '''
+    pointer = root_file(target, name)
+    if os.path.exists(pointer):
+        raise FileExistsError(pointer)
+
+    root_id = new_id()
+    # (directory, name, ID, parent ID, sibling name -> ID, template base)
+    pending = [(source, name, root_id, None, {}, None)]
+    while pending:
+        directory, name, project_id, parent_id, siblings, template = \
+                pending.pop()
+        record_str = codec.read_record(os.path.join(directory, name),
+                                       template)
+        record = {} if record_str is None else codec.parse_record(record_str)
+        names = list(dict.fromkeys(record.get('sub_projects', [])))
+        links = {sub_project: new_id() for sub_project in names}
+        record.update(
+            version         = 1,
+            parent_id       = parent_id,
+            sub_projects    = names,
+            sub_project_ids = [links[sub_project] for sub_project in names],
+            precursor_ids   = [siblings[precursor] for precursor
+                               in record.get('precursors', [])
+                               if precursor in siblings],
+        )
+        filename = record_file(target, project_id)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w') as output:
+            output.write(codec.format_record(record, RECORD_KEYS))
+        pending.extend((os.path.join(directory, name), sub_project,
+                        links[sub_project], project_id, links,
+                        codec.sub_template(source, record, template,
+                                           sub_project))
+                       for sub_project in names)
+
+    # last, so an interrupted conversion leaves no root
+    with open(pointer, 'w') as output:
+        output.write(root_id + '\n')
+    return root_id
+
+
+def main(args):
+    ''' Run the command specified by command line 'args'. '''
+    if len(args) < 3 or args[0] != 'convert':
+        print(__doc__)
+        return
+    name = args[3] if len(args) > 3 else '_main'
+    print(convert(args[1], args[2], name))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+
+''' A parallel integrity checker (and repairer) for saved Project trees.
+
+Usage: python3 fsck.py [name] [path] [--repair] [--workers N]
+
+Prints each problem found as a line of JSON, with the 'problem', the 'path'
+    affected, a 'detail' message, and the 'repair' which --repair applies (or
+    null if it must be fixed by hand). Exits with status 1 if any problems
+    were found.
+
+'''
+
+import json, os, shutil, sys, time
+from concurrent.futures import ProcessPoolExecutor
+import codec
+from batch import Batch
+from locking import FileLock
+
+# problems
+UNREADABLE            = 'unreadable'        # record can't be read or parsed
+MISSING_ROOT          = 'missing_root'
+MISSING_SUB_PROJECT   = 'missing_sub_project'
+DUPLICATE_SUB_PROJECT = 'duplicate_sub_project'
+ORPHAN_RECORD         = 'orphan_record'     # record not in its parent's list
+ORPHAN_DIRECTORY      = 'orphan_directory'  # directory without a record
+MISSING_PRECURSOR     = 'missing_precursor' # precursor isn't a sibling
+PRECURSOR_CYCLE       = 'precursor_cycle'
+TEMP_FILE             = 'temp_file'         # left by an interrupted write
+STALE_BATCH           = 'stale_batch'       # an interrupted Batch's staging
+
+# repairs
+DROP   = 'drop'   # remove the name from the record's list
+CREATE = 'create' # write an empty record, adopting its sub-projects
+LOST   = 'lost'   # move into the lost and found directory
+DELETE = 'delete'
+REPLAY = 'replay' # complete an interrupted Batch commit from its journal
+
+LOST_FOUND   = '.lost+found'
+STAGING_DIR  = Batch.STAGING_DIR
+TEMP_SUFFIX  = '.tmp'
+TEMP_MIN_AGE = 60   # seconds, so writes in progress aren't reported
+CHUNK        = 256  # directories per worker task
+
+
+def _problem(problem, path, detail, repair=None, **extra):
+    return dict(problem=problem, path=path, detail=detail, repair=repair,
+                **extra)
+
+
+def _list_directory(directory):
+    ''' Return (record names, sub-directory names, hidden or temporary
+        entry names) of 'directory', or None if it doesn't exist.
+    '''
+    records = []; directories = []; other = []
+    try:
+        entries = os.scandir(directory)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    with entries:
+        for entry in entries:
+            if entry.name.startswith('.') or \
+               entry.name.endswith(TEMP_SUFFIX):
+                other.append(entry.name)
+            elif entry.is_dir(follow_symlinks=False):
+                directories.append(entry.name)
+            elif entry.name.endswith(codec.EXTENSION):
+                records.append(entry.name[:-len(codec.EXTENSION)])
+    return records, directories, other
+
+
+def scan(path, name='_main'):
+    ''' Return a dictionary of directory -> listing from _list_directory, of
+        the directories of the tree of root 'name' saved in 'path'.
+
+    Only directories belonging to a record are descended into. The listing of
+        'path' itself is limited to the root's record, as other roots' trees
+        may share it.
+
+    '''
+    listing = _list_directory(path)
+    if listing is None:
+        return {}
+    records, directories, other = listing
+    listings = {path: ([name] if name in records else [], [],
+                       [entry for entry in other if entry == STAGING_DIR or
+                        entry.startswith('.{}{}.'.format(name,
+                                                         codec.EXTENSION))])}
+    pending = [os.path.join(path, name)] if name in records else []
+    while pending:
+        directory = pending.pop()
+        listing = _list_directory(directory)
+        if listing is None:
+            continue
+        listings[directory] = listing
+        records = set(listing[0])
+        pending.extend(os.path.join(directory, sub_directory) for
+                       sub_directory in listing[1] if sub_directory in records)
+    return listings
+
+
+def _read_record(filename):
+    ''' Return (parsed record, None) for 'filename', or (None, error). '''
+    try:
+        with open(filename) as record_file:
+            record = codec.parse_record(record_file.read())
+        if not isinstance(record.get('sub_projects', []), list) or \
+           not isinstance(record.get('precursors', []), list):
+            raise ValueError('malformed sub_projects or precursors')
+        return record, None
+    except Exception as error:
+        return None, '{}: {}'.format(type(error).__name__, error)
+
+
+def check_directory(directory, listing, sub_listings, now=None,
+                    instances=None):
+    ''' Return a list of the problems in 'directory' and its records.
+
+    'listing' is the directory's listing, and 'sub_listings' a dictionary of
+        record name -> listing of the record's sub-project directory (or
+        None), as from _list_directory. The (base, template) of records of
+        template instances are appended to the 'instances' list, if given,
+        where 'base' is the record's filename without extension.
+
+    '''
+    now = now or time.time()
+    records, directories, other = listing
+    problems = []
+    parsed = {}
+    for name in records:
+        filename = os.path.join(directory, name + codec.EXTENSION)
+        record, error = _read_record(filename)
+        if error:
+            problems.append(_problem(UNREADABLE, filename, error))
+        else:
+            parsed[name] = record
+            if instances is not None and record.get('template'):
+                instances.append((os.path.join(directory, name),
+                                  record['template']))
+
+    siblings = set(records)
+    for name, record in parsed.items():
+        filename = os.path.join(directory, name + codec.EXTENSION)
+        sub_directory = os.path.join(directory, name)
+        problems.extend(_check_sub_projects(filename, sub_directory, record,
+                                            sub_listings.get(name)))
+        for precursor in record.get('precursors', []):
+            if precursor not in siblings or precursor == name:
+                problems.append(_problem(MISSING_PRECURSOR, filename,
+                        'precursor {!r} is not another sub-project of its '
+                        'parent'.format(precursor),
+                        DROP, record=filename, key='precursors',
+                        name=precursor))
+    problems.extend(_check_cycles(directory, parsed))
+
+    for entry in other:
+        path = os.path.join(directory, entry)
+        if entry == STAGING_DIR:
+            if os.path.isfile(os.path.join(path, Batch.JOURNAL)):
+                problems.append(_problem(STALE_BATCH, path,
+                        'journaled commit of an interrupted batch', REPLAY))
+            else:
+                problems.append(_problem(STALE_BATCH, path,
+                        'staging directory of an interrupted batch', DELETE))
+        elif entry.endswith(TEMP_SUFFIX):
+            try:
+                age = now - os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue # finished writing
+            if age >= TEMP_MIN_AGE:
+                problems.append(_problem(TEMP_FILE, path,
+                        'temporary file of an interrupted write', DELETE))
+    return problems
+
+
+def _check_sub_projects(filename, sub_directory, record, sub_listing):
+    ''' Return the problems of 'record's sub-projects, against the listing of
+        its 'sub_directory'.
+    '''
+    problems = []
+    names = record.get('sub_projects', [])
+    records, directories = (sub_listing or ((), ()))[:2]
+    records = set(records); directories = set(directories)
+    seen = set()
+    for name in names:
+        if name in seen:
+            problems.append(_problem(DUPLICATE_SUB_PROJECT, filename,
+                    'sub-project {!r} listed more than once'.format(name),
+                    DROP, record=filename, key='sub_projects', name=name))
+            continue
+        seen.add(name)
+        if name not in records:
+            if name in directories:
+                path = os.path.join(sub_directory, name + codec.EXTENSION)
+                problems.append(_problem(MISSING_SUB_PROJECT, path,
+                        'record missing, but its sub-projects exist', CREATE))
+            else:
+                problems.append(_problem(MISSING_SUB_PROJECT, filename,
+                        'sub-project {!r} has no record'.format(name), DROP,
+                        record=filename, key='sub_projects', name=name))
+
+    listed = seen.union(record.get('archived', []))
+    for name in sorted(records - listed):
+        problems.append(_problem(ORPHAN_RECORD,
+                os.path.join(sub_directory, name + codec.EXTENSION),
+                'not a sub-project of its parent', LOST))
+        if name in directories:
+            problems.append(_problem(ORPHAN_DIRECTORY,
+                    os.path.join(sub_directory, name),
+                    'sub-projects of an orphan record', LOST))
+    for name in sorted(directories - records - listed):
+        problems.append(_problem(ORPHAN_DIRECTORY,
+                os.path.join(sub_directory, name),
+                'directory without a record', LOST))
+    return problems
+
+
+def _check_cycles(directory, parsed):
+    ''' Return the precursor cycles among the 'parsed' records in
+        'directory', as problems.
+    '''
+    # Kahn's algorithm, leaving only records on or after cycles
+    waiting = {name: {precursor for precursor in record.get('precursors', [])
+                      if precursor in parsed and precursor != name}
+               for name, record in parsed.items()}
+    followers = {name: [] for name in parsed}
+    for name, precursors in waiting.items():
+        for precursor in precursors:
+            followers[precursor].append(name)
+    ready = [name for name, precursors in waiting.items() if not precursors]
+    while ready:
+        name = ready.pop()
+        for follower in followers[name]:
+            waiting[follower].discard(name)
+            if not waiting[follower]:
+                ready.append(follower)
+        del waiting[name]
+    if not waiting:
+        return []
+    return [_problem(PRECURSOR_CYCLE, directory,
+                     'precursors form a cycle through {}'.format(
+                     ', '.join(sorted(waiting))), names=sorted(waiting))]
+
+
+def _check_chunk(tasks):
+    ''' Check each (directory, listing, sub-listings) task of a chunk,
+        returning (problems, bases of instance records).
+    '''
+    now = time.time()
+    problems = []; instances = []
+    for directory, listing, sub_listings in tasks:
+        problems.extend(check_directory(directory, listing, sub_listings, now,
+                                        instances))
+    return problems, instances
+
+
+def _outside_instances(problems, instances, path):
+    ''' Return 'problems' without those expected in the subtrees of template
+        'instances' ((record base, template) pairs) in the tree saved in
+        'path', whose unedited sub-projects are saved as their templates'
+        records rather than records of their own.
+
+    Sub-projects missing from both an instance and its template are still
+        reported, e.g. after the template's was renamed or removed.
+
+    '''
+    templates = dict(instances)
+    kept = []
+    for problem in problems:
+        if problem['problem'] not in (MISSING_SUB_PROJECT, MISSING_PRECURSOR):
+            kept.append(problem)
+            continue
+        # the template base of the problem's record, if in an instance
+        base = problem['path'][:-len(codec.EXTENSION)]
+        instance = base
+        while instance not in templates and os.path.dirname(instance) not in \
+                (instance, ''):
+            instance = os.path.dirname(instance)
+        if instance not in templates:
+            kept.append(problem)
+        elif problem['problem'] == MISSING_SUB_PROJECT and 'name' in problem:
+            template = os.path.join(path, templates[instance]) + \
+                    base[len(instance):]
+            if not os.path.isfile(os.path.join(template, problem['name'] +
+                                               codec.EXTENSION)):
+                kept.append(problem)
+    return kept
+
+
+def check(path, name='_main', workers=None):
+    ''' Return a list of the problems in the tree of root 'name' saved in
+        'path', checking directories in parallel with 'workers' processes
+        (default the number of CPUs).
+
+    The unedited sub-projects of template instances don't have records, so
+        aren't reported missing, and records in instances aren't checked
+        against their templates.
+
+    '''
+    root_file = os.path.join(path, name + codec.EXTENSION)
+    listings = scan(path, name)
+    if not listings or not listings[path][0]:
+        return [_problem(MISSING_ROOT, root_file, 'root record not found')]
+
+    tasks = []
+    for directory, listing in listings.items():
+        sub_listings = {record: listings.get(os.path.join(directory, record))
+                        for record in listing[0]}
+        tasks.append((directory, listing, sub_listings))
+    chunks = [tasks[index:index + CHUNK]
+              for index in range(0, len(tasks), CHUNK)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) == 1:
+        results = list(map(_check_chunk, chunks))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_check_chunk, chunks))
+    return _outside_instances(
+            [problem for problems, instances in results
+             for problem in problems],
+            [instance for problems, instances in results
+             for instance in instances], path)
+
+
+def repair(problems, path):
+    ''' Apply the repairs of 'problems' found in the tree saved in 'path'.
+
+    Returns the list of problems repaired.
+
+    '''
+    repaired = []
+    edits = {} # record filename -> [(key, name) to drop]
+    for problem in problems:
+        action = problem['repair']
+        target = problem['path']
+        if action == DROP:
+            drops = edits.setdefault(problem['record'], [])
+            if problem['problem'] != DUPLICATE_SUB_PROJECT: # just deduplicated
+                drops.append((problem['key'], problem['name']))
+            continue
+        if action == CREATE:
+            if not os.path.exists(target):
+                # adopting the sub-projects left in its directory
+                listing = _list_directory(target[:-len(codec.EXTENSION)])
+                _write(target, codec.format_record({'version': 1,
+                        'sub_projects': sorted(listing[0]) if listing else []}))
+        elif action == LOST:
+            destination = os.path.join(path, LOST_FOUND,
+                                       os.path.relpath(target, path))
+            if os.path.exists(target):
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                # keep anything moved there by an earlier repair
+                suffix, count = '', 0
+                while os.path.lexists(destination + suffix):
+                    count += 1
+                    suffix = '.{}'.format(count)
+                os.replace(target, destination + suffix)
+        elif action == REPLAY:
+            Batch.recover(os.path.dirname(target))
+        elif action == DELETE:
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            elif os.path.exists(target):
+                os.remove(target)
+        else:
+            continue
+        repaired.append(problem)
+
+    for filename, drops in edits.items():
+        directory = os.path.dirname(filename)
+        with FileLock(directory):
+            record, error = _read_record(filename)
+            if error:
+                continue
+            drops = set(drops)
+            for key in ('sub_projects', 'precursors'):
+                # also drops duplicates, keeping the first
+                record[key] = [name for name in
+                               dict.fromkeys(record.get(key, []))
+                               if (key, name) not in drops]
+            # a new version, so live Projects see the change as external
+            record['version'] = record.get('version', 0) + 1
+            _write(filename, codec.format_record(record))
+        repaired.extend(problem for problem in problems
+                        if problem.get('record') == filename)
+    return repaired
+
+
+def _write(filename, data):
+    ''' Atomically replace 'filename' with 'data'. '''
+    temp_file = filename + '.fsck' + TEMP_SUFFIX
+    with open(temp_file, 'w') as output:
+        output.write(data)
+    os.replace(temp_file, filename)
+
+
+def main(args):
+    ''' Check (and repair) a tree as specified by command line 'args'. '''
+    if '--help' in args:
+        print(__doc__)
+        return 0
+    repairing = '--repair' in args
+    if repairing:
+        args.remove('--repair')
+    workers = None
+    if '--workers' in args:
+        index = args.index('--workers')
+        workers = int(args[index + 1])
+        del args[index:index + 2]
+    name = args[0] if args else '_main'
+    path = args[1] if len(args) > 1 else 'projects'
+
+    problems = check(path, name, workers)
+    repaired = []
+    if repairing:
+        repaired = repair(problems, path)
+    repaired_ids = {id(problem) for problem in repaired}
+    for problem in problems:
+        if repairing:
+            problem['repaired'] = id(problem) in repaired_ids
+        print(json.dumps(problem))
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
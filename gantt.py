@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+
+''' A Gantt chart of a Project tree, drawn on a viewport-culled tk.Canvas. '''
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import timedelta
+from low_level_elements import tk
+
+Row = namedtuple('Row', 'project depth start finish')
+Row.__doc__ = ''' A chart row, with 'start' and 'finish' as hours from the
+    chart origin, or None if the Project has no dates to draw. '''
+
+
+class GanttLayout(object):
+    ''' The rows and precursor edges of a Gantt chart, with viewport queries.
+
+    Rows are the Projects of the tree in depth-first order. Bar dates come
+        from a LevelingScheduler's plan where available, otherwise from the
+        stored dates: a bar finishes at the completion date if complete, or
+        else the due date, and starts 'duration' before that.
+
+    '''
+    HOUR = timedelta(hours=1)
+
+    def __init__(self, root, scheduler=None, show_complete=True):
+        ''' Lay out 'root's tree, optionally planned by 'scheduler'. '''
+        self.root = root
+        planned = {}
+        if scheduler:
+            for bar in scheduler.plan():
+                planned[id(bar.project)] = (bar.start, bar.finish)
+
+        spans = []; projects = []
+        remaining = [(project, 0) for project
+                     in reversed(list(root.sub_projects.values()))]
+        while remaining:
+            project, depth = remaining.pop()
+            if project.complete and not show_complete:
+                continue
+            projects.append((project, depth))
+            spans.append(planned.get(id(project)) or
+                         self._stored_span(project))
+            remaining.extend((sub_project, depth + 1) for sub_project
+                             in reversed(list(project.sub_projects.values())))
+
+        starts = [span[0] for span in spans if span]
+        self.origin = min(starts) if starts else None
+        self.rows = []
+        for (project, depth), span in zip(projects, spans):
+            if span:
+                span = tuple((date - self.origin) / self.HOUR
+                             for date in span)
+            self.rows.append(Row(project, depth, *(span or (None, None))))
+        self.end = max((row.finish for row in self.rows if row.finish
+                        is not None), default=0)
+
+        # precursor edges, as (from row, to row), sorted by their upper row
+        row_of = {id(row.project): index
+                  for index, row in enumerate(self.rows)}
+        edges = []
+        for index, row in enumerate(self.rows):
+            for precursor in row.project.precursors.values():
+                if id(precursor) in row_of:
+                    edges.append((row_of[id(precursor)], index))
+        self.edges = sorted(edges, key=lambda edge: min(edge))
+        self._edge_tops = [min(edge) for edge in self.edges]
+        self._max_edge_span = max((abs(a - b) for a, b in edges), default=0)
+
+    @classmethod
+    def _stored_span(cls, project):
+        ''' Return the stored (start, finish) datetimes of 'project', or None.
+        '''
+        finish = project.completion_date if project.complete else \
+                project.due_date
+        if finish is None:
+            return None
+        return finish - (project.duration or timedelta()), finish
+
+    def visible_rows(self, first, last):
+        ''' Return the indices of rows 'first' to 'last' which exist. '''
+        return range(max(first, 0), min(last + 1, len(self.rows)))
+
+    def visible_edges(self, first, last):
+        ''' Return the edges with a row between 'first' and 'last', or which
+            pass through those rows.
+        '''
+        start = bisect_left(self._edge_tops, first - self._max_edge_span)
+        stop = bisect_right(self._edge_tops, last)
+        return [edge for edge in self.edges[start:stop]
+                if max(edge) >= first]
+
+
+class _ItemPool(object):
+    ''' A pool of recyclable canvas items of one type. '''
+    def __init__(self, canvas, create):
+        ''' 'create' is called with 'canvas' to create a new item. '''
+        self._canvas = canvas
+        self._create = create
+        self._items  = []
+        self._used   = 0
+
+    def reset(self):
+        ''' Start reusing the pool's items from the first. '''
+        self._used = 0
+
+    def acquire(self):
+        ''' Return the id of the next unused item, creating one if needed. '''
+        if self._used == len(self._items):
+            self._items.append(self._create(self._canvas))
+        item = self._items[self._used]
+        self._used += 1
+        return item
+
+    def hide_unused(self):
+        ''' Hide the items not acquired since the last reset. '''
+        for item in self._items[self._used:]:
+            self._canvas.itemconfigure(item, state='hidden')
+
+
+class GanttChart(tk.Frame):
+    ''' A Gantt chart of a Project tree, with precursor arrows.
+
+    Only the rows and time range inside the viewport are drawn. Canvas items
+        are pooled and recycled on every redraw, so the number of items is
+        bounded by the viewport rather than the tree, and charts of thousands
+        of Projects pan and zoom smoothly.
+
+    Scroll with the mouse wheel (horizontally with Shift), zoom with Control
+        and the mouse wheel, or drag to pan.
+
+    '''
+    ROW_HEIGHT    = 22
+    BAR_HEIGHT    = 14
+    LABEL_WIDTH   = 200
+    HEADER_HEIGHT = 24
+    INDENT        = 12
+    MIN_SCALE, MAX_SCALE = 0.05, 200 # pixels per hour
+    BAR_FILL      = '#6699cc'
+    COMPLETE_FILL = '#88bb88'
+    ARROW_FILL    = '#888888'
+    TICK_HOURS    = (1, 3, 6, 12, 24, 24*7, 24*30, 24*365) # tick intervals
+
+    def __init__(self, master, root, scheduler=None, show_complete=True,
+                 **kwargs):
+        ''' Create a chart of 'root's tree, optionally planned by
+            'scheduler' (e.g. a LevelingScheduler).
+        '''
+        super().__init__(master, **kwargs)
+        self._master = master
+        self._project = root
+        self._scheduler = scheduler
+        self._show_complete = show_complete
+        self._canvas = tk.Canvas(self, bg='white', highlightthickness=0)
+        self._xscroll = tk.Scrollbar(self, orient='horizontal',
+                                     command=self._xview)
+        self._yscroll = tk.Scrollbar(self, orient='vertical',
+                                     command=self._yview)
+        self._canvas.grid(row=0, column=0, sticky='nsew')
+        self._yscroll.grid(row=0, column=1, sticky='ns')
+        self._xscroll.grid(row=1, column=0, sticky='ew')
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        canvas = self._canvas
+        # items are tagged with their pool name, for stacking
+        self._pools = {
+            'bar': _ItemPool(canvas, lambda c: c.create_rectangle(
+                0, 0, 0, 0, outline='', tags='bar')),
+            'arrow': _ItemPool(canvas, lambda c: c.create_line(
+                0, 0, 0, 0, arrow=tk.LAST, fill=self.ARROW_FILL,
+                tags='arrow')),
+            'label': _ItemPool(canvas, lambda c: c.create_text(
+                0, 0, anchor='w', tags='label')),
+            'tick': _ItemPool(canvas, lambda c: c.create_line(
+                0, 0, 0, 0, fill='#dddddd', tags='tick')),
+            'tick_label': _ItemPool(canvas, lambda c: c.create_text(
+                0, 0, anchor='nw', fill='#555555', tags='tick_label')),
+        }
+        self._gutter = canvas.create_rectangle(0, 0, 0, 0, fill='#f4f4f4',
+                                               outline='')
+        self._header = canvas.create_rectangle(0, 0, 0, 0, fill='#f4f4f4',
+                                               outline='')
+        self._redraw_pending = False
+        self._drag = None
+
+        self._add_bindings()
+        self.refresh()
+
+    def _add_bindings(self):
+        ''' Add scroll, zoom, drag and resize bindings to the canvas. '''
+        canvas = self._canvas
+        canvas.bind('<Configure>', lambda event: self._schedule_redraw())
+        canvas.bind('<MouseWheel>', lambda event: self._scroll_rows(
+                -event.delta / 120 * 3))
+        canvas.bind('<Shift-MouseWheel>', lambda event: self._scroll_hours(
+                -event.delta / 120 * 50 / self._scale))
+        canvas.bind('<Control-MouseWheel>', lambda event: self.zoom(
+                1.25 if event.delta > 0 else 0.8, event.x))
+        # X11 reports the wheel as buttons 4 and 5
+        canvas.bind('<Button-4>', lambda event: self._scroll_rows(-3))
+        canvas.bind('<Button-5>', lambda event: self._scroll_rows(3))
+        canvas.bind('<Control-Button-4>', lambda event: self.zoom(1.25,
+                                                                  event.x))
+        canvas.bind('<Control-Button-5>', lambda event: self.zoom(0.8,
+                                                                  event.x))
+        canvas.bind('<ButtonPress-1>', self._start_drag)
+        canvas.bind('<B1-Motion>', self._continue_drag)
+
+    def refresh(self):
+        ''' Reload the rows from the tree (and plan), and redraw. '''
+        try:
+            self._layout = GanttLayout(self._project, self._scheduler,
+                                       self._show_complete)
+        except ValueError:
+            # unschedulable (e.g. a precursor cycle), so use stored dates
+            self._layout = GanttLayout(self._project, None,
+                                       self._show_complete)
+        self._top_row = 0    # fractional row at the top of the viewport
+        self._left_hour = 0  # hours from the origin at the left of the chart
+        self._scale = 4      # pixels per hour
+        self._schedule_redraw()
+
+    def _schedule_redraw(self):
+        ''' Redraw when idle, coalescing bursts of scroll/zoom events. '''
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.after_idle(self._redraw)
+
+    # viewport geometry
+    def _chart_width(self):
+        return max(self._canvas.winfo_width() - self.LABEL_WIDTH, 1)
+
+    def _visible_row_count(self):
+        return max((self._canvas.winfo_height() - self.HEADER_HEIGHT)
+                   // self.ROW_HEIGHT, 1)
+
+    def _x(self, hours):
+        return self.LABEL_WIDTH + (hours - self._left_hour) * self._scale
+
+    def _y(self, row):
+        return self.HEADER_HEIGHT + (row - self._top_row + 0.5) * \
+                self.ROW_HEIGHT
+
+    def _redraw(self):
+        ''' Draw the rows, bars, arrows and time axis inside the viewport. '''
+        self._redraw_pending = False
+        canvas = self._canvas
+        layout = self._layout
+        width = canvas.winfo_width()
+        height = canvas.winfo_height()
+        for pool in self._pools.values():
+            pool.reset()
+
+        first = int(self._top_row)
+        last = first + self._visible_row_count()
+        left = self._left_hour
+        right = left + self._chart_width() / self._scale
+
+        self._draw_ticks(left, right, height)
+        for index in layout.visible_rows(first, last):
+            row = layout.rows[index]
+            y = self._y(index)
+            if row.start is not None and row.finish >= left and \
+               row.start <= right:
+                bar = self._pools['bar'].acquire()
+                canvas.coords(bar,
+                        max(self._x(row.start), self.LABEL_WIDTH), y -
+                        self.BAR_HEIGHT / 2, max(self._x(row.finish),
+                        self._x(row.start) + 2), y + self.BAR_HEIGHT / 2)
+                canvas.itemconfigure(bar, state='normal',
+                        fill=self.COMPLETE_FILL if row.project.complete
+                        else self.BAR_FILL)
+
+        for from_row, to_row in layout.visible_edges(first, last):
+            start = layout.rows[from_row].finish
+            finish = layout.rows[to_row].start
+            if start is None or finish is None or \
+               max(start, finish) < left or min(start, finish) > right:
+                continue
+            arrow = self._pools['arrow'].acquire()
+            x0, x1 = self._x(start), self._x(finish)
+            canvas.coords(arrow, x0, self._y(from_row), x0 + 6,
+                          self._y(from_row), x0 + 6, self._y(to_row), x1,
+                          self._y(to_row))
+            canvas.itemconfigure(arrow, state='normal')
+
+        canvas.coords(self._gutter, 0, 0, self.LABEL_WIDTH, height)
+        canvas.coords(self._header, 0, 0, width, self.HEADER_HEIGHT)
+        for index in layout.visible_rows(first, last):
+            row = layout.rows[index]
+            label = self._pools['label'].acquire()
+            canvas.coords(label, 4 + row.depth * self.INDENT, self._y(index))
+            canvas.itemconfigure(label, state='normal', text=row.project.name)
+
+        for pool in self._pools.values():
+            pool.hide_unused()
+        # gridlines below the chart, gutter and header over it, then labels
+        if canvas.find_withtag('tick'):
+            canvas.tag_lower('tick')
+        for item in (self._gutter, self._header, 'label', 'tick_label'):
+            if canvas.find_withtag(item):
+                canvas.tag_raise(item)
+        self._update_scrollbars()
+
+    def _draw_ticks(self, left, right, height):
+        ''' Draw time axis gridlines and labels between hours 'left' and
+            'right' of the origin.
+        '''
+        if self._layout.origin is None:
+            return
+        # the smallest interval with at least 80 pixels between ticks
+        interval = next((hours for hours in self.TICK_HOURS
+                         if hours * self._scale >= 80), self.TICK_HOURS[-1])
+        fmt = '%d/%b %H:%M' if interval < 24 else '%d/%b/%Y'
+        tick = (left // interval) * interval
+        while tick <= right:
+            if tick >= left:
+                x = self._x(tick)
+                line = self._pools['tick'].acquire()
+                self._canvas.coords(line, x, self.HEADER_HEIGHT, x, height)
+                self._canvas.itemconfigure(line, state='normal')
+                text = self._pools['tick_label'].acquire()
+                date = self._layout.origin + tick * GanttLayout.HOUR
+                self._canvas.coords(text, x + 2, 4)
+                self._canvas.itemconfigure(text, state='normal',
+                                           text=date.strftime(fmt))
+            tick += interval
+
+    # scrolling and zooming
+    def _scroll_rows(self, rows):
+        self._set_view(self._top_row + rows, self._left_hour)
+
+    def _scroll_hours(self, hours):
+        self._set_view(self._top_row, self._left_hour + hours)
+
+    def _set_view(self, top_row, left_hour):
+        ''' Move the viewport, clamped to the chart's extent. '''
+        max_row = max(len(self._layout.rows) - self._visible_row_count(), 0)
+        self._top_row = min(max(top_row, 0), max_row)
+        visible_hours = self._chart_width() / self._scale
+        self._left_hour = min(max(left_hour, 0),
+                              max(self._layout.end - visible_hours, 0))
+        self._schedule_redraw()
+
+    def zoom(self, factor, x=None):
+        ''' Zoom the time axis by 'factor', keeping the hour at canvas
+            x-coordinate 'x' (default the chart's centre) in place.
+        '''
+        if x is None or x < self.LABEL_WIDTH:
+            x = self.LABEL_WIDTH + self._chart_width() / 2
+        hour = self._left_hour + (x - self.LABEL_WIDTH) / self._scale
+        self._scale = min(max(self._scale * factor, self.MIN_SCALE),
+                          self.MAX_SCALE)
+        self._set_view(self._top_row,
+                       hour - (x - self.LABEL_WIDTH) / self._scale)
+
+    def _start_drag(self, event):
+        self._drag = (event.x, event.y, self._left_hour, self._top_row)
+
+    def _continue_drag(self, event):
+        x, y, left_hour, top_row = self._drag
+        self._set_view(top_row - (event.y - y) / self.ROW_HEIGHT,
+                       left_hour - (event.x - x) / self._scale)
+
+    def _xview(self, *args):
+        ''' Scrollbar command for the time axis. '''
+        visible = self._chart_width() / self._scale
+        total = max(self._layout.end, visible)
+        if args[0] == 'moveto':
+            self._set_view(self._top_row, float(args[1]) * total)
+        else: # 'scroll', number, 'units' or 'pages'
+            step = visible if args[2] == 'pages' else visible / 10
+            self._scroll_hours(int(args[1]) * step)
+
+    def _yview(self, *args):
+        ''' Scrollbar command for the rows. '''
+        visible = self._visible_row_count()
+        total = max(len(self._layout.rows), visible)
+        if args[0] == 'moveto':
+            self._set_view(float(args[1]) * total, self._left_hour)
+        else:
+            step = visible if args[2] == 'pages' else 1
+            self._scroll_rows(int(args[1]) * step)
+
+    def _update_scrollbars(self):
+        visible_rows = self._visible_row_count()
+        total_rows = max(len(self._layout.rows), visible_rows)
+        self._yscroll.set(self._top_row / total_rows,
+                          (self._top_row + visible_rows) / total_rows)
+        visible_hours = self._chart_width() / self._scale
+        total_hours = max(self._layout.end, visible_hours)
+        self._xscroll.set(self._left_hour / total_hours,
+                          (self._left_hour + visible_hours) / total_hours)
@@ -1,6 +1,12 @@
 #!/usr/bin/env python3
 
 from project import Project
+from instrumentation import Instrumentation
+from gui_profiler import GuiProfiler
+from scheduler import LevelingScheduler
+from gantt import GanttChart
+from search import SearchIndex
+from history import History
 from gui_elements import *
 
 class MainView(ProjectViewBase):
@@ -14,8 +20,13 @@ class MainView(ProjectViewBase):
         ''' Create and set up the view elements. '''
         super().__init__(master, main_project, **kwargs)
         self._root_project = self._project
+        self._search_index = None # built on first search, then follows tree
+        self._history = History(main_project)
 
         self._create_display()
+        toplevel = self.winfo_toplevel()
+        toplevel.bind('<Control-z>', self._undo_binding)
+        toplevel.bind('<Control-y>', self._redo_binding)
 
     def _create_display(self):
         ''' Create the main display elements. '''
@@ -30,6 +41,12 @@ class MainView(ProjectViewBase):
         self._unordered_display = ProjectsDisplay(self, unordered,
                 display_bindings, 'to do', **display)
         self._project_editor = ProjectEditor(self, editor_bindings, **display)
+        self._gantt_button = BetterButton(self, text='Gantt chart',
+                                          command=self._open_gantt)
+        self._search_box = SearchBox(self, {
+            SEARCH_BIND: self._search_binding,
+            SELECT_BIND: self._select_binding,
+        }, **display)
 
         # expansion
         #self.grid_rowconfigure(0, weight=1)
@@ -40,6 +57,8 @@ class MainView(ProjectViewBase):
         self._planned_display.grid(row=0, column=0, rowspan=2, sticky='news')
         self._unordered_display.grid(row=0, column=1, sticky='news')
         self._project_editor.grid(row=1, column=1, sticky='news')
+        self._gantt_button.grid(row=2, column=0, sticky='ew')
+        self._search_box.grid(row=2, column=1, sticky='news')
 
         # post setup
         self._focus_view = self
@@ -109,6 +128,55 @@ class MainView(ProjectViewBase):
             self._project_editor.set_add_mode(project.name)
         # else MOVE_MODE, so no need to update editor
 
+    def _open_gantt(self, event=None):
+        ''' Open a Gantt chart of the root project in a new window. '''
+        window = tk.Toplevel(self)
+        window.title('Gantt chart')
+        chart = GanttChart(window, self._root_project,
+                           LevelingScheduler(self._root_project))
+        chart.grid(sticky='nsew')
+        window.rowconfigure(0, weight=1)
+        window.columnconfigure(0, weight=1)
+        window.geometry('900x500')
+
+    def _search_binding(self, query):
+        ''' The binding used to search for Projects matching 'query'. '''
+        if self._search_index is None:
+            self._search_index = SearchIndex(self._root_project)
+        return self._search_index.search(query, SearchBox.MAX_RESULTS)
+
+    def _select_binding(self, project):
+        ''' The binding used to focus on a selected search result. '''
+        view = self._find_view(project)
+        if view is not None:
+            self._set_focus(view, mode=self.EDIT_MODE)
+
+    def _find_view(self, project):
+        ''' Return the ProjectView of 'project', expanding its ancestors'
+            views to show it, or None if it isn't displayed.
+        '''
+        ancestors = []
+        while project is not None and project is not self._root_project:
+            ancestors.append(project)
+            project = project._parent
+        if project is None:
+            return None # not in this tree
+
+        view = None
+        displays = [self._planned_display, self._unordered_display]
+        for ancestor in reversed(ancestors):
+            if view is not None:
+                if not hasattr(view, '_sub_projects'):
+                    return None
+                view.maximise()
+                displays = [view._sub_projects]
+            view = next((project_view for display in displays
+                         for project_view in display._project_views
+                         if project_view._project is ancestor), None)
+            if view is None:
+                return None
+        return view
+
     def _focus_binding(self, project_view):
         ''' The binding used to set focus to a given project. '''
         self._set_focus(project_view, mode=self.EDIT_MODE)
@@ -154,10 +222,11 @@ class MainView(ProjectViewBase):
                 self._set_focus(project_view)
 
             self._project_editor.clear()
+            self._history.checkpoint('add')
 
         else: # mode == self.EDIT_MODE
             self._focus_view.update_project(**submission)
-
+            self._history.checkpoint('edit')
 
     def _delete_binding(self, event=None):
         ''' The binding used to delete the in-focus ProjectView. '''
@@ -179,6 +248,24 @@ class MainView(ProjectViewBase):
                 self._planned_display.remove_project_view(parent_view))
         # set focus back to parent of deleted project
         self._set_focus(parent_view)
+        self._history.checkpoint('delete')
+
+    def _undo_binding(self, event=None):
+        ''' The binding used to undo the last change to the Projects. '''
+        if self._history.undo():
+            self._reset_display()
+
+    def _redo_binding(self, event=None):
+        ''' The binding used to redo the last undone change. '''
+        if self._history.redo():
+            self._reset_display()
+
+    def _reset_display(self):
+        ''' Recreate the display elements, after the Projects were restored.
+        '''
+        for widget in self.winfo_children():
+            widget.destroy()
+        self._create_display()
 
     def add_sub_project(self, project):
         ''' Adds the given project to the relevant side of the display. '''
@@ -199,15 +286,41 @@ class MainView(ProjectViewBase):
 
 class Controller(object):
     ''' The controller, to load the project and initialise and run the GUI. '''
-    def __init__(self, **kwargs):
-        ''' Creates a Tk window with a MainView display of the Project. '''
+    def __init__(self, profile=False, profile_gui=False, **kwargs):
+        ''' Creates a Tk window with a MainView display of the Project.
+
+        If 'profile' is True, Project operations are instrumented for the
+            session, and a hot-path report is printed on exit.
+        If 'profile_gui' is True, GUI bindings and the event loop's latency
+            are profiled for the session, shown live in an overlay window, and
+            a report of the slowest interactions is printed on exit.
+
+        '''
+        self._stats = Instrumentation()
+        if profile:
+            self._stats.enable()
+        self._gui_stats = GuiProfiler(MainView)
+        if profile_gui:
+            self._gui_stats.enable()
+
         self._root = tk.Tk()
         self._project = Project(MAIN_NAME)
         self._view = MainView(self._root, self._project, **kwargs)
         self._view.grid(sticky='nsew')
+        if profile_gui:
+            self._gui_stats.start_probe(self._root, overlay=True)
 
         self._root.mainloop()
 
+        if profile:
+            self._stats.disable()
+            self._stats.print_report()
+        if profile_gui:
+            self._gui_stats.disable()
+            self._gui_stats.print_report()
+
 
 if __name__ == '__main__':
-    Controller()
+    import sys
+    Controller(profile='--profile' in sys.argv,
+               profile_gui='--profile-gui' in sys.argv)
@@ -13,6 +13,7 @@ else:
     CTRL = lambda key: '<Control-{}>'.format(key)
 
 HEADING_FONT = ('Helvetica', 16, 'bold')
+CHOKE_POINT_FG = '#cc5500' # name colour of incomplete choke point Projects
 
 MAIN_NAME = '_main' # the intended project to run from
 
@@ -24,6 +25,8 @@ DELETE_BIND  = 'delete'
 SUBMIT_BIND  = 'submit'
 RESTORE_BIND = 'restore'
 SCROLL_BIND  = 'scroll' # TODO propagate
+SELECT_BIND  = 'select'
+SEARCH_BIND  = 'search'
 
 
 class ProjectViewBase(tk.Frame):
@@ -190,9 +193,17 @@ class ProjectView(ProjectViewBase):
 
     def update_name_not_complete(self):
         ''' Update name because project marked as incomplete. '''
-        self._name.config(fg=self._the_og_fg)
+        self._name.config(fg=CHOKE_POINT_FG if self._is_choke_point()
+                          else self._the_og_fg)
         self._name.bind('<Double-Button-1>', self.complete)
 
+    def _is_choke_point(self):
+        ''' Returns True if the Project is a choke point to highlight. '''
+        try:
+            return self._project.is_choke_point()
+        except ValueError:
+            return False # precursor cycle, so no meaningful analysis
+
     def complete(self, event=None):
         ''' Binding for completion of the Project. '''
         self._project.set_complete()
@@ -201,8 +212,7 @@ class ProjectView(ProjectViewBase):
 
     def remove_complete(self, event=None):
         ''' Remove complete status from Project. '''
-        self._project.complete = False
-        self._project.completion_date = None
+        self._project.set_incomplete()
         self._save_update()
         self.update_name_not_complete()
 
@@ -312,6 +322,75 @@ class ProjectsDisplay(tk.Frame):
         return len(self._project_views)
 
 
+class SearchBox(tk.Frame):
+    ''' An incremental search entry, listing the matching Projects.
+
+    Results are updated on each keystroke. Pressing Enter, or double-clicking
+        a result, selects it.
+
+    '''
+    MAX_RESULTS = 10
+
+    def __init__(self, master, bindings, **kwargs):
+        ''' Create a SearchBox widget within master.
+
+        'bindings' is a dictionary of SEARCH_BIND -> function returning a list
+            of Projects matching a query string, and SELECT_BIND -> function
+            called with the selected Project.
+
+        '''
+        super().__init__(master, **kwargs)
+        self._master = master
+        self._bindings = bindings
+        self._query = ''
+        self._results = []
+
+        self._entry = LabelEntry(self, label_kwargs=dict(text='Search'))
+        self._list = tk.Listbox(self, height=0, activestyle='none')
+        self.columnconfigure(1, weight=1)
+
+        self._entry.bind('<KeyRelease>', self._update_results)
+        self._entry.bind('<Return>', lambda event: self._select(0))
+        self._entry.bind('<Down>', lambda event: self._list.focus_set())
+        self._entry.bind('<Escape>', self.clear)
+        self._list.bind('<Double-Button-1>', lambda event: self._select(
+                self._list.nearest(event.y)))
+        self._list.bind('<Return>', lambda event: self._select(
+                self._list.index(tk.ACTIVE)))
+
+    def _update_results(self, event=None):
+        ''' Search for the current query, if it changed. '''
+        query = self._entry.get()
+        if query == self._query:
+            return
+        self._query = query
+        self._results = self._bindings[SEARCH_BIND](query)[:self.MAX_RESULTS]
+        self._list.delete(0, tk.END)
+        for project in self._results:
+            parent = project._parent
+            if parent and parent._parent:
+                self._list.insert(tk.END, '{} (in {})'.format(project.name,
+                                                             parent.name))
+            else:
+                self._list.insert(tk.END, project.name)
+        if self._results:
+            self._list.config(height=len(self._results))
+            self._list.grid(row=1, column=0, columnspan=2, sticky='ew')
+        else:
+            self._list.grid_remove()
+
+    def _select(self, index):
+        ''' Select the result at 'index', if it exists. '''
+        if 0 <= index < len(self._results):
+            self._bindings[SELECT_BIND](self._results[index])
+            self.clear()
+
+    def clear(self, event=None):
+        ''' Clear the query and results. '''
+        self._entry.clear()
+        self._update_results()
+
+
 class ProjectEditor(tk.Frame):
     ''' A widget to edit and create Project instances. '''
     # title formats
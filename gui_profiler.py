@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+import heapq
+import tkinter as tk
+from collections import deque
+from time import perf_counter
+from functools import wraps
+from gui_elements import ProjectEditor
+
+
+class GuiProfiler(object):
+    ''' Opt-in timers for GUI bindings, and an event loop latency monitor.
+
+    While disabled, the GUI classes and tkinter are left untouched, so there
+    is no overhead. Enabling temporarily wraps the binding callbacks returned
+    by the view's _get_bindings, every callback bound with bind or bind_all
+    (e.g. by ProjectView._add_bindings and ScrollableFrame), and the focus and
+    editor refresh methods, timing each call. It must be enabled before the
+    view is created, as callbacks bound earlier aren't timed.
+
+    A periodic 'after' probe measures how late the event loop runs it, which
+    is how long the GUI was unresponsive. The slowest interactions (outermost
+    callbacks) are kept, and can be shown live in an overlay window:
+
+        profiler = GuiProfiler(MainView)
+        profiler.enable()
+        root = tk.Tk()
+        view = MainView(root, project)
+        profiler.start_probe(root, overlay=True)
+        root.mainloop()
+        profiler.disable()
+        profiler.print_report()
+
+    '''
+    # methods timed, by class attribute name of the profiled class
+    METHODS = {
+        '_view_cls'   : ('_set_focus',),
+        '_editor_cls' : ('set_edit_mode', 'set_add_mode'),
+    }
+    BINDING_PREFIX   = 'binding:'
+    PROBE_INTERVAL   = 50   # ms between event loop latency probes
+    OVERLAY_INTERVAL = 0.5  # seconds between overlay updates
+    LATENCY_SAMPLES  = 2000 # most recent probe latencies kept
+    SLOWEST          = 10   # slowest interactions kept
+    SLOW             = 0.1  # seconds, noticeably sluggish interactions
+
+    def __init__(self, view_cls, editor_cls=ProjectEditor):
+        ''' Create a disabled profiler for 'view_cls' (e.g. MainView) and its
+            'editor_cls'.
+        '''
+        self._view_cls   = view_cls
+        self._editor_cls = editor_cls
+        self._originals  = {} # (owner, name) -> original attribute
+        self._widget     = None # probed widget
+        self._after_id   = None
+        self._overlay    = None
+        self.reset()
+
+    def reset(self):
+        ''' Clear all accumulated timings and latencies. '''
+        self._calls     = {}
+        self._times     = {}
+        self._maxima    = {}
+        self._depths    = {}
+        self._depth     = 0 # of nested timed callbacks, for interactions
+        self._start     = perf_counter()
+        self._slowest   = [] # heap of (duration, index, key, time)
+        self._index     = 0
+        self.slow_interactions = 0
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self.max_latency = 0
+
+    @property
+    def enabled(self):
+        ''' Returns True if currently profiling. '''
+        return bool(self._originals)
+
+    def enable(self):
+        ''' Start profiling by wrapping the bindings and relevant methods. '''
+        if self.enabled:
+            return
+        for attr, names in self.METHODS.items():
+            cls = getattr(self, attr)
+            for name in names:
+                self._replace(cls, name, self._wrap(getattr(cls, name),
+                        '{}.{}'.format(cls.__name__, name)))
+        self._replace(self._view_cls, '_get_bindings',
+                      self._wrap_get_bindings(self._view_cls._get_bindings))
+        for name in ('bind', 'bind_all'):
+            self._replace(tk.Misc, name, self._wrap_bind(getattr(tk.Misc,
+                                                                 name)))
+
+    def disable(self):
+        ''' Stop profiling, restoring the original methods and stopping the
+            probe. Callbacks already bound are left wrapped, but untimed.
+        '''
+        for (owner, name), attr in self._originals.items():
+            setattr(owner, name, attr)
+        self._originals = {}
+        self.stop_probe()
+
+    def _replace(self, owner, name, wrapper):
+        ''' Replace attribute 'name' of 'owner' with 'wrapper', until
+            disabled.
+        '''
+        self._originals[(owner, name)] = owner.__dict__[name]
+        setattr(owner, name, wrapper)
+
+    def _wrap(self, func, key):
+        ''' Return 'func' wrapped to count and time calls under 'key'. '''
+        @wraps(func)
+        def func_wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            # only time the outermost call of recursive callbacks
+            depth = self._depths.get(key, 0)
+            self._depths[key] = depth + 1
+            self._depth += 1
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                duration = perf_counter() - start
+                self._depths[key] = depth
+                self._depth -= 1
+                self._calls[key] = self._calls.get(key, 0) + 1
+                if not depth:
+                    self._times[key] = self._times.get(key, 0) + duration
+                    self._maxima[key] = max(self._maxima.get(key, 0),
+                                            duration)
+                if not self._depth:
+                    self._interaction(key, duration)
+        func_wrapper._profiled = True
+        return func_wrapper
+
+    def _wrap_get_bindings(self, get_bindings):
+        ''' Return 'get_bindings' wrapped to time the bindings it returns. '''
+        @wraps(get_bindings)
+        def func_wrapper(view):
+            results = get_bindings(view)
+            for bindings in results:
+                for key, callback in list(bindings.items()):
+                    bindings[key] = self._wrap(callback,
+                                               self.BINDING_PREFIX + key)
+            return results
+        return func_wrapper
+
+    def _wrap_bind(self, bind):
+        ''' Return tkinter's 'bind' (or 'bind_all') wrapped to time the
+            callbacks it binds.
+        '''
+        @wraps(bind)
+        def func_wrapper(widget, sequence=None, func=None, add=None):
+            if callable(func) and not getattr(func, '_profiled', False):
+                func = self._wrap(func, self._callback_key(func, sequence))
+            return bind(widget, sequence, func, add)
+        return func_wrapper
+
+    @staticmethod
+    def _callback_key(func, sequence):
+        ''' Return the key 'func' bound to 'sequence' is timed under, naming
+            lambdas by where they were defined.
+        '''
+        name = getattr(func, '__qualname__', type(func).__name__)
+        return '{} {}'.format(name.replace('.<locals>.<lambda>', ''),
+                              sequence)
+
+    def _interaction(self, key, duration):
+        ''' Record an outermost callback 'key' which took 'duration'. '''
+        if duration >= self.SLOW:
+            self.slow_interactions += 1
+        self._index += 1
+        entry = (duration, self._index, key, perf_counter() - self._start)
+        if len(self._slowest) < self.SLOWEST:
+            heapq.heappush(self._slowest, entry)
+        elif duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def start_probe(self, widget, overlay=False):
+        ''' Start probing the latency of the event loop of 'widget', showing
+            the live overlay if 'overlay'.
+        '''
+        self.stop_probe()
+        self._widget = widget
+        if overlay:
+            self._overlay = tk.Toplevel(widget)
+            self._overlay.title('GUI profiler')
+            self._overlay.attributes('-topmost', True)
+            self._overlay_label = tk.Label(self._overlay, justify=tk.LEFT,
+                                           font='TkFixedFont')
+            self._overlay_label.grid(sticky='nsew')
+        self._overlay_due = perf_counter()
+        self._schedule_probe()
+
+    def stop_probe(self):
+        ''' Stop probing and close the overlay, if open. '''
+        try:
+            if self._after_id is not None:
+                self._widget.after_cancel(self._after_id)
+            if self._overlay is not None:
+                self._overlay.destroy()
+        except tk.TclError:
+            pass # already destroyed with its window
+        self._after_id = None
+        self._overlay = None
+
+    def _schedule_probe(self):
+        self._probe_due = perf_counter() + self.PROBE_INTERVAL / 1000
+        self._after_id = self._widget.after(self.PROBE_INTERVAL, self._probe)
+
+    def _probe(self):
+        ''' Record how late the event loop ran this, and reschedule. '''
+        now = perf_counter()
+        latency = max(now - self._probe_due, 0)
+        self._latencies.append(latency)
+        self.max_latency = max(self.max_latency, latency)
+        if self._overlay is not None and now >= self._overlay_due:
+            self._overlay_due = now + self.OVERLAY_INTERVAL
+            self._overlay_label.config(text=self.report(limit=5))
+        self._schedule_probe()
+
+    def latency(self):
+        ''' Return a dictionary of the 'samples', 'mean', 95th percentile
+            'p95' and 'max' event loop latency in seconds.
+        '''
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return dict(samples=0, mean=0, p95=0, max=self.max_latency)
+        return dict(samples=len(latencies),
+                    mean=sum(latencies) / len(latencies),
+                    p95=latencies[int(0.95 * (len(latencies) - 1))],
+                    max=self.max_latency)
+
+    def snapshot(self):
+        ''' Return a dictionary of the current timings.
+
+        The 'callbacks' entry maps each callback key to a dictionary with its
+            number of 'calls', total 'time' and 'max' time in seconds.
+            'slowest' is a list of the slowest interactions as (key,
+            duration, seconds since reset) tuples, slowest first.
+
+        '''
+        return dict(
+            callbacks = {key: dict(calls=calls, time=self._times.get(key, 0),
+                                   max=self._maxima.get(key, 0))
+                         for key, calls in self._calls.items()},
+            slowest = [(key, duration, time) for duration, index, key, time
+                       in sorted(self._slowest, reverse=True)],
+            slow_interactions = self.slow_interactions,
+            latency = self.latency(),
+        )
+
+    def report(self, limit=None):
+        ''' Return a report string, slowest callbacks first. '''
+        snapshot = self.snapshot()
+        callbacks = sorted(snapshot['callbacks'].items(),
+                           key=lambda item: item[1]['time'], reverse=True)
+        lines = ['{:<48}{:>8}{:>12}{:>10}'.format('callback', 'calls',
+                                                  'time (ms)', 'max (ms)')]
+        for key, stats in callbacks[:limit]:
+            lines.append('{:<48}{:>8}{:>12.3f}{:>10.3f}'.format(key[:47],
+                    stats['calls'], stats['time'] * 1000, stats['max'] * 1000))
+        latency = snapshot['latency']
+        lines.append('event loop latency: {} samples, mean {:.1f} ms, '
+                     'p95 {:.1f} ms, max {:.1f} ms'.format(latency['samples'],
+                     latency['mean'] * 1000, latency['p95'] * 1000,
+                     latency['max'] * 1000))
+        lines.append('slowest interactions ({} over {:.0f} ms):'.format(
+                     snapshot['slow_interactions'], self.SLOW * 1000))
+        for key, duration, time in snapshot['slowest'][:limit]:
+            lines.append('  {:>10.3f} ms  {}  (at {:.1f} s)'.format(
+                         duration * 1000, key, time))
+        return '\n'.join(lines)
+
+    def print_report(self, limit=None):
+        ''' Print the report, with a trailing newline. '''
+        print(self.report(limit) + '\n')
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
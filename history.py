@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+''' Undo/redo history and named snapshots of a Project tree. '''
+
+from collections import namedtuple
+from project import ConflictError
+
+# an immutable version of a Project: its 'name', saved 'record' string (without
+#   a version stamp), and tuple of sub-project Node 'children'
+Node = namedtuple('Node', 'name record children')
+
+
+class History(object):
+    ''' An undo/redo history of the states of a Project tree.
+
+    Each version of the tree is a tree of immutable Nodes. Unchanged subtrees
+        share their Nodes between versions, so recording a version only
+        creates Nodes for the Projects changed since the last one and their
+        ancestors (path copying), and versions are compared by identity.
+        Projects hold their current Node, which is cleared up the parent chain
+        whenever they change, so changed paths are found without a full walk.
+        Each new Node copies the tuple of its Project's children though, so
+        recording costs the number of children along the changed paths, not
+        their depth: an edit under a root with many sub-projects copies all
+        of them.
+
+    Undoing, redoing and restoring rewrite the records of the Projects which
+        differ on disk (including deleted subtrees) in one batch, then reload
+        them in place. Projects removed by the change are dropped from the
+        tree, and any previously removed are loaded as new Project instances.
+        Records are rewritten as saves are, so if any has been changed by
+        another process since it was loaded or saved, a ConflictError is
+        raised and nothing is changed.
+
+    Snapshots are kept for the session only, like the history.
+
+    e.g.
+        history = History(main_project)
+        project.update_details('new details')
+        history.checkpoint('edit details')
+        history.undo()
+
+    '''
+    LIMIT = 100 # versions kept, including the current one
+
+    def __init__(self, root, limit=LIMIT):
+        ''' Create a history of the tree with root Project 'root', starting
+            with its current state.
+        '''
+        self.root       = root
+        self.limit      = limit
+        self._versions  = [] # (label, root Node), oldest first
+        self._index     = -1 # of the current version
+        self._snapshots = {} # name -> root Node
+        self.checkpoint('initial')
+
+    def _record(self, hints=None):
+        ''' Bring the tree's Nodes up to date, and return the root's.
+
+        'hints' is a dictionary of id(Project) -> Node, used instead of a new
+            Node for a Project it matches, e.g. the version being restored.
+
+        '''
+        hints = hints or {}
+        pending = [self.root]
+        while pending:
+            project = pending[-1]
+            if project._node is not None:
+                pending.pop()
+                continue
+            missing = [sub_project for sub_project
+                       in project.sub_projects.values()
+                       if sub_project._node is None]
+            if missing:
+                pending.extend(missing)
+                continue
+            pending.pop()
+            record = project._memoized('record', project._gen_record)
+            children = tuple(sub_project._node for sub_project
+                             in project.sub_projects.values())
+            hint = hints.get(id(project))
+            if hint is not None and hint.name == project.name and \
+               hint.record == record and len(hint.children) == \
+                    len(children) and all(hint_child is child for
+                    hint_child, child in zip(hint.children, children)):
+                project._node = hint
+            else:
+                project._node = Node(project.name, record, children)
+        return self.root._node
+
+    def checkpoint(self, label=None):
+        ''' Record the tree's current state as a version labelled 'label'.
+
+        Nothing is recorded if the tree is unchanged since the current
+            version. Otherwise any undone versions can no longer be redone.
+
+        Returns True if a version was recorded.
+
+        '''
+        node = self._record()
+        if self._versions and node is self._versions[self._index][1]:
+            return False
+        del self._versions[self._index + 1:]
+        self._versions.append((label, node))
+        del self._versions[:-self.limit]
+        self._index = len(self._versions) - 1
+        return True
+
+    @property
+    def can_undo(self):
+        return self._index > 0 or \
+                self.root._node is not self._versions[self._index][1]
+
+    @property
+    def can_redo(self):
+        return self._index + 1 < len(self._versions) and \
+                self.root._node is self._versions[self._index][1]
+
+    def labels(self):
+        ''' Return a tuple of (version labels, current version index). '''
+        return [label for label, node in self._versions], self._index
+
+    def undo(self):
+        ''' Restore the previous version, recording any changes since the
+            current one first. Returns True if there was one to restore.
+        '''
+        self.checkpoint()
+        if self._index == 0:
+            return False
+        self._apply(self._versions[self._index - 1][1])
+        self._index -= 1
+        return True
+
+    def redo(self):
+        ''' Restore the next (undone) version, if there is one and the tree
+            is unchanged since the current version. Returns True if restored.
+        '''
+        if self.checkpoint() or self._index + 1 == len(self._versions):
+            return False
+        self._apply(self._versions[self._index + 1][1])
+        self._index += 1
+        return True
+
+    def snapshot(self, name):
+        ''' Record the tree's current state, and keep it as snapshot 'name'.
+        '''
+        self.checkpoint(name)
+        self._snapshots[name] = self.root._node
+
+    def snapshots(self):
+        ''' Return a list of the names of the kept snapshots. '''
+        return list(self._snapshots)
+
+    def delete_snapshot(self, name):
+        ''' Forget snapshot 'name'. Raises a KeyError if there isn't one. '''
+        del self._snapshots[name]
+
+    def restore(self, name):
+        ''' Restore the tree to snapshot 'name', as a new (undoable) version.
+
+        Raises a KeyError if there is no snapshot called 'name', or a
+            ConflictError as for undo.
+
+        '''
+        node = self._snapshots[name]
+        self.checkpoint()
+        self._apply(node)
+        self.checkpoint('restore ' + name)
+
+    def _apply(self, target):
+        ''' Change the tree, on disk and in memory, to the version 'target'.
+
+        Raises a ConflictError, leaving the tree unchanged, if any record to be
+            rewritten has been changed by another process.
+
+        '''
+        root = self.root
+        reloads = [] # Projects with rewritten records, parents first
+        conflicts = []
+        with root.batch():
+            pending = [(root, target)]
+            while pending:
+                project, node = pending.pop()
+                if project._node is node:
+                    continue # identical subtrees
+                if project._node.record != node.record:
+                    # version checked like a save, restored on rollback
+                    project._record_state()
+                    project._version += 1
+                    try:
+                        project._write_record(project._save_file,
+                                project.VERSION_FORMAT.format(
+                                    project._version) + node.record)
+                    except ConflictError:
+                        conflicts.append(project)
+                    reloads.append(project)
+                children = {child.name for child in node.children}
+                for name, sub_project in project.sub_projects.items():
+                    if name not in children:
+                        self._remove_files(sub_project)
+                for child in node.children:
+                    sub_project = project.sub_projects.get(child.name)
+                    if sub_project is None:
+                        self._write_subtree(project._sub_project_path, child)
+                    else:
+                        pending.append((sub_project, child))
+            if conflicts:
+                raise ConflictError(conflicts) # discards the batch
+
+        # reload once the files are on disk, loading any restored subtrees
+        for project in reloads:
+            project._reload_record()
+
+        # match the Projects to 'target's Nodes, to share them (including any
+        #   recorded again since without changing)
+        hints = {}
+        changed = []
+        pending = [(root, target)]
+        while pending:
+            project, node = pending.pop()
+            if project._node is node:
+                continue
+            project._node = None
+            hints[id(project)] = node
+            changed.append(project)
+            children = {child.name: child for child in node.children}
+            pending.extend((sub_project, children[name]) for name, sub_project
+                           in project.sub_projects.items() if name in children)
+        self._record(hints)
+
+        root._write_sidecars(root._sidecars(changed))
+
+    def _remove_files(self, project):
+        ''' Remove the record and sub-project files of 'project'. '''
+        self.root._remove_path(project._save_file)
+        if self.root._isdir(project._sub_project_path):
+            self.root._remove_path(project._sub_project_path)
+
+    def _write_subtree(self, directory, node):
+        ''' Write the records of 'node's subtree into 'directory'. '''
+        version = self.root.VERSION_FORMAT.format(1)
+        pending = [(directory, node)]
+        while pending:
+            directory, node = pending.pop()
+            path = directory + '/' + node.name
+            if self.root._isdir(path):
+                self.root._remove_path(path) # stale
+            self.root._write_file(path + '.txt', version + node.record)
+            pending.extend((path, child) for child in node.children)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+from time import perf_counter
+from functools import wraps
+from project import Project
+
+
+class Instrumentation(object):
+    ''' Opt-in timers and I/O counters for Project operations.
+
+    While disabled, Project is left completely untouched, so there is no
+    overhead. Enabling temporarily wraps the Project methods which touch the
+    disk, parse or format records, save, or modify state, counting calls and
+    accumulating their run time.
+
+    Use as a context manager to instrument a block of code:
+
+        with Instrumentation() as stats:
+            project = Project(MAIN_NAME)
+            project.save(force=True)
+        stats.print_report()
+
+    '''
+    # method name -> counter key, for the non-modifier operations
+    OPERATIONS = {
+        '_read_file'       : 'read',
+        '_write_file'      : 'write',
+        '_parse_record'    : 'parse',
+        'save'             : 'save',
+        '_format_datetime' : 'format_datetime',
+        '_format_duration' : 'format_duration',
+        '_gen_save_string' : 'gen_save_string',
+    }
+    MODIFIER_PREFIX = 'modifier:'
+    _active = None # the currently enabled instance, if any
+
+    def __init__(self, cls=Project):
+        ''' Create a disabled instrumentation layer for 'cls'. '''
+        self._cls       = cls
+        self._originals = {}
+        self.reset()
+
+    def reset(self):
+        ''' Clear all accumulated counts and timings. '''
+        self._calls       = {}
+        self._times       = {}
+        self._depths      = {}
+        self.bytes_read    = 0
+        self.bytes_written = 0
+
+    @property
+    def enabled(self):
+        ''' Returns True if currently instrumenting. '''
+        return bool(self._originals)
+
+    def enable(self):
+        ''' Start instrumenting by wrapping the relevant methods. '''
+        if self.enabled:
+            return
+        if Instrumentation._active is not None:
+            raise Exception('Another Instrumentation is already enabled')
+        Instrumentation._active = self
+
+        for name, attr in list(vars(self._cls).items()):
+            func = getattr(attr, '__func__', attr)
+            if name in self.OPERATIONS:
+                key = self.OPERATIONS[name]
+            elif getattr(func, '_modifier', False):
+                key = self.MODIFIER_PREFIX + name
+            else:
+                continue
+            self._originals[name] = attr
+            wrapper = self._wrap(func, key)
+            if isinstance(attr, staticmethod):
+                wrapper = staticmethod(wrapper)
+            elif isinstance(attr, classmethod):
+                wrapper = classmethod(wrapper)
+            setattr(self._cls, name, wrapper)
+
+    def disable(self):
+        ''' Stop instrumenting, restoring the original methods. '''
+        for name, attr in self._originals.items():
+            setattr(self._cls, name, attr)
+        self._originals = {}
+        if Instrumentation._active is self:
+            Instrumentation._active = None
+
+    def _wrap(self, func, key):
+        ''' Return 'func' wrapped to count and time calls under 'key'. '''
+        if key == 'read':
+            measure = self._count_read
+        elif key == 'write':
+            measure = self._count_write
+        else:
+            measure = None
+
+        @wraps(func)
+        def func_wrapper(*args, **kwargs):
+            # only time the outermost call of recursive operations (e.g. save)
+            depth = self._depths.get(key, 0)
+            self._depths[key] = depth + 1
+            start = perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                self._depths[key] = depth
+                self._calls[key] = self._calls.get(key, 0) + 1
+                if not depth:
+                    self._times[key] = self._times.get(key, 0) + \
+                            perf_counter() - start
+            if measure:
+                measure(args, result)
+            return result
+        return func_wrapper
+
+    def _count_read(self, args, result):
+        self.bytes_read += len(result)
+
+    def _count_write(self, args, result):
+        self.bytes_written += len(args[-1])
+
+    @property
+    def file_opens(self):
+        ''' The number of files opened for reading or writing. '''
+        return self._calls.get('read', 0) + self._calls.get('write', 0)
+
+    def snapshot(self):
+        ''' Return a dictionary of the current counts and timings.
+
+        The 'operations' entry maps each operation key to a dictionary with
+            its number of 'calls' and total 'time' in seconds. Recursive
+            operations are only timed at their outermost call.
+
+        '''
+        return dict(
+            file_opens = self.file_opens,
+            bytes_read = self.bytes_read,
+            bytes_written = self.bytes_written,
+            operations = {key: dict(calls=calls, time=self._times.get(key, 0))
+                          for key, calls in self._calls.items()},
+        )
+
+    def report(self, limit=None):
+        ''' Return a hot-path report string, slowest operations first. '''
+        snapshot = self.snapshot()
+        operations = sorted(snapshot['operations'].items(),
+                            key=lambda item: item[1]['time'], reverse=True)
+        lines = ['{:<32}{:>10}{:>12}'.format('operation', 'calls', 'time (ms)')]
+        for key, stats in operations[:limit]:
+            lines.append('{:<32}{:>10}{:>12.3f}'.format(key, stats['calls'],
+                                                        stats['time'] * 1000))
+        lines.append('file opens: {file_opens}, bytes read: {bytes_read}, '
+                     'bytes written: {bytes_written}'.format(**snapshot))
+        return '\n'.join(lines)
+
+    def print_report(self, limit=None):
+        ''' Print the hot-path report, with a trailing newline. '''
+        print(self.report(limit) + '\n')
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
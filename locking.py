@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # no advisory locking available (e.g. Windows)
+
+
+class FileLock(object):
+    ''' An advisory (fcntl.flock) lock on a file or directory.
+
+    Locks are shared between readers if 'shared' is True, otherwise
+        exclusive. They only coordinate processes (and threads) which also use
+        FileLock, and are no-ops on platforms without fcntl.
+
+    e.g.
+        with FileLock('projects/_main'):
+            # no other FileLock holder can access 'projects/_main' here
+            ...
+
+    '''
+    def __init__(self, path, shared=False):
+        ''' Create a lock for 'path', which must exist when acquired. '''
+        self.path   = path
+        self.shared = shared
+        self._fd    = None
+
+    def acquire(self):
+        ''' Block until the lock is acquired. '''
+        if fcntl is None:
+            return
+        self._fd = os.open(self.path, os.O_RDONLY)
+        try:
+            fcntl.flock(self._fd,
+                        fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        except:
+            os.close(self._fd)
+            self._fd = None
+            raise
+
+    def release(self):
+        ''' Release the lock, if held. '''
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
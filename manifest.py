@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+''' Per-directory manifests summarising the Project records saved in them.
+
+Usage: python3 manifest.py [directory]
+
+'''
+
+import os, sys
+from collections import namedtuple
+import codec
+
+FILENAME = '.manifest'
+
+# the summary of a saved Project, with 'due_date' and 'duration' decoded (or
+#   None), and the number of 'sub_projects'
+Entry = namedtuple('Entry', 'name due_date complete duration sub_projects')
+WIDTH = 4 # items saved per entry, before the stamp of its record
+
+
+def write(filename, entries, merge=False, stats=None):
+    ''' Write the manifest at 'filename' from 'entries' of record name ->
+        [due date, complete, duration, number of sub-projects] summaries,
+        marking it current for its directory's records as they are now (or
+        as in 'stats', from codec.record_stats).
+
+    Each entry is stamped with the modification time and size of its record
+        (see codec.write_stamped), so any later change to a record (even
+        edited in place), or a record added or removed, makes the manifest
+        out of date. If 'merge', the entries update those already in the
+        manifest (e.g. for a directory of several roots).
+
+    '''
+    codec.write_stamped(filename, entries, WIDTH, merge, stats)
+
+
+def stamp(filename):
+    ''' Mark the manifest at 'filename' as current for its directory's
+        records as they are now, e.g. after copying it from another tree.
+    '''
+    entries = codec.read_stamped(filename)
+    if entries is not None:
+        write(filename, {name: entry[:WIDTH]
+                         for name, entry in entries.items()})
+
+
+def _summarise(record):
+    ''' Return the manifest summary of a parsed (not decoded) 'record'. '''
+    return [record.get('due_date'), record.get('complete', False),
+            record.get('duration'), len(record.get('sub_projects', []))]
+
+
+def _decode(entries):
+    ''' Return a dictionary of name -> Entry from manifest 'entries'. '''
+    return {name: Entry(name,
+                        due_date and codec.parse_datetime(due_date),
+                        complete,
+                        duration and codec.parse_duration(duration),
+                        sub_projects)
+            for name, (due_date, complete, duration, sub_projects)
+            in entries.items()}
+
+
+def read(directory):
+    ''' Return a dictionary of name -> Entry for the records in 'directory'
+        from its manifest, or None if it has none or it is out of date.
+
+    Checked against the directory's records with one scan, without reading
+        them.
+
+    '''
+    entries = codec.read_stamped(os.path.join(directory, FILENAME))
+    if entries is None:
+        return None
+    try:
+        stats = codec.record_stats(directory)
+    except FileNotFoundError:
+        return None
+    current = codec.current_entries(entries, stats, WIDTH)
+    if len(current) != len(entries) or \
+       any(name not in entries for name in stats):
+        return None
+    return _decode(current)
+
+
+def list_directory(directory):
+    ''' Return a dictionary of name -> Entry for the records in 'directory'.
+
+    Manifests are written lazily, here rather than on saves: only the records
+        changed since the directory's manifest was written (all, without one)
+        are read, and the manifest is rewritten with them, so listing an
+        unchanged directory reads one file. The listing is still returned if
+        the manifest can't be written (e.g. a read-only tree).
+
+    '''
+    filename = os.path.join(directory, FILENAME)
+    stats = codec.record_stats(directory)
+    stored = codec.read_stamped(filename) or {}
+    entries = {name: entry for name, entry
+               in codec.current_entries(stored, stats, WIDTH).items()
+               if name in stats}
+    changed = len(entries) != len(stored)
+    for name in stats:
+        if name not in entries:
+            try:
+                with open(os.path.join(directory, name + codec.EXTENSION)) \
+                        as record_file:
+                    record = codec.parse_record(record_file.read())
+            except FileNotFoundError:
+                continue # removed since the scan
+            entries[name] = _summarise(record)
+            changed = True
+    if changed:
+        try:
+            write(filename, entries, stats=stats)
+        except OSError:
+            pass
+    return _decode(entries)
+
+
+def main(args):
+    ''' List the records of the directory given in command line 'args'. '''
+    if '--help' in args:
+        print(__doc__)
+        return
+    directory = args[0] if args else 'projects/_main'
+    entries = list_directory(directory)
+    for name in sorted(entries):
+        entry = entries[name]
+        print('{}{}{}{}{}'.format(
+              name,
+              ', due ' + codec.format_datetime(entry.due_date)
+                      if entry.due_date else '',
+              ', complete' if entry.complete else '',
+              ', ' + codec.format_duration(entry.duration)
+                      if entry.duration else '',
+              ', {} sub-project(s)'.format(entry.sub_projects)
+                      if entry.sub_projects else ''))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+''' Merkle hash based diff and incremental sync of saved Project trees.
+
+Usage: python3 merkle.py diff path_a path_b [name]
+       python3 merkle.py sync source_path target_path [name]
+       python3 merkle.py build [name] [path]
+
+'''
+
+import os, shutil, sys
+from hashlib import blake2b
+import codec, manifest
+
+SIDECAR = '.merkle' # Project.MERKLE_SIDECAR
+WIDTH   = 2 # items saved per entry, before the stamp of its record
+
+
+def write_sidecar(filename, entries, merge=False):
+    ''' Write the Merkle sidecar 'filename' from 'entries' of record name ->
+        [Merkle hash, record hash] in hex, stamped with the modification time
+        and size of each record (see codec.write_stamped). If 'merge', the
+        entries update those already in the sidecar.
+    '''
+    codec.write_stamped(filename, entries, WIDTH, merge)
+
+
+def update_sidecar(filename, updates, names=None, stamp=()):
+    ''' Update the Merkle sidecar 'filename' with 'updates' of record name ->
+        [Merkle hash, record hash] in hex, restamping only the records of
+        names in 'stamp'. 'names' are all the names of records in its
+        directory, if known, and any others are dropped. See
+        codec.update_stamped.
+    '''
+    codec.update_stamped(filename, updates, WIDTH, names, stamp)
+
+
+def read_sidecar(directory, stats=None):
+    ''' Return a dictionary of name -> (Merkle hash, record hash) for the
+        records in 'directory' whose sidecar entries are current, or None if
+        it has no Merkle sidecar.
+
+    'stats' are the directory's codec.record_stats, if already known.
+
+    '''
+    entries = codec.read_stamped(os.path.join(directory, SIDECAR))
+    if entries is None:
+        return None
+    try:
+        if stats is None:
+            stats = codec.record_stats(directory)
+    except FileNotFoundError:
+        return None
+    return {name: (bytes.fromhex(merkle), bytes.fromhex(record_hash))
+            for name, (merkle, record_hash)
+            in codec.current_entries(entries, stats, WIDTH).items()
+            if name in stats}
+
+
+def _hash_record(record_str):
+    ''' Return a hash of 'record_str' as Project._hash_record would. '''
+    if record_str.startswith('version = '):
+        record_str = record_str[record_str.index('\n') + 1:]
+    return blake2b(record_str.encode(), digest_size=16).digest()
+
+
+def hash_subtree(directory, name, root=None, known=None):
+    ''' Return the (Merkle hash, record hash) of the subtree of record 'name'
+        in 'directory', computed from the records on disk.
+
+    Used where sidecars are missing or out of date, so reads the whole
+        subtree, except for the subtrees of records (by path without
+        extension) for which known(path) returns their hashes. Unedited
+        sub-projects of template instances are read from their templates' in
+        the tree saved at 'root', or left out if 'root' isn't given (or the
+        subtree starts inside an instance) and so their templates unknown.
+
+    '''
+    records = {} # path -> (record hash, sub-project names)
+    hashes = {}  # path -> Merkle hash
+    stack = [(directory, name, None)]
+    while stack:
+        directory, name, template = stack[-1]
+        path = os.path.join(directory, name)
+        trusted = path not in records and known and known(path)
+        if trusted:
+            hashes[path] = trusted[0]
+            records[path] = (trusted[1], [])
+            stack.pop()
+            continue
+        if path not in records:
+            record_str = codec.read_record(path, template)
+            if record_str is None:
+                if not records:
+                    raise FileNotFoundError(path + codec.EXTENSION)
+                records[path] = None # inherited from an unknown template
+                stack.pop()
+                continue
+            record = codec.parse_record(record_str)
+            sub_projects = record.get('sub_projects', [])
+            records[path] = (_hash_record(record_str), sub_projects)
+            stack.extend((path, sub_project, root and codec.sub_template(
+                    root, record, template, sub_project))
+                    for sub_project in sub_projects)
+            continue
+        stack.pop()
+        record_hash, sub_projects = records[path]
+        merkle = blake2b(record_hash, digest_size=16)
+        for sub_project in sub_projects:
+            sub_path = os.path.join(path, sub_project)
+            if records[sub_path] is not None:
+                merkle.update(sub_project.encode() + b'\0' + hashes[sub_path])
+        hashes[path] = merkle.digest()
+    return hashes[path], records[path][0]
+
+
+class _Tree(object):
+    ''' The Merkle sidecars of the tree of root 'name' saved in 'path',
+        checked against its records.
+
+    Directories are only listed, and their sidecars read, when their entries
+        are first needed, e.g. by a diff descending into the subtrees whose
+        hashes differ. Entries whose records have changed since they were
+        written (e.g. edited by hand) are recomputed from disk, reading only
+        the changed records and trusting their sub-projects' entries if
+        current.
+
+    '''
+    def __init__(self, path, name):
+        self.path     = os.path.normpath(path)
+        self.name     = name
+        # directory -> (record names, current sidecar entries), once read
+        self._sidecars = {}
+
+    def _current(self, directory):
+        ''' Return the names of the records in 'directory' (only the root's,
+            in the tree's directory) and a dictionary of the current sidecar
+            entries of them.
+        '''
+        if directory not in self._sidecars:
+            try:
+                stats = codec.record_stats(directory)
+            except FileNotFoundError:
+                stats = {}
+            if directory == self.path:
+                stats = {name: stats[name] for name in (self.name,)
+                         if name in stats}
+            self._sidecars[directory] = (list(stats),
+                                         read_sidecar(directory, stats) or {})
+        return self._sidecars[directory]
+
+    def _known(self, path):
+        ''' Return the current sidecar entry of record 'path' (without
+            extension), or None if it's out of date.
+        '''
+        return self._current(os.path.dirname(path))[1].get(
+                os.path.basename(path))
+
+    def entries(self, directory):
+        ''' Return a dictionary of name -> (Merkle hash, record hash) for
+            the records in 'directory' of the tree.
+        '''
+        directory = os.path.normpath(directory)
+        names, current = self._current(directory)
+        return {name: current.get(name) or
+                      hash_subtree(directory, name, self.path, self._known)
+                for name in names}
+
+
+def diff(path_a, path_b, name='_main'):
+    ''' Return a list of (status, record path) changes from the tree of root
+        'name' saved in 'path_a' to the one saved in 'path_b'.
+
+    'status' is 'added' or 'removed' for the roots of whole subtrees only in
+        'path_b' or 'path_a', or 'changed' for a record which differs.
+        Record paths are relative to the tree paths. Only the directories
+        of subtrees whose Merkle hashes differ are listed and read, so
+        identical subtrees are skipped, and the records in them are checked
+        against their sidecar entries. Records edited by hand inside
+        subtrees whose entries are current aren't noticed until their
+        sidecars are rebuilt (see build).
+
+    '''
+    return _diff(_Tree(path_a, name), _Tree(path_b, name))
+
+
+def _diff(tree_a, tree_b):
+    ''' Return the changes from _Tree 'tree_a' to 'tree_b', as for diff. '''
+    changes = []
+    name = tree_a.name
+    entries_a = tree_a.entries(tree_a.path).get(name)
+    entries_b = tree_b.entries(tree_b.path).get(name)
+    if entries_a is None or entries_b is None:
+        if entries_a is not None:
+            changes.append(('removed', name + codec.EXTENSION))
+        elif entries_b is not None:
+            changes.append(('added', name + codec.EXTENSION))
+        return changes
+
+    stack = [('', name, entries_a, entries_b)]
+    while stack:
+        relative, name, (merkle_a, record_a), (merkle_b, record_b) = \
+                stack.pop()
+        if merkle_a == merkle_b:
+            continue
+        path = os.path.join(relative, name)
+        if record_a != record_b:
+            changes.append(('changed', path + codec.EXTENSION))
+        children_a = tree_a.entries(os.path.join(tree_a.path, path))
+        children_b = tree_b.entries(os.path.join(tree_b.path, path))
+        for child in sorted(children_a.keys() | children_b.keys(),
+                            reverse=True):
+            if child not in children_b:
+                changes.append(('removed',
+                                os.path.join(path, child + codec.EXTENSION)))
+            elif child not in children_a:
+                changes.append(('added',
+                                os.path.join(path, child + codec.EXTENSION)))
+            else:
+                stack.append((path, child, children_a[child],
+                              children_b[child]))
+    return changes
+
+
+def _copy_file(source, target):
+    ''' Atomically replace 'target' with a copy of 'source'. '''
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    temp_file = target + '.sync.tmp'
+    shutil.copy2(source, temp_file)
+    os.replace(temp_file, target)
+
+
+def sync(source, target, name='_main'):
+    ''' Incrementally update the tree of root 'name' saved in 'target' to
+        match the one in 'source', e.g. to back it up.
+
+    Only the records of subtrees whose Merkle hashes differ are copied, along
+        with the sidecars of their directories (stamped for the target's
+        records), and subtrees removed from 'source' are deleted from
+        'target'. Manifests are copied if current.
+
+    Returns the list of changes applied, as returned by diff.
+
+    '''
+    source_tree = _Tree(source, name)
+    changes = _diff(_Tree(target, name), source_tree)
+    touched = set()
+    copied = [] # directories of added subtrees
+    for status, path in changes:
+        record = path[:-len(codec.EXTENSION)]
+        touched.add(os.path.dirname(path))
+        if status == 'removed':
+            os.remove(os.path.join(target, path))
+            shutil.rmtree(os.path.join(target, record), ignore_errors=True)
+            continue
+        _copy_file(os.path.join(source, path), os.path.join(target, path))
+        if status == 'added' and os.path.isdir(os.path.join(source, record)):
+            shutil.rmtree(os.path.join(target, record), ignore_errors=True)
+            shutil.copytree(os.path.join(source, record),
+                            os.path.join(target, record))
+            copied.extend(os.path.relpath(directory, source) for directory,
+                          directories, files in os.walk(os.path.join(source,
+                                                                     record)))
+
+    # the sidecars of every ancestor of a change differ too
+    for directory in list(touched):
+        while directory:
+            directory = os.path.dirname(directory)
+            touched.add(directory)
+    for directory in touched:
+        # from the source's entries, checked against its records
+        entries = codec.read_stamped(os.path.join(source, directory,
+                                                  SIDECAR))
+        if entries is not None:
+            entries = {name: entry[:WIDTH] for name, entry in entries.items()}
+            entries.update({record: [merkle.hex(), record_hash.hex()]
+                            for record, (merkle, record_hash)
+                            in source_tree.entries(os.path.join(
+                                    source, directory)).items()})
+            write_sidecar(os.path.join(target, directory, SIDECAR), entries)
+    # last, as any other change to their directories makes them out of date
+    for directory in touched.union(copied):
+        if manifest.read(os.path.join(source, directory)) is not None:
+            filename = os.path.join(target, directory, manifest.FILENAME)
+            _copy_file(os.path.join(source, directory, manifest.FILENAME),
+                       filename)
+            manifest.stamp(filename)
+    return changes
+
+
+def build(path, name='_main'):
+    ''' Write the sidecars of every directory of the tree of root
+        'name' saved in 'path', e.g. after its records were edited directly.
+    '''
+    from project import Project
+    root = Project(name, path=path)
+    projects = []
+    remaining = [root]
+    while remaining:
+        project = remaining.pop()
+        projects.append(project)
+        remaining.extend(project.sub_projects.values())
+    for project in projects:
+        project._sidecar = None
+    root._write_sidecars(root._sidecars(projects))
+
+
+def main(args):
+    ''' Run the Merkle command specified by command line 'args'. '''
+    if not args or args[0] not in ('diff', 'sync', 'build'):
+        print(__doc__)
+        return
+
+    command = args.pop(0)
+    if command == 'build':
+        name = args[0] if args else '_main'
+        build(args[1] if len(args) > 1 else 'projects', name)
+        return
+
+    if len(args) < 2:
+        print(__doc__)
+        return
+    name = args[2] if len(args) > 2 else '_main'
+    if command == 'diff':
+        changes = diff(args[0], args[1], name)
+    else:
+        changes = sync(args[0], args[1], name)
+    for status, path in changes:
+        print('{:8} {}'.format(status, path))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
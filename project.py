@@ -1,13 +1,47 @@
 #!/usr/bin/env python3
 
-import os, shutil
+import os, shutil, threading, json
+from itertools import count
+from hashlib import blake2b
 from datetime import datetime, timedelta
+from functools import wraps
+from batch import Batch
+from locking import FileLock
+from choke_points import ChokePointAnalysis
+import codec, merkle
+
+
+class ConflictError(Exception):
+    ''' Raised when Projects have been changed on disk by another process.
+
+    'projects' is the list of Projects which were not saved or refreshed.
+
+    '''
+    def __init__(self, projects):
+        super().__init__('changed by another process: ' +
+                ', '.join(project._save_file for project in projects))
+        self.projects = projects
 
 
 class Project(object):
     ''' A class for storing project information, big and small. '''
     TAB = ' ' * 2
-    TIME_FORMAT = '%d/%b/%Y - %H:%M' # 'dd/Mmm/yyyy - hh:mm'
+    TIME_FORMAT = codec.TIME_FORMAT # 'dd/Mmm/yyyy - hh:mm'
+    VERSION_FORMAT = 'version = {},\n' # first line of saved records
+    SKIP_UNCHANGED = True # skip saving records identical to the saved ones
+    MERKLE_SIDECAR = '.merkle' # per-directory Merkle hashes of its records
+    _revisions = count() # unique revision numbers, for memoization
+    _open_batches = 0 # number of Batches currently open in any tree
+    _batch = None     # the open Batch, only ever set on a tree's root
+    _store = None     # an AsyncProjectStore, only ever set on a tree's root
+    _choke_points = None # cached ChokePointAnalysis, on a tree's root
+    _search_index = None # a SearchIndex following the tree, on a tree's root
+    _search_indexes = 0  # number of trees followed by a SearchIndex
+    # template record filename -> (stat, parsed record), shared by all trees
+    _template_records = {}
+    # results of refreshing a Project from its record
+    UPDATED  = 'updated'
+    CONFLICT = 'conflict'
 
     def __init__(self, name, path='projects', **kwargs):
         ''' Initialise a project.
@@ -34,38 +68,79 @@ class Project(object):
             'precursors' are Projects which must be completed before this one
                 can be started, as a list of Project instances and/or their
                 names, or a comma-separated string of names.
+            'archived' is a list of the names of sub-projects moved to the
+                tree's Archive, which are not loaded.
+            'archive_keys' is a list of the keys those sub-projects are
+                stored under in the Archive, in the same order as 'archived'.
             'parent' is the parent of self, if it exists and is initialised.
+            'template' is the base of the record (its filename without
+                extension, relative to the tree root's path) of a Project
+                self is an instance of, see create_from_template. Sub-projects
+                of instances are instances of the template's sub-projects.
 
         '''
-        if not os.path.isdir(path):
-            os.makedirs(path) # create target and intermediate directories
+        self._parent = kwargs.get('parent', None) # used for batched file ops
+        self._memo     = {} # key -> (revision, value)
+        self._revision = next(self._revisions)
+        self._merkle   = None # Merkle hash of the subtree, once computed
+        self._sidecar  = () # names in sub-projects' sidecars, if any
+        self._node     = None # current History node, once recorded
+        if self._parent is None:
+            # complete any batch interrupted while committing to the tree
+            Batch.recover(path)
 
         self.name              = name
-        self._save_file        = path + '/{}.txt'.format(self.name)
-        self._modified         = True # assume this is new/a modification
-
-        if os.path.isfile(self._save_file):
+        # base of the template record followed until self has its own record
+        self._template         = kwargs.get('template') or \
+                                    self._derived_template()
+        if self._template is None and not self._isdir(path):
+            # create target and intermediate directories
+            #   (instances' are only created once they have records)
+            self._makedirs(path)
+        self._locate(path)
+        modified               = True # assume this is new/a modification
+        self._disk_stat        = None # stat of the record when last synced
+        self._saved_hash       = None # hash of the record when last synced
+
+        existing = self._isfile(self._save_file)
+        if existing:
             # this Project has previously been saved
             #   -> initialise from saved file
-            with open(self._save_file) as info:
-                # insertion security risk - does it matter?
-                file_data = eval('dict({})'.format(info.read()))
-            old_data = file_data.copy()
+            self._disk_stat = self._stat(self._save_file)
+            record_str = self._read_file(self._save_file)
+            self._saved_hash = self._hash_record(record_str)
+            file_data = self._parse_record(record_str)
+            self._template = file_data.get('template') or \
+                    self._derived_template()
+            self._sidecar = tuple(file_data.get('sub_projects', ()))
             # override file parameters with user inputs if applicable
             # TODO decide if updates should immediately apply to file structure
+            modified = self._overrides(file_data, kwargs)
             file_data.update(kwargs)
             kwargs = file_data
-            self._modified = file_data != old_data
+        elif self._template is not None:
+            template_data = self._read_template(
+                    self._template_file(self._template))
+            if template_data is not None:
+                # an unedited instance -> initialise from the template, only
+                #   saving a record of its own if it isn't derived from its
+                #   parent's template (or is overridden)
+                modified = self._template != self._derived_template() or \
+                        self._overrides(template_data, kwargs)
+                template_data.update(kwargs)
+                kwargs = template_data
+
+        # number of times saved, for detecting changes by other processes
+        self._version          = kwargs.get('version', 0)
 
         self.details           = kwargs.get('details', '')
-        self.path              = path
-        self._sub_project_path = path + '/' + name
 
         self.complete = kwargs.get('complete', False)
         self.set_due_date(kwargs.get('due_date', None))
         self.set_completion_date(kwargs.get('completion_date', None))
         self.set_duration_estimate(kwargs.get('duration', None))
         self.update_scheduled_time(kwargs.get('scheduled_time', None))
+        self._modified = modified # not from the initialising setters
 
         self._parent    = kwargs.get('parent', None)
         if self._parent:
@@ -73,20 +148,144 @@ class Project(object):
         else:
             self._level = 0
 
+        # archived sub-project name -> key in the tree's Archive
+        self.archived = dict(zip(kwargs.get('archived', []),
+                                 kwargs.get('archive_keys', [])))
+
         # must occur after self._parent and paths initialised
-        self.sub_projects = {}
-        self.load_sub_projects(kwargs.get('sub_projects', []))
+        sub_projects = kwargs.get('sub_projects', [])
+        if self._template is not None and sub_projects and \
+           isinstance(sub_projects, list) and \
+           all(isinstance(sub_project, str) for sub_project in sub_projects):
+            # an instance's subtree is loaded when first used, see __getattr__
+            self._pending = list(dict.fromkeys(sub_projects))
+        else:
+            self.sub_projects = {}
+            self.load_sub_projects(sub_projects)
         self.precursors   = {}
         self.load_precursors(kwargs.get('precursors', []))
 
         if self._modified:
-            self.save()
+            # if new, the parent's save once self is added updates the sidecars
+            self._save(sidecars=existing)
+
+    def __getattr__(self, name):
+        ''' Load the pending sub-projects of an instance when first used.
+
+        Raises a FileNotFoundError if any has neither a record of its own nor
+            its template's (e.g. the template's was renamed or removed), rather
+            than loading it empty and overwriting what it inherited.
+
+        '''
+        if name != 'sub_projects' or '_pending' not in self.__dict__:
+            raise AttributeError("'{}' object has no attribute '{}'".format(
+                    type(self).__name__, name))
+        missing = [name for name in self._pending
+                   if not self._has_record(name)]
+        if missing:
+            raise FileNotFoundError('Sub-projects {} of {} have no records, '
+                    'of their own or in template {}'.format(missing,
+                    self.name, self._template))
+        self._record_state()
+        names = self.__dict__.pop('_pending')
+        self.sub_projects = {}
+        self.load_sub_projects(names)
+        # keep the saved order, as precursors may have been loaded early
+        sub_projects = {name: self.sub_projects[name] for name in names
+                        if name in self.sub_projects}
+        sub_projects.update(self.sub_projects)
+        self.sub_projects = sub_projects
+        return sub_projects
+
+    def _loaded_sub_projects(self):
+        ''' Return self's sub-projects if they're loaded, without loading
+            them (an instance's may not be yet).
+        '''
+        return self.__dict__.get('sub_projects', {})
+
+    def _sub_project_names(self):
+        ''' Return the names of self's sub-projects, without loading them. '''
+        if '_pending' in self.__dict__:
+            return self._pending
+        return list(self.sub_projects)
+
+    @staticmethod
+    def _overrides(record, kwargs):
+        ''' Returns True if initialisation 'kwargs' change the parameters of
+            the parsed 'record'.
+        '''
+        return any(key not in ('parent', 'template') and
+                   (key not in record or record[key] != value)
+                   for key, value in kwargs.items())
+
+    def _derived_template(self):
+        ''' Return the template self has as a sub-project of its parent, if
+            its parent is an instance, otherwise None.
+        '''
+        template = self._parent and self._parent._template
+        return template and template + '/' + self.name
+
+    def _template_file(self, template):
+        ''' Return the record filename of 'template'. '''
+        return self._get_root().path + '/' + template + codec.EXTENSION
+
+    def _read_template(self, filename):
+        ''' Return a copy of the parsed template record saved at 'filename',
+            or None if there isn't one.
+
+        Parsed records are shared between instances until their files
+            change, so large templates are only parsed once.
+
+        '''
+        if not self._isfile(filename):
+            return None
+        stat = self._stat(filename)
+        cached = self._template_records.get(filename)
+        if stat is not None and cached is not None and cached[0] == stat:
+            record = cached[1]
+        else:
+            record = self._parse_record(self._read_file(filename))
+            for key in ('version', 'template'):
+                record.pop(key, None)
+            if stat is not None:
+                self._template_records[filename] = (stat, record)
+        return dict(record)
+
+    def _read_ahead_files(self, names):
+        ''' Return the (records, templates, directories) loading sub-projects
+            'names' of self starts by reading, so they can be read ahead
+            (see Batch.preload): their own records (whose sub-projects are
+            loaded too, unless they're instances), their templates' records,
+            and the directories checked.
+        '''
+        records = [self._sub_project_path + '/' + name + codec.EXTENSION
+                   for name in names]
+        if self._template is None:
+            return records, [], [self._sub_project_path]
+        # sub-projects of instances are loaded lazily
+        return [], records + [self._template_file(self._template + '/' + name)
+                              for name in names], []
+
+    def _has_record(self, name):
+        ''' Returns True if sub-project 'name' of self has a saved record, of
+            its own or its template's.
+        '''
+        if self._isfile(self._sub_project_path + '/{}.txt'.format(name)):
+            return True
+        return self._template is not None and \
+                self._isfile(self._template_file(self._template + '/' + name))
 
     def __modifier(func):
         ''' A wrapper for functions which modify the internal state. '''
+        @wraps(func)
         def func_wrapper(self, *args, **kwargs):
+            self._record_state()
             self._modified = True
-            return func(self, *args, **kwargs)
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                self._changed()
+        func_wrapper._modifier = True # allow modifiers to be identified
         return func_wrapper
 
     def load_sub_projects(self, sub_projects):
@@ -142,8 +341,10 @@ class Project(object):
                     self.add_precursor(self._parent.sub_projects[name],
                                        modifier=False)
                 else:
+                    # only a modification of the parent if not already saved
+                    new = not self._parent._has_record(name)
                     precursor = self.create_precursor(name)
-                    self._parent.add_sub_project(precursor)
+                    self._parent.add_sub_project(precursor, modifier=new)
         else:
             for name in names:
                 self.create_precursor(name)
@@ -160,7 +361,7 @@ class Project(object):
         if not date:
             return ''
         if constant:
-            return datetime.strftime(date, cls.TIME_FORMAT)
+            return codec.format_datetime(date)
         # intelligent mode TODO check if logic
         diff = date - datetime.today()
         abs_diff = abs(diff)
@@ -181,10 +382,231 @@ class Project(object):
         if diff < timedelta(days=7): # Ddd @hh:mm
             return datetime.strftime(date, '%a @%H:%M')
 
+    def _changed(self):
+        ''' Invalidate values memoized from the current state of self. '''
+        self._revision = next(self._revisions)
+        self._invalidate_subtree_state()
+        if self._search_indexes:
+            self._report_change()
+
+    def _report_change(self):
+        ''' Report a change of self to the SearchIndex following its tree, if
+            any.
+        '''
+        index = self._get_root()._search_index
+        if index is not None:
+            index.changed(self)
+
+    def _invalidate_subtree_state(self, all_ancestors=False):
+        ''' Clear the Merkle hashes and History nodes of self and its
+            ancestors, which summarise their subtrees.
+
+        Unless 'all_ancestors', stops at the first which is already cleared,
+            as the ancestors of a Project without them never have them.
+
+        '''
+        project = self
+        while project is not None and (all_ancestors or
+                                       project._merkle is not None or
+                                       project._node is not None):
+            project._merkle = None
+            project._node = None
+            project = project._parent
+
+    def get_merkle_hash(self):
+        ''' Return the Merkle hash of self's subtree, as bytes.
+
+        Combines the hash of self's record (excluding its version stamp) with
+            the names and Merkle hashes of its sub-projects, so subtrees with
+            equal hashes are equal. Hashes are cached until self or anything
+            in its subtree changes.
+
+        '''
+        pending = [self]
+        while pending:
+            project = pending[-1]
+            if project._merkle is not None:
+                pending.pop()
+                continue
+            if '_pending' in project.__dict__:
+                project._merkle = project._sidecar_merkle_hash()
+                if project._merkle is not None:
+                    pending.pop()
+                    continue
+            missing = [sub_project for sub_project
+                       in project.sub_projects.values()
+                       if sub_project._merkle is None]
+            if missing:
+                pending.extend(missing)
+                continue
+            pending.pop()
+            merkle = blake2b(project._get_record_hash(), digest_size=16)
+            for name, sub_project in project.sub_projects.items():
+                merkle.update(name.encode() + b'\0' + sub_project._merkle)
+            project._merkle = merkle.digest()
+        return self._merkle
+
+    def _sidecar_merkle_hash(self):
+        ''' Return the Merkle hash of the subtree of an instance whose
+            sub-projects aren't loaded, from the Merkle sidecar of its own
+            sub-project directory or else its template's, or None if that
+            doesn't have every sub-project.
+        '''
+        directory = self._sub_project_path
+        if not self._isdir(directory):
+            # no sub-project has a record of its own
+            directory = self._template_file(self._template)[
+                    :-len(codec.EXTENSION)]
+        try:
+            entries = json.loads(self._read_file(
+                    directory + '/' + self.MERKLE_SIDECAR))
+        except (FileNotFoundError, ValueError):
+            return None
+        if not all(name in entries for name in self._pending):
+            return None
+        merkle = blake2b(self._get_record_hash(), digest_size=16)
+        for name in self._pending:
+            merkle.update(name.encode() + b'\0' +
+                          bytes.fromhex(entries[name][0]))
+        return merkle.digest()
+
+    def _get_record_hash(self):
+        ''' Return the hash of self's record, as _hash_record would. '''
+        record = self._memoized('record', self._gen_record)
+        return self._memoized('record_hash', self._hash_record, record)
+
+    def _sidecars(self, saved):
+        ''' Return a list of (update, filename, updates, names, stamp)
+            sidecar updates to apply with _write_sidecars after the 'saved'
+            Projects of self's tree were saved. Only memory is read, so it's
+            cheap to call on any thread which may read the tree.
+
+        Each directory's Merkle sidecar maps the names of the records in it to
+            their [Merkle hash, record hash] in hex. Only the entries of the
+            saved Projects (whose records are restamped), of their ancestors
+            and of sub-projects added to their listings since last written are
+            updated. 'names' lists every record in a directory whose listing
+            may have changed (a saved Project's sub-project directory), or is
+            None. Directories which don't exist are skipped when written.
+            Manifests aren't written on saves, but when their directories are
+            listed (see manifest.list_directory).
+
+        '''
+        # directory -> [owner, name -> Project to update, names to restamp]
+        #   where the owner's sub-projects (or the root if None) are in it
+        merkles = {}
+        listings = {} # directory -> owner, for directories of saved Projects
+        def touch(sidecars, project):
+            return sidecars.setdefault(project.path,
+                                       [project._parent, {}, set()])
+        for project in saved:
+            owner, updated, stamped = touch(merkles, project)
+            updated[project.name] = project
+            stamped.add(project.name)
+            if '_pending' not in project.__dict__:
+                listings[project._sub_project_path] = project
+            # every ancestor's Merkle hash changed, unless already updated
+            while project._parent is not None:
+                project = project._parent
+                owner, updated, stamped = touch(merkles, project)
+                if project.name in updated:
+                    break
+                updated[project.name] = project
+
+        names = {} # directory -> names of the records listed in it
+        for directory, owner in listings.items():
+            names[directory] = list(owner.sub_projects)
+            if owner._sidecar == tuple(names[directory]):
+                continue
+            # sub-projects listed since last written (all if unknown)
+            listed = set(owner._sidecar or ())
+            added = [sub_project for name, sub_project
+                     in owner.sub_projects.items() if owner._sidecar is None
+                     or name not in listed]
+            owner._sidecar = tuple(names[directory])
+            updated = merkles.setdefault(directory, [owner, {}, set()])[1]
+            for sub_project in added:
+                updated.setdefault(sub_project.name, sub_project)
+
+        return [(merkle.update_sidecar, directory + '/' + self.MERKLE_SIDECAR,
+                 {name: project._merkle_entry() for name, project
+                  in updated.items()},
+                 names.get(directory), stamped)
+                for directory, (owner, updated, stamped) in merkles.items()]
+
+    def _write_sidecars(self, sidecars):
+        ''' Apply the 'sidecars' updates from _sidecars in order, stamped for
+            the records in their directories (once a batch is committed, if in
+            one).
+        '''
+        batch = self._get_batch()
+        if not batch:
+            self._store_sidecars(sidecars)
+            return
+        for update, filename, updates, names, stamp in sidecars:
+            if self._isdir(os.path.dirname(filename)):
+                batch.update_stamped(update, filename, updates, names, stamp)
+
+    @staticmethod
+    def _store_sidecars(sidecars):
+        ''' Apply the 'sidecars' updates from _sidecars on disk, as
+            _write_sidecars does outside a batch, using only the disk.
+        '''
+        for update, filename, updates, names, stamp in sidecars:
+            if os.path.isdir(os.path.dirname(filename)):
+                update(filename, updates, names, stamp)
+            # else e.g. a leaf's sub-project directory
+
+    def _merkle_entry(self):
+        return [self.get_merkle_hash().hex(), self._get_record_hash().hex()]
+
+    def _structure_changed(self):
+        ''' Invalidate analyses of the precursors and structure of self's tree,
+            leaving those of other trees cached.
+        '''
+        self._get_root()._choke_points = None
+
+    def _get_choke_points(self):
+        ''' Return the ChokePointAnalysis of self's tree, cached on its root
+            until a precursor, sub-project or completion status in the tree
+            changes.
+        '''
+        root = self._get_root()
+        if root._choke_points is None:
+            root._choke_points = ChokePointAnalysis(root)
+        return root._choke_points
+
+    def get_choke_point(self):
+        ''' Return the ChokePoint metrics of self, or None if complete.
+
+        Raises a ValueError if precursors in the tree form a cycle.
+
+        '''
+        return self._get_choke_points().get(self)
+
+    def is_choke_point(self):
+        ''' Return True if self is an incomplete choke point of its tree. '''
+        return self._get_choke_points().is_choke_point(self)
+
+    def _memoized(self, key, func, *args):
+        ''' Return func(*args), memoized under 'key' until self changes. '''
+        cached = self._memo.get(key)
+        if cached is not None and cached[0] == self._revision:
+            return cached[1]
+        value = func(*args)
+        self._memo[key] = (self._revision, value)
+        return value
+
     def get_due_date_str(self, constant=True):
+        if constant:
+            return self._memoized('due_date', self._get_date_str,
+                                  self.due_date)
         return self._get_date_str(self.due_date, constant)
 
     def get_completion_date_str(self, constant=True):
+        if constant:
+            return self._memoized('completion_date', self._get_date_str,
+                                  self.completion_date)
         return self._get_date_str(self.completion_date, constant)
 
     @staticmethod
@@ -192,20 +614,23 @@ class Project(object):
         ''' Return 'time' as a string in 'xh'/'xd' format. '''
         if not time:
             return ''
-        hours = time / timedelta(hours=1)
-        if hours > 24:
-            days = hours / 24
-            return '{}d'.format(days)
-        return '{}h'.format(hours)
+        return codec.format_duration(time)
 
     def get_duration_str(self):
-        return self._get_time_str(self.duration)
+        return self._memoized('duration', self._get_time_str, self.duration)
 
     def get_scheduled_time_str(self):
-        return self._get_time_str(self.scheduled_time)
+        return self._memoized('scheduled_time', self._get_time_str,
+                              self.scheduled_time)
 
     def get_properties(self, constant=True):
         ''' Return a dictionary of string-equivalents of common properties. '''
+        if constant:
+            return dict(self._memoized('properties', self._gen_properties))
+        return self._gen_properties(constant)
+
+    def _gen_properties(self, constant=True):
+        ''' Generate the dictionary of common property strings. '''
         return dict(
             name = self.name,
             details = self.details or '',
@@ -227,21 +652,29 @@ class Project(object):
         'precursors' and 'sub_projects' params can currently only be used
             for adding Projects, not renaming or removing them.
 
-        '''
-        new_name = params.get('name', self.name)
-        if new_name != self.name:
-            self.rename(new_name)
-        self.update_details(params.get('details', self.details))
-        self.set_due_date(params.get('due_date', self.due_date))
-        self.set_duration_estimate(params.get('duration', self.duration))
-        self.update_scheduled_time(params.get('scheduled_time',
-                                              self.scheduled_time))
-        completion_date = params.get('completion_date', self.completion_date)
-        if completion_date: self.set_complete(completion_date)
-        self.complete = params.get('complete', self.complete)
+        The update is batched, so is either fully applied or not at all.
 
-        self.load_precursors(params.get('precursors', self.precursors))
-        self.load_sub_projects(params.get('sub_projects', self.sub_projects))
+        '''
+        with self.batch():
+            new_name = params.get('name', self.name)
+            if new_name != self.name:
+                self.rename(new_name)
+            self.update_details(params.get('details', self.details))
+            self.set_due_date(params.get('due_date', self.due_date))
+            self.set_duration_estimate(params.get('duration', self.duration))
+            self.update_scheduled_time(params.get('scheduled_time',
+                                                  self.scheduled_time))
+            completion_date = params.get('completion_date',
+                                         self.completion_date)
+            if completion_date: self.set_complete(completion_date)
+            complete = params.get('complete', self.complete)
+            if complete != self.complete:
+                self.complete = complete
+                self._structure_changed()
+
+            self.load_precursors(params.get('precursors', self.precursors))
+            self.load_sub_projects(params.get('sub_projects',
+                                              self.sub_projects))
 
     @__modifier
     def rename(self, name):
@@ -249,27 +682,52 @@ class Project(object):
         if self._level == 0:
             raise Exception('Cannot rename a Project with no '
                             'instantiated parent')
+        self._check_not_template()
         old_name = self.name
         self.name = name
         self._replace_file(old_name, name)
-        self._parent._sub_project_renamed(old_name, new_name)
+        self._parent._sub_project_renamed(old_name, name)
 
     def _replace_file(self, old_name, new_name):
         ''' Rename the existing 'old_name' file with 'new_name'. '''
-        old_dir = self.path + '/{}/'.format(old_name)
-        new_dir = self.path + '/{}/'.format(new_name)
-        if os.path.isfile(self._save_file):
-            old_save = self._save_file
-            self._save_file = new_dir[:-1] + '.txt'
-            os.rename(old_save, self._save_file)
-        if os.path.isdir(old_dir):
-            os.rename(old_dir, new_dir)
+        self._move_files(self.path + '/' + old_name,
+                         self.path + '/' + new_name)
+        self._relocate(self.path, self._level)
+
+    def _move_files(self, old_base, new_base):
+        ''' Move the save file and directory at 'old_base' to 'new_base'. '''
+        if self._isfile(old_base + '.txt'):
+            self._move_path(old_base + '.txt', new_base + '.txt')
+        if self._isdir(old_base):
+            self._move_path(old_base, new_base)
+
+    def _locate(self, path):
+        ''' Set the locations of self's record and sub-project directory, for
+            self saved in directory 'path'.
+        '''
+        self.path              = path
+        self._save_file        = path + '/{}.txt'.format(self.name)
+        self._sub_project_path = path + '/' + self.name
+
+    def _relocate(self, path, level):
+        ''' Update the stored location of self and its sub-projects. '''
+        self._record_state()
+        self._locate(path)
+        self._level = level
+        if self._template is not None and \
+           self._template != self._derived_template():
+            # renamed or moved, so it no longer follows its parent's template
+            self._modified = True
+        for sub_project in self._loaded_sub_projects().values():
+            sub_project._relocate(self._sub_project_path, level + 1)
 
     @__modifier
     def _sub_project_renamed(self, old_name, new_name):
         ''' Handle the renaming of a sub_project. '''
-        # update registered sub-projects
-        self.sub_projects[new_name] = self.sub_projects.pop(old_name)
+        # update registered sub-projects, keeping their order
+        self.sub_projects = {new_name if name == old_name else name: project
+                             for name, project in self.sub_projects.items()}
+        self._structure_changed()
         # update precursors to reflect new name
         for name in self.sub_projects:
             sub_project = self.sub_projects[name]
@@ -279,7 +737,9 @@ class Project(object):
     def _precursor_renamed(self, old_name, new_name):
         ''' Rename the precursor with old_name to new_name, if it exists. '''
         if old_name in self.precursors:
-            self.precursors[new_name] = self.precursors.pop(old_name)
+            self.precursors = {new_name if name == old_name else name:
+                               precursor for name, precursor
+                               in self.precursors.items()}
 
     @__modifier
     def update_details(self, details):
@@ -294,6 +754,14 @@ class Project(object):
             # assume completion was now
             completion_date = datetime.today()
         self.set_completion_date(completion_date)
+        self._structure_changed()
+
+    @__modifier
+    def set_incomplete(self):
+        ''' Set this Project as not complete, clearing its completion date. '''
+        self.complete = False
+        self.completion_date = None
+        self._structure_changed()
 
     @__modifier
     def set_due_date(self, due_date):
@@ -319,10 +787,24 @@ class Project(object):
 
     @__modifier
     def move_to(self, new_parent):
-        ''' Move this Project to 'new_parent'. '''
-        old_parent = self._parent
+        ''' Move this Project and its files to 'new_parent'.
+
+        Precursors are relative to siblings, so are cleared by the move.
+
+        Raises a ValueError if self's subtree is (part of) the template of
+            any instances, see create_from_template.
+
+        '''
+        self._check_not_template()
+        old_base = self.path + '/' + self.name
+        self._parent._detach_sub_project(self)
+        self.precursors = {}
         new_parent.add_sub_project(self)
-        old_parent.remove_sub_project(self)
+        if not self._isdir(new_parent._sub_project_path):
+            self._makedirs(new_parent._sub_project_path)
+        self._move_files(old_base, new_parent._sub_project_path + '/' +
+                         self.name)
+        self._relocate(new_parent._sub_project_path, new_parent._level + 1)
 
     def add_sub_project(self, sub_project, modifier=True):
         ''' Add the specified Project as a sub-project to this project.
@@ -332,20 +814,48 @@ class Project(object):
             initialisation.
 
         '''
+        self._record_state()
+        sub_project._record_state()
         if modifier or sub_project._modified:
             self._modified = True
         self.sub_projects[sub_project.name] = sub_project
         sub_project._parent = self # set in case being moved here
+        self._changed()
+        self._structure_changed()
         return sub_project
 
     def create_sub_project(self, name, **kwargs):
         ''' Create a new sub-project Project with given parameters. '''
-        sub_project_file = self._sub_project_path + '/{}.txt'.format(name)
         return self.add_sub_project(
-                modifier=not os.path.isfile(sub_project_file),
+                modifier=not self._has_record(name),
                 sub_project=Project(name, path=self._sub_project_path,
                                     parent=self, **kwargs))
 
+    def create_from_template(self, template, name=None):
+        ''' Create a sub-project which is an instance of the saved Project
+            'template' from the same tree, called 'name' (by default the
+            template's name). Returns the instance.
+
+        The instance and its subtree are copy-on-write: only the instance's
+            own record is written, and its sub-projects share the records of
+            the template's (on disk, and parsed in memory) until they're
+            modified, when they're saved as records of their own. Sub-projects
+            are loaded when first used, so creating an instance takes the same
+            time however large the template is.
+
+        The instance's own record is a snapshot of the template's, so later
+            changes to the template's details, dates or list of sub-projects
+            aren't followed. Unedited sub-projects do follow later changes to
+            the records of the template's, so renaming, moving, removing or
+            archiving the template, any of its sub-projects or any of its
+            ancestors raises a ValueError while instances in the tree use it.
+            Only loaded instances are found, so templates shouldn't be
+            instances or have instances within instances.
+
+        '''
+        return self.create_sub_project(name or template.name,
+                                       template=template._base())
+
     @__modifier
     def remove_sub_project(self, sub_project):
         ''' Remove the specified Project from this Project's sub-projects.
@@ -353,19 +863,105 @@ class Project(object):
         Also removes the Project as a precursor to other projects, and deletes
             any files and directories belonging to the Project.
 
-        Raises a KeyError if sub_project is not a sub-project of self.
+        Raises a KeyError if sub_project is not a sub-project of self, and a
+            ValueError if its subtree is (part of) the template of any
+            instances outside it, see create_from_template.
+
+        '''
+        sub_project._check_not_template(removed=True)
+        self._detach_sub_project(sub_project)
+        self._remove_records(sub_project)
+
+    @__modifier
+    def _detach_sub_project(self, sub_project):
+        ''' Remove 'sub_project' from self, leaving its files in place.
+
+        Also removes the Project as a precursor to other sub-projects.
 
         '''
         name = sub_project.name
         self.sub_projects.pop(name)
-        for sub_project in self.sub_projects.values():
-            sub_project.precursors.pop(name, None)
-        sub_project_dir = self._sub_project_path + '/{}/'.format(name)
-        sub_project_file = sub_project_dir[:-1] + '.txt'
-        if os.path.isfile(sub_project_file):
-            os.remove(sub_project_file)
-        if os.path.isdir(sub_project_dir):
-            shutil.rmtree(sub_project_dir)
+        for sibling in self.sub_projects.values():
+            if name in sibling.precursors:
+                sibling._record_state()
+                sibling.precursors.pop(name)
+                sibling._modified = True
+                sibling._changed()
+        self._structure_changed()
+
+    @__modifier
+    def _archive_sub_project(self, sub_project, key):
+        ''' Replace 'sub_project' with an archived stub, deleting its files.
+
+        Its files must already be stored in the tree's Archive under 'key'.
+
+        '''
+        self._detach_sub_project(sub_project)
+        self.archived[sub_project.name] = key
+        self._remove_records(sub_project)
+
+    def _base(self):
+        ''' Return the base of self's record (its filename without extension,
+            relative to the tree root's path), as templates are referred to.
+        '''
+        base = os.path.relpath(self._save_file[:-len(codec.EXTENSION)],
+                               self._get_root().path)
+        return base.replace(os.sep, '/')
+
+    def _instances(self):
+        ''' Return the loaded instances in self's tree, with their own
+            templates (not ones derived from their parents').
+        '''
+        instances = []
+        remaining = [self._get_root()]
+        while remaining:
+            project = remaining.pop()
+            if project._template is not None and \
+               project._template != project._derived_template():
+                instances.append(project)
+            remaining.extend(project._loaded_sub_projects().values())
+        return instances
+
+    def _template_instances(self, removed=False, instances=None):
+        ''' Return the 'instances' (by default the loaded ones in self's tree)
+            whose template is self, inside self's subtree or an ancestor of
+            self, so they would no longer load if self was renamed or moved,
+            or if 'removed', removed (when those inside self's subtree are
+            removed with it, so are ignored).
+        '''
+        if instances is None:
+            instances = self._instances()
+        base = self._base()
+        under = lambda path, directory: path == directory or \
+                path.startswith(directory + '/')
+        return [instance for instance in instances
+                if (under(instance._template, base) or
+                    under(base, instance._template)) and
+                   not (removed and under(instance._base(), base))]
+
+    def _check_not_template(self, removed=False):
+        ''' Raise a ValueError if self has _template_instances. '''
+        instances = self._template_instances(removed)
+        if instances:
+            raise ValueError('{} is (part of) the template of {}'.format(
+                    self.name, ', '.join(instance._base()
+                                         for instance in instances)))
+
+    def _remove_records(self, sub_project):
+        ''' Delete the record and sub-project files of 'sub_project'. '''
+        sub_project_dir = self._sub_project_path + '/' + sub_project.name
+        for path in (sub_project_dir + '.txt', sub_project_dir):
+            if self._isfile(path) or self._isdir(path):
+                self._remove_path(path)
+
+    @__modifier
+    def _unarchive_sub_project(self, name):
+        ''' Load the archived sub-project 'name', once its files have been
+            restored from the tree's Archive. Returns the loaded Project.
+        '''
+        del self.archived[name]
+        self.load_sub_projects([name])
+        return self.sub_projects[name]
 
     def add_precursor(self, precursor, modifier=True):
         ''' Flag the specified Project as a precursor to self.
@@ -377,19 +973,22 @@ class Project(object):
             initialisation.
 
         '''
+        self._record_state()
         if modifier:
             self._modified = True
 
         self.precursors[precursor.name] = precursor
+        self._changed()
+        self._structure_changed()
         return precursor
 
     def create_precursor(self, name, **kwargs):
         ''' '''
         # TODO check the logic of when to set modifier to True
-        precursor_file = self._path + '/{}.txt'.format(name)
+        precursor_file = self.path + '/{}.txt'.format(name)
         return self.add_precursor(Project(name, path=self.path,
                                           parent=self._parent, **kwargs),
-                                  modifier=os.path.isfile(precursor_file))
+                                  modifier=self._isfile(precursor_file))
 
     @__modifier
     def remove_precursor(self, name):
@@ -398,28 +997,302 @@ class Project(object):
             self.precursors.pop(name)
         except KeyError:
             print('{} is not a known precursor of {}.'.format(name, self.name))
+        self._structure_changed()
 
     def save(self, force=False):
-        ''' Save the state of this Project and its sub_projects. '''
-        if force or self._modified:
-            save_out = self._gen_save_string()
-            with open(self._save_file, 'w') as save_file:
-                save_file.write(save_out)
+        ''' Save the state of this Project and its sub_projects.
+
+        Raises a ConflictError if any of the Projects' records have been
+            changed by another process since they were loaded or last saved.
+            Those Projects are left unsaved, but all others are saved.
+
+        '''
+        self._save(force)
+
+    def _save(self, force=False, sidecars=True):
+        ''' Save like save(), only updating the sidecars if 'sidecars'. '''
+        saves = self._collect_saves(force)
+        conflicts = []
+        for index, (project, filename, data) in enumerate(saves):
+            try:
+                project._write_record(filename, data)
+            except ConflictError:
+                project._mark_unsaved()
+                conflicts.append(project)
+            except:
+                # anything not written is still unsaved
+                for project, filename, data in saves[index:]:
+                    project._mark_unsaved()
+                raise
+        if saves and sidecars:
+            self._write_sidecars(self._sidecars(
+                    [project for project, filename, data in saves]))
+        if conflicts:
+            raise ConflictError(conflicts)
+
+    async def asave(self, force=False):
+        ''' Save like save(), without blocking the running event loop.
+
+        Uses the AsyncProjectStore of this Project's tree, creating one with
+            default settings if none has been opened.
+
+        '''
+        from async_store import AsyncProjectStore
+        return await AsyncProjectStore.for_project(self).save(self, force)
+
+    def _collect_saves(self, force=False, saves=None):
+        ''' Return a list of (project, filename, data) tuples to be saved.
 
-        for sub_project in self.sub_projects.values():
-            sub_project.save(force)
+        Collected Projects are considered no longer modified, so the returned
+            data must be written (or the Projects re-marked as modified).
+        Unless forced, modified Projects are only collected if their record
+            differs from the one last saved.
 
+        '''
+        if saves is None:
+            saves = []
+        if force or self._modified:
+            record = self._memoized('record', self._gen_record)
+            if force or not self._unchanged_on_disk(record):
+                self._version += 1
+                saves.append((self, self._save_file,
+                              self.VERSION_FORMAT.format(self._version) +
+                              record))
         # no longer modified since last save
         self._modified = False
 
+        for sub_project in self._loaded_sub_projects().values():
+            sub_project._collect_saves(force, saves)
+
+        return saves
+
+    def _unchanged_on_disk(self, record):
+        ''' Returns True if 'record' is already saved, so can be skipped. '''
+        return self.SKIP_UNCHANGED and self._disk_stat is not None and \
+                self._memoized('record_hash', self._hash_record, record) \
+                    == self._saved_hash and \
+                self._stat(self._save_file) == self._disk_stat
+
+    def _mark_unsaved(self):
+        ''' Revert the effect of collecting self for a save which failed. '''
+        self._modified = True
+        self._version -= 1
+
+    def _write_record(self, filename, data):
+        ''' Write this Project's record 'data' to 'filename'.
+
+        Holds an exclusive lock on the record's directory (created if needed)
+            while checking no other process has saved the record since self
+            was loaded or last saved, and writing it. Raises a ConflictError if
+            one has.
+
+        '''
+        directory = os.path.dirname(filename)
+        if directory and not self._isdir(directory):
+            self._makedirs(directory)
+        if self._get_batch():
+            # checked now, written when the batch is committed
+            if not self._is_current(filename):
+                raise ConflictError([self])
+            self._get_batch().write_record(self, filename, data)
+            self._disk_stat = None # only known after the batch is committed
+        else:
+            disk_stat = self._store_record(filename, data, self._disk_stat,
+                                           self._version - 1)
+            if disk_stat is None:
+                raise ConflictError([self])
+            self._disk_stat = disk_stat
+        self._saved_hash = self._hash_record(data)
+
+    @classmethod
+    def _store_record(cls, filename, data, disk_stat, version):
+        ''' Write the record 'data' to 'filename', holding an exclusive lock
+            on its directory while checking the record there is still the one
+            with 'disk_stat' or 'version' (see _is_current_on_disk), and
+            writing it. Returns the stat of the written record, or None if it
+            was changed so isn't written.
+
+        Only the disk is used, not any Project or Batch, so records can be
+            written in other threads with the arguments taken from a Project
+            (see AsyncProjectStore).
+
+        '''
+        directory = os.path.dirname(filename) or '.'
+        os.makedirs(directory, exist_ok=True)
+        with FileLock(directory):
+            if not cls._is_current_on_disk(filename, disk_stat, version):
+                return None
+            cls._write_disk_file(filename, data)
+            stat = os.stat(filename)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    @classmethod
+    def _hash_record(cls, record_str):
+        ''' Return a hash of 'record_str', ignoring any version stamp. '''
+        if record_str.startswith(cls.VERSION_FORMAT[:10]):
+            record_str = record_str[record_str.index('\n') + 1:]
+        return blake2b(record_str.encode(), digest_size=16).digest()
+
+    def _is_current(self, filename):
+        ''' Returns True if the record at 'filename' is the one self last
+            loaded or saved (or has never existed), assuming self is being
+            saved so its version has already been incremented.
+        '''
+        if not self._isfile(filename):
+            # new, or removed by another process
+            return self._disk_stat is None
+        if self._disk_stat and self._stat(filename) == self._disk_stat:
+            return True # unchanged since last synced, no need to read it
+        return self._read_version(filename) == self._version - 1
+
+    @staticmethod
+    def _is_current_on_disk(filename, disk_stat, version):
+        ''' Returns True if the record on disk at 'filename' (ignoring any
+            open batch) is the one with 'disk_stat' or 'version', or is absent
+            and 'disk_stat' is None.
+        '''
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return disk_stat is None
+        if disk_stat and (stat.st_mtime_ns, stat.st_size, stat.st_ino) == \
+                disk_stat:
+            return True
+        with open(filename) as file:
+            return codec.parse_record(file.read()).get('version', 0) == version
+
+    def _read_version(self, filename):
+        ''' Return the version stamp of the record saved at 'filename'. '''
+        return self._parse_record(self._read_file(filename)).get('version', 0)
+
+    def _stat(self, filename):
+        ''' Return a (mtime, size, inode) tuple of 'filename', or None. '''
+        batch = self._get_batch()
+        if batch:
+            # pending changes aren't reflected on disk, but records read
+            #   ahead are
+            return batch.stat(filename)
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def refresh(self):
+        ''' Pick up changes saved by other processes to self and its tree.
+
+        Only records whose stat has changed since they were last loaded or
+            saved are read.
+
+        Returns a tuple of (updated, conflicts), where 'updated' is the list
+            of Projects updated from disk, and 'conflicts' the list of
+            Projects changed on disk which were not updated because they have
+            unsaved local modifications.
+
+        '''
+        updated = []; conflicts = []
+        self._refresh(updated, conflicts)
+        return updated, conflicts
+
+    def _refresh(self, updated, conflicts):
+        ''' Refresh self and its sub-projects, recording the results. '''
+        result = self._refresh_record()
+        if result == self.UPDATED:
+            updated.append(self)
+        elif result == self.CONFLICT:
+            conflicts.append(self)
+
+        for sub_project in list(self._loaded_sub_projects().values()):
+            sub_project._refresh(updated, conflicts)
+
+    def _refresh_record(self):
+        ''' Update self from its record if changed by another process.
+
+        Returns UPDATED if self was updated, CONFLICT if the record changed but
+            self has unsaved modifications, or None if the record is unchanged.
+
+        '''
+        stat = self._stat(self._save_file)
+        if stat is None or stat == self._disk_stat:
+            return None
+        with FileLock(os.path.dirname(self._save_file) or '.', shared=True):
+            record_str = self._read_file(self._save_file)
+            stat = self._stat(self._save_file)
+        if record_str == self._gen_save_string():
+            self._disk_stat = stat # e.g. written by self in a batch
+            return None
+        if self._modified:
+            return self.CONFLICT
+        self._apply_record(self._parse_record(record_str))
+        self._disk_stat = stat
+        self._saved_hash = self._hash_record(record_str)
+        return self.UPDATED
+
+    def _reload_record(self):
+        ''' Update self from its record, just rewritten by this process. '''
+        record_str = self._read_file(self._save_file)
+        self._apply_record(self._parse_record(record_str))
+        self._disk_stat = self._stat(self._save_file)
+        self._saved_hash = self._hash_record(record_str)
+
+    def _apply_record(self, record):
+        ''' Update self in place from a parsed saved 'record'.
+
+        Sub-projects no longer in the record are dropped from memory (their
+            files are assumed to have been handled by the saving process), and
+            new ones are loaded from disk.
+
+        '''
+        self._record_state()
+        self.details         = record.get('details', '')
+        self.complete        = record.get('complete', False)
+        self.due_date        = self._format_datetime(record.get('due_date'))
+        self.completion_date = self._format_datetime(
+                record.get('completion_date'))
+        self.duration        = self._format_duration(record.get('duration'))
+        self.scheduled_time  = self._format_duration(
+                record.get('scheduled_time'))
+        self._version        = record.get('version', 0)
+        self.archived        = dict(zip(record.get('archived', []),
+                                        record.get('archive_keys', [])))
+        self._template       = record.get('template') or \
+                self._derived_template()
+
+        names = record.get('sub_projects', [])
+        for name in [name for name in self.sub_projects if name not in names]:
+            self.sub_projects.pop(name)
+        self.load_sub_projects([name for name in names
+                                if name not in self.sub_projects])
+        self.sub_projects = {name: self.sub_projects[name] for name in names}
+        self._sidecar = tuple(names) # as written by the saving process
+        self.precursors = {}
+        self.load_precursors(record.get('precursors', []))
+        self._modified = False
+        self._changed()
+        self._structure_changed()
+
     def _gen_save_string(self):
         ''' Generate a string version of self to save to file. '''
+        return self.VERSION_FORMAT.format(self._version) + \
+                self._memoized('record', self._gen_record)
+
+    def _gen_record(self):
+        ''' Generate the saved string version of self, without a version. '''
         save_str = ''
+        if self._template is not None and \
+           self._template != self._derived_template():
+            save_str += 'template = "{}",\n'.format(self._template)
         if self.details:
             save_str += 'details = """{}""",\n'.format(self.details)
-        if self.sub_projects:
+        sub_projects = self._sub_project_names()
+        if sub_projects:
             save_str += 'sub_projects = ["{}"],\n'.format(
-                    '","'.join(self.sub_projects.keys()))
+                    '","'.join(sub_projects))
+        if self.archived:
+            save_str += 'archived = ["{}"],\n'.format(
+                    '","'.join(self.archived))
+            save_str += 'archive_keys = ["{}"],\n'.format(
+                    '","'.join(self.archived.values()))
         if self.due_date:
             save_str += 'due_date = "{}",\n'.format(self.get_due_date_str())
         if self.completion_date:
@@ -437,6 +1310,125 @@ class Project(object):
                     '","'.join(self.precursors.keys()))
         return save_str
 
+    def batch(self):
+        ''' Return a context manager batching changes to this Project's tree.
+
+        Within the 'with' block, all file writes, renames and deletions in the
+            tree are deferred, then applied in one ordered flush when the
+            block exits. If an exception is raised instead, the pending
+            changes are discarded and the in-memory state of all Projects
+            modified in the block is rolled back.
+
+        e.g.
+            with project.batch():
+                project.update_params(**params)
+                project.save()
+
+        '''
+        return Batch(self._get_root())
+
+    def _get_root(self):
+        ''' Return the root Project of the tree containing self. '''
+        project = self
+        while project._parent:
+            project = project._parent
+        return project
+
+    def _get_batch(self):
+        ''' Return the open Batch of this Project's tree, if any. '''
+        if self._open_batches:
+            return self._get_root()._batch
+
+    def _record_state(self):
+        ''' Record the state of self in the open batch, if any. '''
+        if self._open_batches:
+            batch = self._get_batch()
+            if batch:
+                batch.record(self)
+
+    def _read_file(self, filename):
+        ''' Return the contents of the file at 'filename'. '''
+        batch = self._get_batch()
+        if batch:
+            return batch.read(filename)
+        with open(filename) as file:
+            return file.read()
+
+    def _write_file(self, filename, data):
+        ''' Write 'data' to the file at 'filename', replacing its contents.
+
+        The data is written to a hidden temporary file which then replaces
+            'filename', so the file is never seen partially written.
+
+        '''
+        batch = self._get_batch()
+        if batch:
+            batch.write(filename, data)
+        else:
+            self._write_disk_file(filename, data)
+
+    @staticmethod
+    def _write_disk_file(filename, data):
+        ''' Replace the file at 'filename' with 'data' on disk, as
+            _write_file does outside a batch.
+        '''
+        directory, base = os.path.split(filename)
+        temp_file = os.path.join(directory, '.{}.{}-{}.tmp'.format(
+                base, os.getpid(), threading.get_ident()))
+        try:
+            with open(temp_file, 'w') as file:
+                file.write(data)
+            os.replace(temp_file, filename)
+        except:
+            if os.path.isfile(temp_file):
+                os.remove(temp_file)
+            raise
+
+    def _isfile(self, filename):
+        ''' Returns True if 'filename' is (or is pending as) a file. '''
+        batch = self._get_batch()
+        if batch:
+            return batch.isfile(filename)
+        return os.path.isfile(filename)
+
+    def _isdir(self, dirname):
+        ''' Returns True if 'dirname' is (or is pending as) a directory. '''
+        batch = self._get_batch()
+        if batch:
+            return batch.isdir(dirname)
+        return os.path.isdir(dirname)
+
+    def _makedirs(self, dirname):
+        ''' Create the 'dirname' directory and any intermediate ones. '''
+        batch = self._get_batch()
+        if batch:
+            batch.makedirs(dirname)
+        else:
+            os.makedirs(dirname, exist_ok=True)
+
+    def _move_path(self, old, new):
+        ''' Rename the file or directory at 'old' to 'new'. '''
+        batch = self._get_batch()
+        if batch:
+            batch.move(old, new)
+        else:
+            os.rename(old, new)
+
+    def _remove_path(self, path):
+        ''' Delete the file or directory tree at 'path'. '''
+        batch = self._get_batch()
+        if batch:
+            batch.remove(path)
+        elif os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    @staticmethod
+    def _parse_record(record):
+        ''' Parse a saved record string into a dictionary of parameters. '''
+        return codec.parse_record(record)
+
     @classmethod
     def _format_datetime(cls, date):
         ''' Format the inputted date as a datetime instance. '''
@@ -444,7 +1436,7 @@ class Project(object):
             return date
         if isinstance(date, str):
             # TODO handle intelligent date-string formats
-            return datetime.strptime(date, cls.TIME_FORMAT)
+            return codec.parse_datetime(date)
 
     @staticmethod
     def _format_duration(duration):
@@ -452,11 +1444,7 @@ class Project(object):
         if isinstance(duration, timedelta):
             return duration
         if isinstance(duration, str):
-            if 'h' in duration:
-                # duration formatted as x hours 'xh'
-                return timedelta(hours=float(duration[:-1]))
-            # duration formatted as x days 'xd'
-            return timedelta(days=float(duration[:-1]))
+            return codec.parse_duration(duration)
 
     def print(self):
         ''' Custom print to handle printing from low levels, and add a
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+''' A reminder service for approaching Project due dates.
+
+Usage: python3 reminders.py [name] [path] [--lead 1d] [--lead 2h]
+           [--log FILE | --socket PATH|HOST:PORT] [--poll SECONDS]
+
+'''
+
+import heapq, json, socket, sys, threading, traceback
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import count
+from time import monotonic
+import codec
+
+# a reminder that Project 'name' (saved at 'path') is due at 'due_date', 'lead'
+#   ahead of it
+Reminder = namedtuple('Reminder', 'name path due_date lead')
+
+
+def format_lead(lead):
+    ''' Return timedelta 'lead' as a string of days, hours and minutes. '''
+    minutes = round(lead.total_seconds() / 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    return ' '.join('{}{}'.format(value, unit) for value, unit
+                    in ((days, 'd'), (hours, 'h'), (minutes, 'm'))
+                    if value) or '0m'
+
+
+def describe(reminder):
+    ''' Return a line of text describing 'reminder'. '''
+    due = codec.format_datetime(reminder.due_date)
+    if not reminder.lead:
+        return '{} is due now ({})'.format(reminder.name, due)
+    return '{} is due in {} ({})'.format(reminder.name,
+                                         format_lead(reminder.lead), due)
+
+
+def stdout_sink(reminder):
+    ''' Print 'reminder'. '''
+    print(describe(reminder), flush=True)
+
+
+class LogSink(object):
+    ''' A sink appending timestamped reminders to a log file. '''
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __call__(self, reminder):
+        with open(self.filename, 'a') as log:
+            log.write('{} {}\n'.format(codec.format_datetime(datetime.now()),
+                                       describe(reminder)))
+
+
+class SocketSink(object):
+    ''' A sink sending reminders as JSON datagrams to a local socket.
+
+    'address' is a Unix domain socket path, or a (host, port) tuple for UDP.
+        Reminders sent while nothing is listening are dropped.
+
+    '''
+    def __init__(self, address):
+        self.address = address
+        family = socket.AF_INET if isinstance(address, tuple) else \
+                socket.AF_UNIX
+        self._socket = socket.socket(family, socket.SOCK_DGRAM)
+
+    def __call__(self, reminder):
+        message = json.dumps(dict(
+            name     = reminder.name,
+            path     = reminder.path,
+            due_date = codec.format_datetime(reminder.due_date),
+            lead     = format_lead(reminder.lead),
+            text     = describe(reminder),
+        ))
+        try:
+            self._socket.sendto(message.encode(), self.address)
+        except OSError:
+            pass # no listener
+
+    def close(self):
+        self._socket.close()
+
+
+class ReminderService(object):
+    ''' A service firing reminders as the due dates of a Project tree approach.
+
+    Each incomplete Project with a due date has a reminder for each lead time
+        before it, in a heap of (time, ...) entries. The service thread waits
+        on a Condition until the earliest is due, so it uses no CPU while
+        idle. Changes are applied incrementally: rescheduling a Project
+        supersedes its queued entries (skipped lazily when popped), rather
+        than rebuilding the queue.
+
+    In-process changes are applied with update and remove. With a
+        'poll_interval', changes saved to disk by other processes are also
+        picked up by a ChangeDetector every 'poll_interval' seconds, which
+        patches them into 'root's tree, so the service should then own it.
+
+    Lead times already past when a Project is scheduled are skipped.
+
+    e.g.
+        service = ReminderService(main_project, sink=LogSink('due.log'))
+        service.start()
+        ...
+        project.set_due_date(new_due_date)
+        service.update(project)
+
+    '''
+    LEADS    = (timedelta(days=1), timedelta(hours=1), timedelta(0))
+    MAX_WAIT = 3600 # seconds, to recover from clock changes and suspends
+    COMPACT_FACTOR = 2 # rebuild the queue when this many times too long
+
+    def __init__(self, root, sink=stdout_sink, leads=LEADS,
+                 poll_interval=None):
+        ''' Create a service for 'root's tree, firing reminders to 'sink'.
+
+        'sink' is called with each Reminder as it fires, in the service
+            thread.
+        'leads' are the timedeltas before due dates to fire reminders at.
+        'poll_interval' is the number of seconds between checks for changes
+            on disk, or None to not check.
+
+        '''
+        self.root          = root
+        self.sink          = sink
+        self.leads         = sorted(leads, reverse=True)
+        self.poll_interval = poll_interval
+        self._detector     = None
+        if poll_interval:
+            from watcher import ChangeDetector
+            self._detector = ChangeDetector(root)
+        self._condition   = threading.Condition()
+        self._queue       = [] # heap of (time, sequence, key, generation, lead)
+        self._scheduled   = {} # id(Project) -> (Project, due date, generation)
+        self._sequence    = count() # tie breaker, so Projects aren't compared
+        self._generations = count()
+        self._stopping    = False
+        self._thread      = None
+        with self._condition:
+            self._schedule_tree(root)
+
+    def __len__(self):
+        ''' Return the number of Projects with pending reminders. '''
+        return sum(due is not None for project, due, generation
+                   in self._scheduled.values())
+
+    def _schedule(self, project, now=None):
+        ''' Queue the reminders for 'project', replacing any queued before.
+        '''
+        key = id(project)
+        due = None if project.complete else project.due_date
+        scheduled = self._scheduled.get(key)
+        if scheduled is not None and scheduled[1] == due:
+            return
+        generation = next(self._generations)
+        self._scheduled[key] = (project, due, generation)
+        if due is None:
+            return
+        now = now or datetime.now()
+        for lead in self.leads:
+            time = due - lead
+            if time >= now:
+                heapq.heappush(self._queue, (time, next(self._sequence), key,
+                                             generation, lead))
+        if len(self._queue) > self.COMPACT_FACTOR * len(self.leads) * \
+                len(self._scheduled) + 64:
+            self._compact()
+
+    def _schedule_tree(self, project):
+        ''' Schedule 'project' and any of its sub-projects not yet known. '''
+        now = datetime.now()
+        remaining = [project]
+        while remaining:
+            project = remaining.pop()
+            self._schedule(project, now)
+            remaining.extend(sub_project for sub_project
+                             in project.sub_projects.values()
+                             if id(sub_project) not in self._scheduled)
+
+    def _unschedule_tree(self, project):
+        ''' Forget 'project' and its sub-projects, superseding their queued
+            reminders.
+        '''
+        remaining = [project]
+        while remaining:
+            project = remaining.pop()
+            self._scheduled.pop(id(project), None)
+            remaining.extend(project.sub_projects.values())
+
+    def _compact(self):
+        ''' Rebuild the queue without superseded entries. '''
+        self._queue = [entry for entry in self._queue if self._current(entry)]
+        heapq.heapify(self._queue)
+
+    def _current(self, entry):
+        ''' Returns True if queued 'entry' hasn't been superseded. '''
+        scheduled = self._scheduled.get(entry[2])
+        return scheduled is not None and scheduled[2] == entry[3]
+
+    def update(self, project):
+        ''' Reschedule 'project' and any new sub-projects, e.g. after its due
+            date or completion changed. Safe to call from any thread.
+        '''
+        with self._condition:
+            self._schedule_tree(project)
+            self._condition.notify()
+
+    def remove(self, project):
+        ''' Cancel the reminders of 'project' and its sub-projects, e.g. after
+            it was removed from the tree. Safe to call from any thread.
+        '''
+        with self._condition:
+            self._unschedule_tree(project)
+
+    def _pop_due(self, now):
+        ''' Pop and return the Reminders due at 'now'. '''
+        reminders = []
+        while self._queue and self._queue[0][0] <= now:
+            entry = heapq.heappop(self._queue)
+            if self._current(entry):
+                project, due, generation = self._scheduled[entry[2]]
+                reminders.append(Reminder(project.name, project._save_file,
+                                          due, entry[4]))
+        return reminders
+
+    def _timeout(self, next_poll):
+        ''' Return the seconds to wait for the next reminder or poll. '''
+        timeout = self.MAX_WAIT
+        if self._queue:
+            timeout = min(timeout, (self._queue[0][0] -
+                                    datetime.now()).total_seconds())
+        if next_poll is not None:
+            timeout = min(timeout, next_poll - monotonic())
+        return max(timeout, 0)
+
+    def _fire(self, reminders):
+        for reminder in reminders:
+            try:
+                self.sink(reminder)
+            except Exception:
+                traceback.print_exc() # a broken sink shouldn't stop the rest
+
+    def run_pending(self, now=None):
+        ''' Fire the reminders due at 'now' (default now), returning them. '''
+        with self._condition:
+            reminders = self._pop_due(now or datetime.now())
+        self._fire(reminders)
+        return reminders
+
+    def poll(self):
+        ''' Apply changes saved to disk since the last poll, if polling. '''
+        if self._detector is None:
+            return
+        updated, removed, conflicts = self._detector.poll()
+        with self._condition:
+            for project in removed:
+                self._unschedule_tree(project)
+            for project in updated:
+                self._schedule_tree(project)
+
+    def run(self):
+        ''' Fire reminders as they fall due, until stopped. '''
+        next_poll = None
+        if self._detector is not None:
+            next_poll = monotonic() + self.poll_interval
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopping:
+                        return
+                    reminders = self._pop_due(datetime.now())
+                    polling = next_poll is not None and \
+                            monotonic() >= next_poll
+                    if reminders or polling:
+                        break
+                    self._condition.wait(self._timeout(next_poll))
+            self._fire(reminders)
+            if polling:
+                self.poll()
+                next_poll = monotonic() + self.poll_interval
+
+    def start(self):
+        ''' Run the service in a daemon thread. '''
+        self._stopping = False
+        self._thread = threading.Thread(target=self.run, daemon=True,
+                                        name='reminders')
+        self._thread.start()
+
+    def stop(self):
+        ''' Stop the service thread, waiting for it to finish. '''
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def main(args):
+    ''' Run the reminder service as specified by command line 'args'. '''
+    if '--help' in args:
+        print(__doc__)
+        return
+    leads = []
+    while '--lead' in args:
+        index = args.index('--lead')
+        leads.append(codec.parse_duration(args[index + 1]))
+        del args[index:index + 2]
+    options = {'leads': leads or ReminderService.LEADS, 'poll_interval': 60}
+    for flag in ('--log', '--socket', '--poll'):
+        if flag in args:
+            index = args.index(flag)
+            value = args[index + 1]
+            del args[index:index + 2]
+            if flag == '--log':
+                options['sink'] = LogSink(value)
+            elif flag == '--socket':
+                host, colon, port = value.rpartition(':')
+                options['sink'] = SocketSink((host, int(port)) if colon and
+                                             port.isdigit() else value)
+            else:
+                options['poll_interval'] = float(value) or None
+
+    from project import Project
+    name = args[0] if args else '_main'
+    path = args[1] if len(args) > 1 else 'projects'
+    service = ReminderService(Project(name, path=path), **options)
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+
+''' Capacity-aware resource leveling of a Project tree into a daily plan. '''
+
+import heapq
+from collections import namedtuple, deque
+from datetime import datetime, date, time, timedelta
+
+Slot = namedtuple('Slot', 'day offset hours')
+Slot.__doc__ = ''' 'hours' of work planned on 'day', 'offset' hours in. '''
+
+Bar = namedtuple('Bar', 'project start finish slots')
+Bar.__doc__ = ''' The planned 'start' and 'finish' datetimes of 'project'.
+
+'slots' is the list of Slots of work planned for the Project itself, which is
+    empty for Projects planned as a summary of their sub-projects.
+
+'''
+
+
+class Capacity(object):
+    ''' The hours of work available each day. '''
+    def __init__(self, weekly=(8, 8, 8, 8, 8, 0, 0), overrides=None,
+                 day_start=9):
+        ''' Create a capacity calendar.
+
+        'weekly' is the hours available each weekday, from Monday.
+        'overrides' is a dictionary of date -> hours for specific days (e.g.
+            holidays with no hours available).
+        'day_start' is the hour of the day work starts.
+
+        '''
+        self.weekly    = tuple(weekly)
+        self.overrides = dict(overrides or {})
+        self.day_start = day_start
+
+    def hours(self, day):
+        ''' Return the hours available on 'day'. '''
+        if day in self.overrides:
+            return self.overrides[day]
+        return self.weekly[day.weekday()]
+
+    def to_datetime(self, day, offset):
+        ''' Return the datetime 'offset' working hours into 'day'. '''
+        return datetime.combine(day, time(self.day_start)) + \
+                timedelta(hours=offset)
+
+    @staticmethod
+    def work_hours(duration):
+        ''' Return the hours of work 'duration' represents. '''
+        return duration / timedelta(hours=1)
+
+
+class _Node(object):
+    ''' A unit of work, or a zero-work milestone, in the leveling graph. '''
+    __slots__ = ('key', 'project', 'work', 'due', 'order', 'successors',
+                 'predecessors')
+
+    def __init__(self, key, project, work, due, order):
+        self.key          = key
+        self.project      = project
+        self.work         = work
+        self.due          = due
+        self.order        = order
+        self.successors   = []
+        self.predecessors = []
+
+
+class LevelingScheduler(object):
+    ''' A resource leveling scheduler for the incomplete Projects in a tree.
+
+    Projects without incomplete sub-projects are tasks, whose work is their
+        scheduled_time if set, otherwise their duration. Tasks are assigned
+        to the days of a Capacity calendar in order of due-date priority,
+        never starting before their precursors (and their ancestors'
+        precursors) are finished. A Project's due-date priority is the
+        earliest due date of itself, its ancestors and its successors.
+
+    Projects with incomplete sub-projects are planned as summaries, spanning
+        from when their sub-projects start until they finish.
+
+    After editing Projects, replan() only re-simulates from the first day the
+        edits can affect, reusing the plan up to that day.
+
+    e.g.
+        scheduler = LevelingScheduler(main_project, Capacity())
+        for bar in scheduler.plan():
+            print(bar.project.name, bar.start, bar.finish)
+
+    '''
+    MAX_DAYS = 3650 # planning horizon, to catch calendars without capacity
+    START, FINISH, TASK = 'start', 'finish', 'task'
+
+    def __init__(self, root, capacity=None, start=None):
+        ''' Create a scheduler for 'root's tree.
+
+        'capacity' is a Capacity (or anything with the same hours, to_datetime
+            and work_hours methods, e.g. a WorkingCalendar), defaulting to 8
+            hours each weekday.
+        'start' is the first date to plan work on, defaulting to today.
+
+        '''
+        self.root     = root
+        self.capacity = capacity or Capacity()
+        self.start    = start or date.today()
+        self._bars    = None
+
+    def plan(self):
+        ''' Plan all incomplete Projects, returning a list of Bars.
+
+        Raises a ValueError if precursors form a cycle, or if work can't be
+            completed within MAX_DAYS.
+
+        '''
+        self._build()
+        self._reset(self.start)
+        self._simulate()
+        return self.bars()
+
+    def replan(self, *projects):
+        ''' Update the plan after 'projects' were edited, added or removed.
+
+        Only days from the earliest one the edits can affect are re-planned.
+            Edits of a Project's sub-projects or precursors should include
+            that Project. Returns the updated list of Bars.
+
+        '''
+        if self._bars is None:
+            return self.plan()
+
+        old_nodes = self._nodes
+        old_ready = self._ready_day
+        old_finish = self._finish_at
+        old_log = self._log
+        self._build()
+
+        # nodes whose planning may change
+        edited = {id(project) for project in projects}
+        affected = set(old_nodes) ^ set(self._nodes)
+        for key, node in self._nodes.items():
+            old = old_nodes.get(key)
+            if id(node.project) in edited or old is None or \
+               old.due != node.due or old.work != node.work:
+                affected.add(key)
+
+        resume = None
+        for key in affected:
+            if key in old_ready:
+                day = old_ready[key]
+            elif key in self._nodes:
+                # new, so ready once its predecessors finish in the old plan
+                finishes = [old_finish.get(predecessor.key)
+                            for predecessor in self._nodes[key].predecessors]
+                if not finishes or None in finishes:
+                    day = self.start
+                else:
+                    day = max(finishes)[0]
+            else:
+                continue # removed and never ready, so never planned
+            resume = day if resume is None else min(resume, day)
+
+        if resume is None:
+            return self.bars()
+        if resume <= self.start:
+            self._reset(self.start)
+        else:
+            self._restore(resume, old_ready, old_finish, old_log)
+        self._simulate()
+        return self.bars()
+
+    def bars(self):
+        ''' Return the current plan as a list of Bars, ordered by start. '''
+        if self._bars is None:
+            self._make_bars()
+        return sorted(self._bars.values(), key=lambda bar: bar.start)
+
+    def bar(self, project):
+        ''' Return the planned Bar of 'project', or None if not planned. '''
+        if self._bars is None:
+            self._make_bars()
+        return self._bars.get(id(project))
+
+    def _build(self):
+        ''' Build the dependency graph of the incomplete Projects. '''
+        self._nodes = {}
+        self._start_of = {}  # id(project) -> key of node gating its start
+        self._finish_of = {} # id(project) -> key of node marking its finish
+        projects = []
+        # (project, key of parent's start node, inherited due date)
+        remaining = [(project, None, None)
+                     for project in reversed(list(
+                         self.root.sub_projects.values()))]
+        while remaining:
+            project, parent_start, inherited = remaining.pop()
+            if project.complete:
+                continue
+            projects.append(project)
+            due = min(filter(None, (project.due_date, inherited)),
+                      default=None)
+            children = [child for child in project.sub_projects.values()
+                        if not child.complete]
+            if children:
+                start = self._add_node(self.START, project, 0, due)
+                finish = self._add_node(self.FINISH, project, 0, due)
+                self._add_edge(start, finish)
+                remaining.extend((child, start, due)
+                                 for child in reversed(children))
+            else:
+                work = project.scheduled_time or project.duration
+                start = finish = self._add_node(self.TASK, project,
+                        self.capacity.work_hours(work) if work else 0, due)
+            if parent_start:
+                self._add_edge(parent_start, start)
+                parent_finish = self._finish_of[id(project._parent)]
+                self._add_edge(finish, parent_finish)
+            self._start_of[id(project)] = start
+            self._finish_of[id(project)] = finish
+
+        for project in projects:
+            for precursor in project.precursors.values():
+                if id(precursor) in self._finish_of:
+                    self._add_edge(self._finish_of[id(precursor)],
+                                   self._start_of[id(project)])
+
+        self._prioritise()
+
+    def _add_node(self, kind, project, work, due):
+        key = (kind, id(project))
+        self._nodes[key] = _Node(key, project, work, due, len(self._nodes))
+        return key
+
+    def _add_edge(self, from_key, to_key):
+        self._nodes[from_key].successors.append(self._nodes[to_key])
+        self._nodes[to_key].predecessors.append(self._nodes[from_key])
+
+    def _prioritise(self):
+        ''' Propagate due dates back from successors to their predecessors.
+
+        Raises a ValueError if the graph has a cycle.
+
+        '''
+        waiting = {key: len(node.predecessors)
+                   for key, node in self._nodes.items()}
+        order = [node for node in self._nodes.values()
+                 if not node.predecessors]
+        for node in order: # extended while iterating
+            for successor in node.successors:
+                waiting[successor.key] -= 1
+                if not waiting[successor.key]:
+                    order.append(successor)
+        if len(order) != len(self._nodes):
+            cycle = {node.project.name for node in self._nodes.values()
+                     if waiting[node.key]}
+            raise ValueError('Precursor cycle among: ' + ', '.join(cycle))
+
+        for node in reversed(order):
+            for successor in node.successors:
+                if successor.due and (node.due is None or
+                                      successor.due < node.due):
+                    node.due = successor.due
+
+    def _priority(self, node):
+        return (node.due or datetime.max, node.order)
+
+    def _reset(self, day):
+        ''' Reset the planning state to start from scratch on 'day'. '''
+        self._log = []        # Slots with keys, in planned order
+        self._ready_day = {}  # key -> day the node became ready
+        self._finish_at = {}  # key -> (day, offset) the node finished
+        self._remaining = {key: node.work
+                           for key, node in self._nodes.items()}
+        self._waiting = {key: len(node.predecessors)
+                         for key, node in self._nodes.items()}
+        self._queue = []      # heap of ready nodes with work
+        self._instant = deque() # ready nodes without work
+        self._day = day
+        for node in self._nodes.values():
+            if not node.predecessors:
+                self._make_ready(node, day)
+
+    def _restore(self, day, old_ready, old_finish, old_log):
+        ''' Restore the planning state at the start of 'day' from the old
+            plan, for the current graph.
+        '''
+        self._log = [entry for entry in old_log
+                     if entry[0].day < day and entry[1] in self._nodes]
+        self._finish_at = {key: finish for key, finish in old_finish.items()
+                           if finish[0] < day and key in self._nodes}
+        self._ready_day = {key: ready for key, ready in old_ready.items()
+                           if ready < day and key in self._nodes}
+        self._remaining = {key: node.work
+                           for key, node in self._nodes.items()}
+        for slot, key in self._log:
+            self._remaining[key] -= slot.hours
+        self._waiting = {}
+        for key, node in self._nodes.items():
+            self._waiting[key] = sum(predecessor.key not in self._finish_at
+                                     for predecessor in node.predecessors)
+        self._queue = []
+        self._instant = deque()
+        self._day = day
+        for key, node in self._nodes.items():
+            if key not in self._finish_at and not self._waiting[key]:
+                self._make_ready(node, self._ready_day.get(key, day))
+
+    def _make_ready(self, node, day):
+        self._ready_day[node.key] = day
+        if self._remaining[node.key] > 0:
+            heapq.heappush(self._queue, (self._priority(node), node.key))
+        else:
+            self._instant.append(node)
+
+    def _finish(self, node, day, offset):
+        self._finish_at[node.key] = (day, offset)
+        for successor in node.successors:
+            self._waiting[successor.key] -= 1
+            if not self._waiting[successor.key]:
+                self._make_ready(successor, day)
+
+    def _simulate(self):
+        ''' Plan from the current state until all work is finished. '''
+        self._bars = None
+        unfinished = len(self._nodes) - len(self._finish_at)
+        day = self._day
+        last_day = self.start + timedelta(days=self.MAX_DAYS)
+        while unfinished:
+            if day > last_day:
+                raise ValueError('Work cannot be finished within {} days'
+                                 .format(self.MAX_DAYS))
+            capacity = self.capacity.hours(day)
+            used = 0
+            while True:
+                if self._instant:
+                    self._finish(self._instant.popleft(), day, used)
+                    unfinished -= 1
+                elif self._queue and used < capacity:
+                    priority, key = heapq.heappop(self._queue)
+                    node = self._nodes[key]
+                    hours = min(self._remaining[key], capacity - used)
+                    self._log.append((Slot(day, used, hours), key))
+                    self._remaining[key] -= hours
+                    used += hours
+                    if self._remaining[key] > 1e-9:
+                        # continue when next possible
+                        heapq.heappush(self._queue, (priority, key))
+                    else:
+                        self._finish(node, day, used)
+                        unfinished -= 1
+                else:
+                    break
+            day += timedelta(days=1)
+        self._day = day
+
+    def _make_bars(self):
+        ''' Convert the planning state into Bars. '''
+        to_datetime = self.capacity.to_datetime
+        slots = {}
+        for slot, key in self._log:
+            slots.setdefault(key, []).append(slot)
+
+        self._bars = {}
+        starts = {}
+        # nodes were created parents first, so process children first
+        for node in sorted(self._nodes.values(), key=lambda node: node.order,
+                           reverse=True):
+            if node.key[0] == self.START:
+                continue
+            finish = to_datetime(*self._finish_at[node.key])
+            project = node.project
+            if node.key[0] == self.TASK:
+                node_slots = slots.get(node.key, [])
+                if node_slots:
+                    start = to_datetime(node_slots[0].day,
+                                        node_slots[0].offset)
+                else:
+                    start = finish
+            else:
+                start = starts.get(id(project), finish)
+            self._bars[id(project)] = Bar(project, start, finish,
+                                          slots.get(node.key, []))
+            parent = id(project._parent)
+            if parent not in starts or start < starts[parent]:
+                starts[parent] = start
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+''' Incremental prefix and fuzzy search over the Projects in a tree. '''
+
+import re
+from heapq import heappush, heappop
+from itertools import count
+
+WORD = re.compile(r'[^\W_]+') # words split at punctuation and underscores
+COUNTS = 0 # key of a trie node's counts of postings by weight
+
+
+class SearchIndex(object):
+    ''' A search index of Project names and details.
+
+    Words are stored in a prefix trie, with postings of the Projects using
+        them weighted by where they're used (whole name > name word > details
+        word), and each node counting the postings of each weight below it.
+        A prefix query descends the trie then walks it best first, by the
+        highest score any completion in each subtree could have (from its
+        best weight and depth, as shorter completions score higher), and
+        stops once enough results score more than anything left could. The
+        words of a multi-word query each
+        collect at most MAX_CANDIDATES Projects this way, and the complete
+        candidate sets are intersected smallest first, with any word having
+        more candidates checked against the (few) Projects left instead. An
+        optional trigram index of names supports fuzzy matching, scoring the
+        candidates of a query's rarest trigrams by similarity.
+
+    The index is updated incrementally with add, update and remove, rather
+        than rebuilt. An index created with a 'root' follows the changes to
+        its tree however they're made (e.g. edits, undo, archive restores or
+        the watcher's refreshes), as Projects report their changes to it, and
+        re-indexes the changed Projects before the next search.
+
+    e.g.
+        index = SearchIndex(main_project)
+        for project in index.search('rel'):
+            print(project.name)
+
+    '''
+    NAME, NAME_WORD, DETAILS_WORD = 4, 2, 1 # posting weights
+    CANDIDATE_FACTOR = 4  # candidates collected per requested result
+    MAX_CANDIDATES   = 1000 # per word of a multi-word query
+    FUZZY_TRIGRAMS   = 3  # rarest query trigrams to take fuzzy candidates from
+    MIN_SIMILARITY   = 0.3
+
+    def __init__(self, root=None, fuzzy=True, details=True):
+        ''' Create an index, of 'root's tree if given.
+
+        'fuzzy' enables the trigram index for fuzzy name matching.
+        'details' includes the words of Projects' details, not just names.
+
+        '''
+        self.fuzzy    = fuzzy
+        self.details  = details
+        # char -> node, with None -> {id: weight} postings and COUNTS ->
+        #   {weight: number of postings in the node's subtree}
+        self._trie    = {COUNTS: {}}
+        self._trigrams = {} # trigram -> set of ids
+        self._projects = {} # id -> Project
+        self._terms   = {} # id -> (name, {term: weight}) as indexed
+        self._children = {} # id -> set of ids of the sub-projects indexed
+        self._changed = {} # id -> Project changed since last indexed
+        self.root = root
+        if root is not None:
+            self.add_tree(root)
+            if root._search_index is None:
+                type(root)._search_indexes += 1
+            root._search_index = self
+
+    def close(self):
+        ''' Stop following the changes to the root's tree. '''
+        if self.root is not None and self.root._search_index is self:
+            self.root._search_index = None
+            type(self.root)._search_indexes -= 1
+
+    def __len__(self):
+        return len(self._projects)
+
+    def add_tree(self, root):
+        ''' Add all of 'root's sub-projects (not 'root' itself). '''
+        remaining = [root]
+        while remaining:
+            project = remaining.pop()
+            if project is not root:
+                self.add(project)
+            self._children[id(project)] = set(
+                    map(id, project.sub_projects.values()))
+            remaining.extend(project.sub_projects.values())
+
+    def changed(self, project):
+        ''' Note that 'project' in the followed tree has changed, to be
+            re-indexed (with its added and removed sub-projects) before the
+            next search.
+        '''
+        self._changed[id(project)] = project
+
+    def _index_changes(self):
+        ''' Re-index the Projects changed since last indexed. '''
+        changed = list(self._changed.values())
+        self._changed = {}
+        # removals first, so Projects moved within the tree are re-added
+        for project in changed:
+            indexed = self._children.get(id(project))
+            if indexed is None:
+                continue # not (or no longer) in the indexed tree
+            current = set(map(id, project.sub_projects.values()))
+            for key in indexed - current:
+                if key in self._projects:
+                    self.remove(self._projects[key])
+        for project in changed:
+            key = id(project)
+            if key not in self._children:
+                continue # not (or no longer) in the indexed tree
+            if project is not self.root:
+                self.update(project)
+            for sub_project in project.sub_projects.values():
+                if id(sub_project) not in self._children:
+                    self.add(sub_project)
+                    self.add_tree(sub_project)
+            self._children[key] = set(map(id, project.sub_projects.values()))
+
+    def _project_terms(self, project):
+        ''' Return a dictionary of term -> weight for 'project'. '''
+        terms = {}
+        if self.details and project.details:
+            for word in WORD.findall(project.details.lower()):
+                terms[word] = self.DETAILS_WORD
+        for word in WORD.findall(project.name.lower()):
+            terms[word] = self.NAME_WORD
+        terms[project.name.lower()] = self.NAME
+        return terms
+
+    @staticmethod
+    def _name_trigrams(name):
+        padded = '  ' + name.lower() + ' '
+        return {padded[index:index+3] for index in range(len(padded) - 2)}
+
+    def add(self, project):
+        ''' Index 'project', replacing any existing entry for it. '''
+        key = id(project)
+        if key in self._terms:
+            self.remove(project, sub_projects=False)
+        terms = self._project_terms(project)
+        for term, weight in terms.items():
+            node = self._trie
+            self._count(node, weight, 1)
+            for char in term:
+                node = node.setdefault(char, {COUNTS: {}})
+                self._count(node, weight, 1)
+            node.setdefault(None, {})[key] = weight
+        if self.fuzzy:
+            for trigram in self._name_trigrams(project.name):
+                self._trigrams.setdefault(trigram, set()).add(key)
+        self._projects[key] = project
+        self._terms[key] = (project.name, terms)
+
+    def update(self, project):
+        ''' Re-index 'project' after it was edited or renamed. '''
+        name, terms = self._terms.get(id(project), (None, None))
+        if name != project.name or terms != self._project_terms(project):
+            self.add(project)
+
+    def remove(self, project, sub_projects=True):
+        ''' Remove 'project' (and its sub-projects) from the index. '''
+        remaining = [project]
+        while remaining:
+            project = remaining.pop()
+            if sub_projects:
+                remaining.extend(project.sub_projects.values())
+            key = id(project)
+            self._children.pop(key, None)
+            if key not in self._terms:
+                continue
+            name, terms = self._terms.pop(key)
+            del self._projects[key]
+            for term in terms:
+                self._remove_posting(term, key)
+            if self.fuzzy:
+                for trigram in self._name_trigrams(name):
+                    postings = self._trigrams.get(trigram)
+                    if postings is not None:
+                        postings.discard(key)
+                        if not postings:
+                            del self._trigrams[trigram]
+
+    @staticmethod
+    def _count(node, weight, change):
+        ''' Add 'change' to 'node's count of postings of 'weight'. '''
+        counts = node[COUNTS]
+        counts[weight] = counts.get(weight, 0) + change
+        if not counts[weight]:
+            del counts[weight]
+
+    def _remove_posting(self, term, key):
+        ''' Remove 'key' from 'term's postings, pruning emptied nodes. '''
+        path = [self._trie]
+        for char in term:
+            path.append(path[-1].get(char))
+            if path[-1] is None:
+                return
+        postings = path[-1].get(None, {})
+        weight = postings.pop(key, None)
+        if weight is None:
+            return
+        if not postings:
+            path[-1].pop(None, None)
+        for node in path:
+            self._count(node, weight, -1)
+        for depth in range(len(term), 0, -1):
+            if path[depth][COUNTS]:
+                break
+            del path[depth - 1][term[depth - 1]]
+
+    @staticmethod
+    def _score(weight, extra):
+        ''' Return the score of a posting of 'weight' for a term 'extra'
+            chars longer than the prefix, as closer completions score higher.
+        '''
+        return weight * (1 + 1 / (1 + extra))
+
+    def _prefix_scores(self, prefix, limit, best=True):
+        ''' Return a dictionary of id -> score for terms starting with
+            'prefix', collecting at least 'limit' ids if there are that many,
+            including the 'limit' best scoring if 'best', otherwise the first
+            'limit' found (from the best subtrees first).
+
+        Collecting fewer than 'limit' ids means all matches were collected.
+
+        '''
+        node = self._trie
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return {}
+        scores = {}
+        order = count() # ties broken by order, as nodes don't compare
+        # (-best possible score in the node's subtree, order, node, extra
+        #   chars beyond the prefix)
+        heap = [(-self._score(max(node[COUNTS]), 0), 0, node, 0)]
+        checked = None
+        while heap:
+            bound, _, node, extra = heappop(heap)
+            bound = -bound
+            if len(scores) >= limit and bound != checked:
+                # every posting scoring more than 'bound' has been collected,
+                #   so those collected are the best if there are enough
+                checked = bound
+                if not best or \
+                   sum(score > bound for score in scores.values()) >= limit:
+                    break
+            postings = node.get(None)
+            if postings:
+                for key, weight in postings.items():
+                    score = self._score(weight, extra)
+                    if score > scores.get(key, 0):
+                        scores[key] = score
+            for char, child in node.items():
+                if isinstance(char, str):
+                    heappush(heap, (-self._score(max(child[COUNTS]),
+                                                 extra + 1),
+                                    next(order), child, extra + 1))
+        return scores
+
+    def _term_score(self, key, prefix):
+        ''' Return the best score of the terms of 'key' starting with
+            'prefix', as _prefix_scores scores them, or 0 if there are none.
+        '''
+        return max((self._score(weight, len(term) - len(prefix))
+                    for term, weight in self._terms[key][1].items()
+                    if term.startswith(prefix)), default=0)
+
+    def _fuzzy_scores(self, query, limit):
+        ''' Return a dictionary of id -> similarity of names to 'query'. '''
+        trigrams = self._name_trigrams(query)
+        postings = sorted((self._trigrams[trigram] for trigram in trigrams
+                           if trigram in self._trigrams), key=len)
+        candidates = set()
+        for posting in postings[:self.FUZZY_TRIGRAMS]:
+            candidates.update(posting)
+        scores = {}
+        for key in candidates:
+            name_trigrams = self._name_trigrams(self._terms[key][0])
+            shared = len(trigrams & name_trigrams)
+            similarity = shared / (len(trigrams) + len(name_trigrams) -
+                                   shared)
+            if similarity >= self.MIN_SIMILARITY:
+                scores[key] = similarity
+        return scores
+
+    def _all_words_scores(self, words):
+        ''' Return a dictionary of id -> total score of the Projects matching
+            every word of 'words', as prefixes of their terms.
+
+        Unless no word has fewer than MAX_CANDIDATES matches, in which case
+            only the matches collected for the most selective one are checked.
+
+        '''
+        complete = []; partial = {} # partial word -> collected scores
+        for word in words:
+            scores = self._prefix_scores(word, self.MAX_CANDIDATES, False)
+            if len(scores) < self.MAX_CANDIDATES:
+                complete.append(scores)
+            else:
+                partial[word] = scores
+        if complete:
+            complete.sort(key=len)
+            scores = complete[0]
+            for other in complete[1:]:
+                scores = {key: score + other[key]
+                          for key, score in scores.items() if key in other}
+        else:
+            # longer prefixes are usually more selective
+            scores = partial.pop(max(partial, key=len))
+        for word in partial:
+            filtered = {}
+            for key, score in scores.items():
+                word_score = self._term_score(key, word)
+                if word_score:
+                    filtered[key] = score + word_score
+            scores = filtered
+        return scores
+
+    def search(self, query, limit=20):
+        ''' Return up to 'limit' Projects matching 'query', best first.
+
+        Each word of 'query' must prefix a word of the Project's name or
+            details. If too few Projects match, fuzzy name matches are added
+            after them (if enabled).
+
+        '''
+        words = WORD.findall(query.lower())
+        if not words:
+            return []
+        if self._changed:
+            self._index_changes()
+        if len(words) == 1:
+            scores = self._prefix_scores(words[0],
+                                         limit * self.CANDIDATE_FACTOR)
+        else:
+            scores = self._all_words_scores(set(words))
+
+        ranked = sorted(scores, key=lambda key: (-scores[key],
+                        self._projects[key].name))[:limit]
+        if self.fuzzy and len(ranked) < limit:
+            found = set(ranked)
+            fuzzy = self._fuzzy_scores(query.strip(), limit)
+            ranked.extend(sorted((key for key in fuzzy if key not in found),
+                                 key=lambda key: -fuzzy[key])
+                          [:limit - len(ranked)])
+        return [self._projects[key] for key in ranked]
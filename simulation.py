@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+''' Monte Carlo schedule risk simulation over a Project tree.
+
+Requires NumPy.
+
+'''
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+import numpy as np
+
+Forecast = namedtuple('Forecast', 'probability finishes')
+Forecast.__doc__ = ''' The simulated outlook of a Project.
+
+'probability' is the probability of finishing by the due date, or None if the
+    Project has no due date.
+'finishes' is a dictionary of percentile -> finish datetime.
+
+'''
+
+
+class _Group(object):
+    ''' A sibling group in progress in ScheduleSimulation._simulate_group. '''
+    def __init__(self, order, start):
+        ''' Start simulating the Projects in topological 'order', which
+            can't start before the 'start' array of hours.
+        '''
+        names = set(project.name for project in order)
+        self.order    = iter(order)
+        self.start    = start
+        self.finish   = start # overall finish of the Projects so far
+        self.finishes = {}    # name -> finish array, until all successors use
+        self.uses     = {}    # name -> number of successors yet to start
+        self.waiting  = None  # (Project, finish) until its sub-projects finish
+        for project in order:
+            for name in project.precursors:
+                if name in names:
+                    self.uses[name] = self.uses.get(name, 0) + 1
+
+    def started(self, project):
+        ''' Return the start array of 'project', releasing the finishes of
+            its precursors it was the last successor of.
+        '''
+        start = self.start
+        for name in project.precursors:
+            if name in self.finishes:
+                start = np.maximum(start, self.finishes[name])
+            if name in self.uses:
+                self.uses[name] -= 1
+                if not self.uses[name]:
+                    self.finishes.pop(name, None)
+        return start
+
+    def finished(self, project, finish):
+        ''' Record the 'finish' array of 'project'. '''
+        if self.uses.get(project.name):
+            self.finishes[project.name] = finish
+        self.finish = np.maximum(self.finish, finish)
+
+
+class ScheduleSimulation(object):
+    ''' A Monte Carlo simulation of when the Projects in a tree will finish.
+
+    Each incomplete Project's duration is sampled from a triangular
+        distribution around its stored duration, for all samples at once as
+        NumPy arrays. The samples are propagated through each sibling group's
+        precursor graph in topological order: a Project starts once its
+        precursors and its parent's precursors are finished, and finishes
+        once its own work and all its sub-projects are finished.
+
+    With a WorkingCalendar, durations and due dates are measured in working
+        time, so work is only done in working hours.
+
+    e.g.
+        forecasts = ScheduleSimulation(main_project, samples=10000).run()
+        print(forecasts['release'].probability)
+
+    '''
+    HOUR = timedelta(hours=1)
+
+    def __init__(self, root, samples=10000, spread=(0.2, 0.5),
+                 percentiles=(50, 80, 95), start=None, seed=None,
+                 sampler=None, calendar=None):
+        ''' Set up a simulation of 'root's tree.
+
+        'samples' is the number of scenarios to simulate.
+        'spread' is a tuple of the (lower, upper) proportions of the stored
+            duration which the triangular distribution extends below/above it.
+        'percentiles' are the finish time percentiles to report.
+        'start' is the datetime work starts from, defaulting to now.
+        'seed' seeds the random number generator, for repeatable results.
+        'sampler' optionally overrides the duration distribution. It is called
+            as sampler(project, hours, rng, samples) with the Project's stored
+            duration in hours, and should return an array of 'samples'
+            durations in hours, or None to use the default distribution.
+        'calendar' is an optional WorkingCalendar to measure time in, in which
+            case sampled hours are working hours.
+
+        '''
+        self.root        = root
+        self.samples     = samples
+        self.spread      = spread
+        self.percentiles = percentiles
+        self.start       = start or datetime.today()
+        self.sampler     = sampler
+        self.calendar    = calendar
+        self._rng        = np.random.default_rng(seed)
+
+    def run(self):
+        ''' Run the simulation, returning a dictionary of name -> Forecast.
+
+        Raises a ValueError if a sibling group's precursors form a cycle.
+
+        '''
+        self._forecasts = {}
+        self._zeros = np.zeros(self.samples)
+        self._simulate_group(self.root.sub_projects.values(), self._zeros)
+        return self._forecasts
+
+    def _simulate_group(self, projects, start):
+        ''' Simulate a sibling group of 'projects', which can't start before
+            the 'start' array of hours. Returns their overall finish array.
+
+        Sub-groups are simulated from a stack of the groups in progress
+            rather than recursively, so deep trees don't reach the recursion
+            limit. Each finish array is only kept until all its successors
+            have started.
+
+        '''
+        stack = [_Group(self._topological_order(projects), start)]
+        while True:
+            group = stack[-1]
+            if group.waiting is not None:
+                # its sub-projects have finished
+                project, finish = group.waiting
+                group.waiting = None
+                finish = np.maximum(finish, sub_finish)
+                self._forecast(project, finish)
+                group.finished(project, finish)
+            project = next(group.order, None)
+            if project is None:
+                stack.pop()
+                if not stack:
+                    return group.finish
+                sub_finish = group.finish
+                continue
+
+            project_start = group.started(project)
+            if project.complete:
+                self._forecast_complete(project)
+                group.finished(project, self._zeros)
+                continue
+            finish = project_start + self._sample(project)
+            if project.sub_projects:
+                group.waiting = (project, finish)
+                stack.append(_Group(self._topological_order(
+                        project.sub_projects.values()), project_start))
+            else:
+                self._forecast(project, finish)
+                group.finished(project, finish)
+
+    @staticmethod
+    def _topological_order(projects):
+        ''' Return 'projects' ordered so precursors precede their successors.
+
+        Only precursors within 'projects' are considered.
+
+        '''
+        projects = list(projects)
+        by_name = {project.name: project for project in projects}
+        waiting = {}    # name -> number of unprocessed precursors
+        successors = {} # name -> list of successor Projects
+        for project in projects:
+            precursors = [name for name in project.precursors
+                          if name in by_name]
+            waiting[project.name] = len(precursors)
+            for name in precursors:
+                successors.setdefault(name, []).append(project)
+
+        order = [project for project in projects if not waiting[project.name]]
+        for project in order: # extended while iterating
+            for successor in successors.get(project.name, []):
+                waiting[successor.name] -= 1
+                if not waiting[successor.name]:
+                    order.append(successor)
+
+        if len(order) != len(projects):
+            cycle = [name for name, count in waiting.items() if count]
+            raise ValueError('Precursor cycle among: ' + ', '.join(cycle))
+        return order
+
+    def _sample(self, project):
+        ''' Return an array of sampled durations of 'project' in hours. '''
+        hours = 0
+        if project.duration:
+            if self.calendar:
+                hours = self.calendar.work_hours(project.duration)
+            else:
+                hours = project.duration / self.HOUR
+        if self.sampler:
+            sampled = self.sampler(project, hours, self._rng, self.samples)
+            if sampled is not None:
+                return sampled
+        if not hours:
+            return self._zeros
+        low, high = self.spread
+        return self._rng.triangular(hours * (1 - low), hours,
+                                    hours * (1 + high), self.samples)
+
+    def _to_datetime(self, hours):
+        ''' Convert an offset in hours from the start to a datetime. '''
+        if self.calendar:
+            return self.calendar.add_hours(self.start, float(hours))
+        return self.start + timedelta(hours=float(hours))
+
+    def _to_hours(self, date):
+        ''' Convert a datetime to an offset in hours from the start. '''
+        if self.calendar:
+            return self.calendar.between(self.start, date) / self.HOUR
+        return (date - self.start) / self.HOUR
+
+    def _forecast(self, project, finish):
+        ''' Record the Forecast of 'project' from its 'finish' array. '''
+        probability = None
+        if project.due_date:
+            due = self._to_hours(project.due_date)
+            probability = float(np.count_nonzero(finish <= due)) / \
+                    self.samples
+        finishes = {}
+        if self.percentiles:
+            values = np.percentile(finish, self.percentiles)
+            finishes = {percentile: self._to_datetime(value)
+                        for percentile, value in zip(self.percentiles, values)}
+        self._forecasts[project.name] = Forecast(probability, finishes)
+
+    def _forecast_complete(self, project):
+        ''' Record the Forecast of a complete 'project'. '''
+        completed = project.completion_date or self.start
+        probability = None
+        if project.due_date:
+            probability = float(completed <= project.due_date)
+        self._forecasts[project.name] = Forecast(probability,
+                {percentile: completed for percentile in self.percentiles})
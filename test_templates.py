@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import shutil, tempfile, unittest
+from datetime import datetime
+from project import Project
+from archive import Archive
+
+
+class TestTemplateInstances(unittest.TestCase):
+    ''' Changes to templates which would leave their instances unloadable. '''
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.root = Project('_main', path=self.path)
+        templates = self.root.create_sub_project('templates')
+        self.template = templates.create_sub_project('release')
+        for name in ('s7', 's8'):
+            self.template.create_sub_project(name, details=name,
+                    complete=True, completion_date='01/Jan/2029 - 10:00')
+        self.template.set_complete('02/Jan/2029 - 10:00')
+        self.root.save()
+        self.other = self.root.create_sub_project('other')
+        for index in range(3):
+            self.root.create_from_template(self.template,
+                    'rel{}'.format(index)).set_incomplete()
+        self.root.save()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def assertLoadable(self, names=('s7', 's8')):
+        root = Project('_main', path=self.path)
+        for index in range(3):
+            instance = root.sub_projects['rel{}'.format(index)]
+            self.assertEqual(list(instance.sub_projects), list(names))
+        root.get_merkle_hash()
+        return root
+
+    def test_rename(self):
+        for project in (self.template, self.template.sub_projects['s7'],
+                        self.root.sub_projects['templates']):
+            with self.assertRaises(ValueError):
+                project.rename('renamed')
+        self.root.save()
+        self.assertLoadable()
+
+    def test_move(self):
+        for project in (self.template, self.template.sub_projects['s7']):
+            with self.assertRaises(ValueError):
+                project.move_to(self.other)
+        self.root.save()
+        self.assertLoadable()
+
+    def test_remove(self):
+        templates = self.root.sub_projects['templates']
+        for parent, project in ((self.template, self.template.sub_projects[
+                                    's8']), (templates, self.template),
+                                (self.root, templates)):
+            with self.assertRaises(ValueError):
+                parent.remove_sub_project(project)
+        self.root.save()
+        self.assertLoadable()
+
+    def test_archive(self):
+        archive = Archive(self.root)
+        with self.assertRaises(ValueError):
+            archive.archive(self.template)
+        # the instances' (own copies of) completed sub-projects are archived
+        archived = archive.archive_completed(datetime(2030, 1, 1))
+        self.assertEqual(len(archived), 6)
+        self.assertNotIn(self.template, archived)
+        root = self.assertLoadable(names=())
+        archive = Archive(root)
+        self.assertEqual(archive.restore(root.sub_projects['rel0'], 's8')
+                         .details, 's8')
+
+    def test_unused_template(self):
+        # instances removed with their template don't prevent its removal
+        for index in range(3):
+            self.root.remove_sub_project(
+                    self.root.sub_projects['rel{}'.format(index)])
+        self.template.sub_projects['s7'].rename('s7b')
+        self.root.remove_sub_project(self.root.sub_projects['templates'])
+        self.root.save()
+        self.assertEqual(list(Project('_main', path=self.path).sub_projects),
+                         ['other'])
+
+
+if __name__ == '__main__':
+    unittest.main()
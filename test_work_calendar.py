@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import unittest
+from datetime import datetime, timedelta
+from work_calendar import WorkingCalendar
+
+
+class TestWorkingCalendar(unittest.TestCase):
+    ''' Regression tests for extending the tables backwards. '''
+    def test_between_end_before_base(self):
+        # a fresh calendar's tables start at the first date looked up
+        calendar = WorkingCalendar()
+        start = datetime(2030, 3, 1, 12) # a Friday
+        self.assertEqual(calendar.between(start, start - timedelta(days=7)),
+                         timedelta(hours=-40))
+        self.assertEqual(calendar.between(start - timedelta(days=7), start),
+                         timedelta(hours=40))
+
+    def test_add_negative_duration(self):
+        calendar = WorkingCalendar()
+        monday = datetime(2030, 3, 4, 10)
+        self.assertEqual(calendar.add(monday, timedelta(hours=-2)),
+                         datetime(2030, 3, 1, 16))
+        self.assertEqual(calendar.add(monday, timedelta(days=-2)),
+                         calendar.subtract(monday, timedelta(days=2)))
+        self.assertEqual(calendar.add_hours(monday, -41),
+                         datetime(2030, 2, 25, 9))
+
+    def test_day_boundary(self):
+        # a day is a working day, like longer durations
+        calendar = WorkingCalendar()
+        monday = datetime(2030, 3, 4, 9)
+        self.assertEqual(calendar.working_duration(timedelta(days=1)), 8 * 60)
+        self.assertEqual(calendar.working_duration(timedelta(days=-1)),
+                         -8 * 60)
+        self.assertLess(calendar.working_duration(timedelta(days=1)),
+                        calendar.working_duration(timedelta(days=1.1)))
+        self.assertEqual(calendar.add(monday, timedelta(days=1)),
+                         datetime(2030, 3, 4, 17))
+        self.assertEqual(calendar.add(monday, timedelta(days=1.5)),
+                         datetime(2030, 3, 5, 13))
+
+    def test_subtract_before_base(self):
+        calendar = WorkingCalendar()
+        calendar.add(datetime(2030, 3, 4, 10), timedelta(hours=1))
+        self.assertEqual(calendar.subtract(datetime(2030, 3, 4, 10),
+                                           timedelta(days=400)),
+                         calendar.add(datetime(2030, 3, 4, 10),
+                                      timedelta(days=-400)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import os
+from time import sleep
+
+
+class ChangeDetector(object):
+    ''' A polling detector of externally changed files in a Project tree.
+
+    Keeps an index of the (mtime, size, inode) of every record in the tree's
+        directories, rescanned with os.scandir on each poll. Only the Projects
+        whose records changed are re-read and patched into the live tree,
+        including loading newly added sub-projects and dropping deleted ones.
+
+    e.g.
+        detector = ChangeDetector(main_project)
+        while True:
+            updated, removed, conflicts = detector.poll()
+            ...
+
+    '''
+    EXTENSION = '.txt'
+
+    def __init__(self, root):
+        ''' Create a detector for the tree with root Project 'root'. '''
+        self.root   = root
+        self._index = self.scan()
+
+    def scan(self):
+        ''' Return a dictionary of record path -> (mtime, size, inode). '''
+        index = {}
+        try:
+            stat = os.stat(self.root._save_file)
+        except FileNotFoundError:
+            return index
+        index[self.root._save_file] = \
+                (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+        directories = [self.root._sub_project_path]
+        while directories:
+            directory = directories.pop()
+            try:
+                entries = os.scandir(directory)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue # hidden, e.g. a batch staging directory
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.name.endswith(self.EXTENSION):
+                        stat = entry.stat(follow_symlinks=False)
+                        index[entry.path] = \
+                                (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        return index
+
+    def changes(self):
+        ''' Rescan, and return a tuple of (changed, removed) record paths.
+
+        'changed' includes added records. Both are sorted by path, so parent
+            records precede those of their sub-projects.
+
+        '''
+        index = self.scan()
+        old_index = self._index
+        self._index = index
+        changed = sorted(path for path, stat in index.items()
+                         if old_index.get(path) != stat)
+        removed = sorted(path for path in old_index if path not in index)
+        return changed, removed
+
+    def poll(self):
+        ''' Rescan, and patch any changes into the live Project tree.
+
+        Returns a tuple of (updated, removed, conflicts) Project lists.
+            'updated' Projects were changed from disk (including parents of
+            added sub-projects). 'removed' Projects had their records deleted,
+            and were removed from their parents in memory. 'conflicts' changed
+            on disk but have unsaved local modifications, so were not updated.
+
+        '''
+        changed, removed = self.changes()
+        if not (changed or removed):
+            return [], [], []
+
+        projects = self._get_projects()
+        updated = []; dropped = []; conflicts = []
+        for path in changed:
+            project = projects.get(path)
+            if project is None:
+                # added, and loaded from its parent's record if listed there
+                continue
+            result = project._refresh_record()
+            if result == project.UPDATED:
+                updated.append(project)
+            elif result == project.CONFLICT:
+                conflicts.append(project)
+
+        removed_paths = set(removed)
+        for path in removed:
+            project = projects.get(path)
+            if project is None or project._parent is None:
+                continue
+            parent = project._parent
+            if parent._save_file in removed_paths:
+                # part of a removed subtree
+                dropped.append(project)
+            elif parent.sub_projects.get(project.name) is project:
+                # deleted without its parent's record being updated
+                parent._detach_sub_project(project)
+                dropped.append(project)
+            elif parent in updated:
+                # already dropped when its parent was updated
+                dropped.append(project)
+
+        return updated, dropped, conflicts
+
+    def _get_projects(self):
+        ''' Return a dictionary of record path -> live Project. '''
+        projects = {}
+        remaining = [self.root]
+        while remaining:
+            project = remaining.pop()
+            projects[project._save_file] = project
+            remaining.extend(project.sub_projects.values())
+        return projects
+
+    def watch(self, interval=1.0, callback=None):
+        ''' Poll every 'interval' seconds, forever.
+
+        'callback' is called with the (updated, removed, conflicts) results of
+            each poll that found changes.
+
+        '''
+        while True:
+            results = self.poll()
+            if callback and any(results):
+                callback(*results)
+            sleep(interval)
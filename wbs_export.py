@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+''' Streaming Work Breakdown Structure export to Graphviz DOT and SVG.
+
+Usage: python3 wbs_export.py output.dot|output.svg [name] [path]
+           [--depth N] [--subtree NAME] [--hide-complete]
+
+'''
+
+import sys
+from xml.sax.saxutils import escape
+
+
+class WBSExporter(object):
+    ''' A streaming exporter of a Project tree's Work Breakdown Structure.
+
+    Projects are visited depth-first straight from the tree, and output is
+        written as it is generated, so memory use is bounded by the tree depth
+        and sibling counts rather than the document size.
+
+    DOT output lists the hierarchy and precursor edges for Graphviz to lay out.
+        SVG output is laid out directly as a top-down tree in linear time: a
+        counting pass sizes the drawing, then a post-order pass places each
+        leaf in the next column and centres each parent over its children.
+
+    e.g.
+        exporter = WBSExporter(main_project, max_depth=3, show_complete=False)
+        exporter.write_svg('wbs.svg')
+
+    '''
+    # SVG layout, in pixels
+    NODE_WIDTH  = 140
+    NODE_HEIGHT = 40
+    X_GAP       = 20
+    Y_GAP       = 50
+    MARGIN      = 20
+    FILL          = '#dde8f4'
+    COMPLETE_FILL = '#d8eed8'
+
+    def __init__(self, root, max_depth=None, subtree=None, show_complete=True):
+        ''' Create an exporter for 'root's tree.
+
+        'max_depth' limits the levels exported below the top, if not None.
+            Projects with sub-projects beyond the limit are labelled with the
+            number hidden.
+        'subtree' is the name of a Project to export instead of the whole tree.
+        'show_complete' includes complete Projects (and their sub-projects)
+            if True.
+
+        Raises a KeyError if 'subtree' is not in the tree.
+
+        '''
+        if subtree is not None:
+            root = self._find(root, subtree)
+        self.root          = root
+        self.max_depth     = max_depth
+        self.show_complete = show_complete
+
+    @staticmethod
+    def _find(root, name):
+        ''' Return the Project called 'name' in 'root's tree. '''
+        remaining = [root]
+        while remaining:
+            project = remaining.pop()
+            if project.name == name:
+                return project
+            remaining.extend(project.sub_projects.values())
+        raise KeyError(name)
+
+    def _children(self, project, depth):
+        ''' Return the exported sub-projects of 'project' at 'depth'. '''
+        if self.max_depth is not None and depth >= self.max_depth:
+            return []
+        return [sub_project for sub_project in project.sub_projects.values()
+                if self.show_complete or not sub_project.complete]
+
+    def _label_lines(self, project, depth):
+        ''' Return the lines of text labelling 'project'. '''
+        lines = [project.name]
+        details = []
+        if project.due_date:
+            details.append('due ' + project.get_due_date_str())
+        if project.duration:
+            details.append(project.get_duration_str())
+        if details:
+            lines.append(', '.join(details))
+        hidden = len(project.sub_projects) - len(self._children(project,
+                                                                 depth))
+        if hidden:
+            lines.append('(+{} hidden)'.format(hidden))
+        return lines
+
+    def walk(self):
+        ''' Yield (project, depth) for exported Projects in pre-order. '''
+        remaining = [(self.root, 0)]
+        while remaining:
+            project, depth = remaining.pop()
+            yield project, depth
+            remaining.extend((child, depth + 1) for child in
+                             reversed(self._children(project, depth)))
+
+    @staticmethod
+    def _open(file):
+        ''' Return (file object, should close) for a path or file object. '''
+        if isinstance(file, str):
+            return open(file, 'w'), True
+        return file, False
+
+    def write_dot(self, file):
+        ''' Stream the WBS in Graphviz DOT format to 'file' (path or file). '''
+        out, close = self._open(file)
+        try:
+            out.write('digraph WBS {\n'
+                      '  rankdir=TB;\n'
+                      '  node [shape=box, style="rounded,filled", '
+                      'fillcolor="%s"];\n' % self.FILL)
+            for project, depth in self.walk():
+                node = self._dot_id(project)
+                label = '\\n'.join(self._dot_escape(line) for line
+                                   in self._label_lines(project, depth))
+                attributes = 'label="{}"'.format(label)
+                if project.complete:
+                    attributes += ', fillcolor="{}"'.format(
+                            self.COMPLETE_FILL)
+                out.write('  {} [{}];\n'.format(node, attributes))
+                if project is not self.root:
+                    out.write('  {} -> {};\n'.format(
+                              self._dot_id(project._parent), node))
+                    for precursor in project.precursors.values():
+                        if self.show_complete or not precursor.complete:
+                            out.write('  {} -> {} [style=dashed, '
+                                      'constraint=false];\n'.format(
+                                      self._dot_id(precursor), node))
+            out.write('}\n')
+        finally:
+            if close:
+                out.close()
+
+    @staticmethod
+    def _dot_escape(text):
+        return text.replace('\\', '\\\\').replace('"', '\\"')
+
+    @classmethod
+    def _dot_id(cls, project):
+        ''' Return the DOT node id of 'project' (names are unique in a tree).
+        '''
+        return '"{}"'.format(cls._dot_escape(project.name))
+
+    def _measure(self):
+        ''' Return the (number of leaves, maximum depth) exported. '''
+        leaves = 0; max_depth = 0
+        for project, depth in self.walk():
+            if not self._children(project, depth):
+                leaves += 1
+            max_depth = max(max_depth, depth)
+        return leaves, max_depth
+
+    def write_svg(self, file):
+        ''' Stream the WBS as an SVG tree drawing to 'file' (path or file). '''
+        leaves, max_depth = self._measure()
+        width = 2 * self.MARGIN + leaves * (self.NODE_WIDTH + self.X_GAP) - \
+                self.X_GAP
+        height = 2 * self.MARGIN + (max_depth + 1) * \
+                (self.NODE_HEIGHT + self.Y_GAP) - self.Y_GAP
+
+        out, close = self._open(file)
+        try:
+            out.write('<svg xmlns="http://www.w3.org/2000/svg" '
+                      'width="{0}" height="{1}" viewBox="0 0 {0} {1}" '
+                      'font-family="sans-serif" font-size="11">\n'
+                      '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" '
+                      'refY="5" markerWidth="6" markerHeight="6" '
+                      'orient="auto"><path d="M0,0 L10,5 L0,10 z" '
+                      'fill="#888"/></marker></defs>\n'.format(width, height))
+            self._write_svg_nodes(out)
+            out.write('</svg>\n')
+        finally:
+            if close:
+                out.close()
+
+    def _write_svg_nodes(self, out):
+        ''' Place and write the nodes in post-order, so each parent is centred
+            over its already placed children.
+        '''
+        next_leaf = 0
+        # stack of [project, depth, children iterator, {child name: x}]
+        stack = [[self.root, 0, iter(self._children(self.root, 0)), {}]]
+        while stack:
+            frame = stack[-1]
+            project, depth, children, placed = frame
+            child = next(children, None)
+            if child is not None:
+                grandchildren = self._children(child, depth + 1)
+                stack.append([child, depth + 1, iter(grandchildren), {}])
+                continue
+
+            # all children placed, so place this Project
+            stack.pop()
+            if placed:
+                xs = list(placed.values())
+                x = (min(xs) + max(xs)) / 2
+            else:
+                x = self.MARGIN + next_leaf * (self.NODE_WIDTH + self.X_GAP)
+                next_leaf += 1
+            y = self.MARGIN + depth * (self.NODE_HEIGHT + self.Y_GAP)
+            if placed:
+                self._write_svg_links(out, x, y, placed)
+                self._write_svg_precursors(out, project, y, placed)
+            self._write_svg_node(out, project, depth, x, y)
+            if stack:
+                stack[-1][3][project.name] = x
+
+    def _write_svg_links(self, out, x, y, placed):
+        ''' Write the hierarchy lines from a node at ('x', 'y') down to its
+            'placed' children, as a bus joining them.
+        '''
+        middle = self.NODE_WIDTH / 2
+        bus = y + self.NODE_HEIGHT + self.Y_GAP / 2
+        xs = placed.values()
+        points = ['M{},{} V{}'.format(x + middle, y + self.NODE_HEIGHT, bus),
+                  'M{},{} H{}'.format(min(xs) + middle, bus,
+                                      max(xs) + middle)]
+        child_top = y + self.NODE_HEIGHT + self.Y_GAP
+        points.extend('M{},{} V{}'.format(child_x + middle, bus, child_top)
+                      for child_x in xs)
+        out.write('<path d="{}" stroke="#666" fill="none"/>\n'.format(
+                  ' '.join(points)))
+
+    def _write_svg_precursors(self, out, parent, y, placed):
+        ''' Write dashed precursor arcs between the placed sub-projects of
+            'parent', whose row is below 'y'.
+        '''
+        top = y + self.NODE_HEIGHT + self.Y_GAP
+        for child in parent.sub_projects.values():
+            if child.name not in placed:
+                continue
+            for name in child.precursors:
+                if name not in placed:
+                    continue
+                x0 = placed[name] + self.NODE_WIDTH / 2
+                x1 = placed[child.name] + self.NODE_WIDTH / 2
+                rise = min(abs(x1 - x0) / 4, self.Y_GAP / 2 - 2)
+                out.write('<path d="M{},{} Q{},{} {},{}" stroke="#888" '
+                          'fill="none" stroke-dasharray="4,3" '
+                          'marker-end="url(#arrow)"/>\n'.format(
+                          x0, top, (x0 + x1) / 2, top - 2 * rise, x1, top))
+
+    def _write_svg_node(self, out, project, depth, x, y):
+        ''' Write the box and label of 'project' at ('x', 'y'). '''
+        fill = self.COMPLETE_FILL if project.complete else self.FILL
+        out.write('<g><rect x="{}" y="{}" width="{}" height="{}" rx="5" '
+                  'fill="{}" stroke="#557"/>\n'.format(
+                  x, y, self.NODE_WIDTH, self.NODE_HEIGHT, fill))
+        lines = self._label_lines(project, depth)
+        line_height = self.NODE_HEIGHT / (len(lines) + 1)
+        for index, line in enumerate(lines, 1):
+            out.write('<text x="{}" y="{}" text-anchor="middle"{}>{}</text>\n'
+                      .format(x + self.NODE_WIDTH / 2,
+                              y + index * line_height + 4,
+                              ' font-weight="bold"' if index == 1 else '',
+                              escape(line)))
+        out.write('</g>\n')
+
+
+def main(args):
+    ''' Export a WBS as specified by command line 'args'. '''
+    options = {}
+    if '--hide-complete' in args:
+        args.remove('--hide-complete')
+        options['show_complete'] = False
+    for flag, key, convert in (('--depth', 'max_depth', int),
+                               ('--subtree', 'subtree', str)):
+        if flag in args:
+            index = args.index(flag)
+            options[key] = convert(args[index + 1])
+            del args[index:index + 2]
+    if not args:
+        print(__doc__)
+        return
+
+    from project import Project
+    output = args[0]
+    name = args[1] if len(args) > 1 else '_main'
+    path = args[2] if len(args) > 2 else 'projects'
+    exporter = WBSExporter(Project(name, path=path), **options)
+    if output.endswith('.svg'):
+        exporter.write_svg(output)
+    else:
+        exporter.write_dot(output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+''' Working-calendar aware date and duration arithmetic. '''
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime, date, time, timedelta
+
+
+class WorkingCalendar(object):
+    ''' A calendar of working hours, workdays and holidays.
+
+    Keeps a table of the cumulative working minutes before each day of a range
+        of dates (extended as required), so adding a working duration to a
+        datetime, or measuring the working time between two datetimes, is a
+        table lookup and a bisection rather than a day-by-day loop.
+
+    Durations of a day or more are counted in working days of 'day_hours'
+        each, mirroring how Project stores durations in 'xh' form up to a day,
+        and in 'xd' form beyond that. Shorter durations are working hours.
+
+    A WorkingCalendar can be used as the capacity of a LevelingScheduler, and
+        as the calendar of a ScheduleSimulation.
+
+    e.g.
+        calendar = WorkingCalendar(holidays=[date(2030, 12, 25)])
+        finish = calendar.add(project.due_date, project.duration)
+
+    '''
+    MINUTE = timedelta(minutes=1)
+    DAY = timedelta(days=1)
+    CHUNK = 366 # days to extend the tables by at a time
+    _NO_WORK = ((), (), (), 0)
+
+    def __init__(self, hours=((time(9), time(17)),), workdays=range(5),
+                 holidays=(), day_hours=None):
+        ''' Create a calendar.
+
+        'hours' is a sequence of (start, end) time pairs worked each workday,
+            or a dictionary of weekday (0 is Monday) -> such a sequence, which
+            then also specifies the workdays.
+        'workdays' are the weekdays worked, if 'hours' is not a dictionary.
+        'holidays' are dates not worked.
+        'day_hours' is the hours in a working day, for durations over a day,
+            defaulting to the most hours worked on any weekday.
+
+        Raises a ValueError if no time is ever worked.
+
+        '''
+        if not isinstance(hours, dict):
+            hours = {weekday: hours for weekday in workdays}
+        self._profiles = [self._make_profile(hours.get(weekday, ()))
+                          for weekday in range(7)]
+        weekly = [profile[3] for profile in self._profiles]
+        if not any(weekly):
+            raise ValueError('Calendar has no working time')
+        self.holidays = frozenset(holidays)
+        self.day_hours = day_hours or max(weekly) / 60
+        self._base = None
+
+    @staticmethod
+    def _make_profile(intervals):
+        ''' Return a tuple of (starts, ends, before, total) working minutes.
+
+        'starts' and 'ends' are the minutes of the day each interval starts
+            and ends, 'before' is the working minutes before the end of each
+            interval, and 'total' is the working minutes in the day.
+
+        '''
+        starts = []; ends = []; before = []
+        total = 0
+        for start, end in sorted(intervals):
+            start = start.hour * 60 + start.minute
+            end = end.hour * 60 + end.minute if end != time(0) else 24 * 60
+            if end <= start:
+                continue
+            starts.append(start)
+            ends.append(end)
+            total += end - start
+            before.append(total)
+        return starts, ends, before, total
+
+    def _profile(self, day):
+        if day in self.holidays:
+            return self._NO_WORK
+        return self._profiles[day.weekday()]
+
+    def _build(self, first, last):
+        ''' (Re)build the tables to cover dates 'first' to 'last'. '''
+        self._base = first.toordinal()
+        self._cumulative = [0]
+        self._extend(last)
+
+    def _extend(self, last):
+        ''' Extend the tables forward to cover date 'last'. '''
+        cumulative = self._cumulative
+        day = date.fromordinal(self._base + len(cumulative) - 1)
+        while day <= last:
+            cumulative.append(cumulative[-1] + self._profile(day)[3])
+            day += self.DAY
+
+    def _index(self, day):
+        ''' Return the table index of 'day', extending the tables to cover it.
+        '''
+        if self._base is None:
+            self._build(day, day + timedelta(days=self.CHUNK))
+        elif day.toordinal() < self._base:
+            last = date.fromordinal(self._base + len(self._cumulative) - 2)
+            self._build(day - timedelta(days=self.CHUNK), last)
+        elif day.toordinal() - self._base + 1 >= len(self._cumulative):
+            self._extend(day + timedelta(days=self.CHUNK))
+        return day.toordinal() - self._base
+
+    def _position(self, moment):
+        ''' Return the working minutes from the table base to 'moment'. '''
+        index = self._index(moment.date())
+        starts, ends, before, total = self._profile(moment.date())
+        minute = moment.hour * 60 + moment.minute + \
+                (moment.second + moment.microsecond / 1e6) / 60
+        interval = bisect_right(starts, minute) - 1
+        if interval < 0:
+            return self._cumulative[index]
+        worked = before[interval] - (ends[interval] - min(minute,
+                                                         ends[interval]))
+        return self._cumulative[index] + worked
+
+    def _moment(self, position, earliest=True):
+        ''' Return the datetime at 'position' working minutes from the base.
+
+        Positions at the boundary between working days resolve to the end of
+            the earlier day if 'earliest', otherwise the start of the later.
+
+        Raises a ValueError if 'position' is before the base, as extending the
+            tables backwards moves it (see _offset).
+
+        '''
+        if position < 0:
+            raise ValueError('Position {} is before the base of the tables'
+                             .format(position))
+        cumulative = self._cumulative
+        while position > cumulative[-1] or \
+              (not earliest and position == cumulative[-1]):
+            self._extend(date.fromordinal(self._base + len(cumulative)
+                                          + self.CHUNK))
+        if earliest and position > 0:
+            index = bisect_left(cumulative, position) - 1
+        else:
+            index = bisect_right(cumulative, position) - 1
+        day = date.fromordinal(self._base + index)
+        return self._to_datetime(day, position - cumulative[index])
+
+    def _to_datetime(self, day, minutes):
+        ''' Return the datetime 'minutes' working minutes into 'day'. '''
+        starts, ends, before, total = self._profile(day)
+        if not starts:
+            return datetime.combine(day, time())
+        if minutes <= 0:
+            minute = starts[0]
+        else:
+            interval = min(bisect_left(before, minutes), len(before) - 1)
+            minute = ends[interval] - (before[interval] - minutes)
+        return datetime.combine(day, time()) + minute * self.MINUTE
+
+    def working_duration(self, duration):
+        ''' Return 'duration' in working minutes.
+
+        Durations of a day or more (either way) are working days of
+            'day_hours' each, so a day is 'day_hours' like any longer duration.
+
+        '''
+        if abs(duration) >= self.DAY:
+            return duration / self.DAY * self.day_hours * 60
+        return duration / self.MINUTE
+
+    def _offset(self, moment, minutes, earliest=True):
+        ''' Return the datetime 'minutes' working minutes after 'moment'
+            (before it if negative), as _moment resolves it.
+        '''
+        position = self._position(moment)
+        while position + minutes < 0:
+            # extend the tables backwards, then recompute from the new base
+            self._index(date.fromordinal(self._base - self.CHUNK))
+            position = self._position(moment)
+        return self._moment(position + minutes, earliest)
+
+    def add(self, moment, duration):
+        ''' Return the datetime 'duration' of working time after 'moment'.
+
+        A negative 'duration' is subtracted, as by subtract.
+
+        '''
+        minutes = self.working_duration(duration)
+        return self._offset(moment, minutes, earliest=minutes >= 0)
+
+    def add_hours(self, moment, hours):
+        ''' Return the datetime 'hours' working hours after 'moment'. '''
+        return self._offset(moment, hours * 60, earliest=hours >= 0)
+
+    def subtract(self, moment, duration):
+        ''' Return the latest datetime 'duration' of working time before
+            'moment', e.g. the latest start to finish by a due date.
+        '''
+        return self._offset(moment, -self.working_duration(duration),
+                            earliest=False)
+
+    def between(self, start, end):
+        ''' Return the working time from 'start' to 'end' as a timedelta.
+
+        Negative if 'end' is before 'start'.
+
+        '''
+        # cover both first, as extending the tables backwards moves the base
+        self._index(min(start, end).date())
+        self._index(max(start, end).date())
+        return (self._position(end) - self._position(start)) * self.MINUTE
+
+    def is_working(self, moment):
+        ''' Return True if 'moment' is within working hours. '''
+        starts, ends, before, total = self._profile(moment.date())
+        minute = moment.hour * 60 + moment.minute
+        interval = bisect_right(starts, minute) - 1
+        return interval >= 0 and minute < ends[interval]
+
+    # LevelingScheduler capacity interface
+    def hours(self, day):
+        ''' Return the working hours on 'day'. '''
+        return self._profile(day)[3] / 60
+
+    def to_datetime(self, day, offset):
+        ''' Return the datetime 'offset' working hours into 'day'. '''
+        return self._to_datetime(day, offset * 60)
+
+    def work_hours(self, duration):
+        ''' Return the working hours of work 'duration' represents. '''
+        return self.working_duration(duration) / 60